@@ -1,9 +1,19 @@
 from sdk.moveapps_spec import hook_impl
-from movingpandas import TrajectoryCollection
+from sdk.moveapps_track_index import TRACK_INDEX_FILE, TrackIndexCollector
+from typing import TYPE_CHECKING
 import logging
 import time
 
-from app.parallel import calculate_distance, parallelize
+from app.geodesic import DEFAULT_DISTANCE_METHOD, check_distance_method
+from app.parallel import distance_function, distance_method_kernel, parallelize, parallelize_cached
+from app.movement_metrics import COLUMN_METADATA_KEY, DEFAULT_METRICS, METRIC_COLUMNS, column_metadata, \
+    metrics_function, metrics_kernel, parse_metrics
+from app.result_cache import TrackResultCache
+from app.track_index import build_track_index, write_track_index
+from app.tracks import rebuild_collection, track_view
+
+if TYPE_CHECKING:
+    from movingpandas import TrajectoryCollection
 
 
 class App(object):
@@ -12,7 +22,7 @@ class App(object):
         self.moveapps_io = moveapps_io
 
     @hook_impl
-    def execute(self, data: TrajectoryCollection, config: dict) -> TrajectoryCollection:
+    def execute(self, data: 'TrajectoryCollection', config: dict) -> 'TrajectoryCollection':
         """
         Execute the App code
         :param data: input data
@@ -26,31 +36,68 @@ class App(object):
 
         logging.info('Check if parallel computing in Python works in MoveApps')
 
-        # transfer the data to a GeoDataFrame
-        data_gdf = data.to_point_gdf()
-
-        # get all different track IDs
-        track_id_col_name = data.get_traj_id_col()
-        track_ids = data_gdf[track_id_col_name].unique()
-        logging.info(f'Track IDs discovered: {track_ids}')
+        # transfer the data to a GeoDataFrame split by track once; parallelize and the result share this view
+        split = track_view(data)
+        logging.info(f'Track IDs discovered: {split.track_ids}')
 
         # calculate the distances between consecutive locations per individual using parallel computing
         start_par = time.time()
         logging.info('Calculating distances using parallel computing')
-        result_par = parallelize(data, calculate_distance)
+        transport = config.get('transport') or 'pickle'
+        metrics = parse_metrics(config.get('movement-metrics'))
+        distance_method = check_distance_method(config.get('distance-method'))
+        logging.info(f'Distance method: {distance_method}')
+        if metrics == DEFAULT_METRICS:
+            func = distance_method_kernel(distance_method) if transport == 'shared_memory' \
+                else distance_function(distance_method)
+        else:
+            # all segment metrics in one pass over each track, while the track is in the worker anyway
+            logging.info(f'Calculating movement metrics {list(metrics)}')
+            func = metrics_kernel(metrics, distance_method) if transport == 'shared_memory' \
+                else metrics_function(metrics, distance_method)
+        # a track that fails or exceeds the timeout is left out of the result and listed in the artifact failures.json
+        options = dict(split=split, cpu_limit=config.get('cpu-limit'), transport=transport,
+                       backend=config.get('backend') or 'processes', timeout=config.get('track-timeout'),
+                       retries=config.get('track-retries') or 0)
+        # with a result cache (env variable `RESULT_CACHE_DIR`) only the locations added since the last run are computed
+        namespace = '-'.join(metrics) if distance_method == DEFAULT_DISTANCE_METHOD \
+            else f'{"-".join(metrics)}-{distance_method}'
+        cache = TrackResultCache.from_env(namespace=namespace)
+        if cache is not None:
+            # the columns written by the function (also if the input has them already, e.g. an earlier output)
+            columns = ('x', 'y') + tuple(METRIC_COLUMNS[metric] for metric in metrics)
+            result_par = parallelize_cached(data, func, cache, columns=columns, **options)
+        else:
+            result_par = parallelize(data, func, **options)
         time_par = time.time() - start_par
         logging.info(f'Time used for calculating distances using parallel computing: {time_par}')
-
-        # translate the result back to a TrajectoryCollection
         if result_par is not None:
+            # unit and distance method of the added columns, kept by the trajectories and in columnar outputs
+            result_par.attrs = {**result_par.attrs, COLUMN_METADATA_KEY: column_metadata(metrics, distance_method)}
+
+        # translate the result back to a TrajectoryCollection, reusing the track offsets of the split and the
+        # trajectories of the input
+        if result_par is not None and len(result_par) == split.offsets[-1]:
+            result = rebuild_collection(result_par, split, source=data)
+        elif result_par is not None:
+            from movingpandas import TrajectoryCollection
             result = TrajectoryCollection(
                 result_par,
-                traj_id_col=data.get_traj_id_col(),
-                t=data.to_point_gdf().index.name,
-                crs=data.get_crs()
+                traj_id_col=split.track_id_col,
+                t=split.t,
+                crs=split.crs
             )
         else:
             result = None
 
+        # per-track row offsets, time range, bounding box and distance summary: later steps select tracks without
+        # scanning the point data. The view of the result is already known after the fast rebuild.
+        if result is not None and config.get('track-index', True):
+            distance_column = METRIC_COLUMNS['distance'] if 'distance' in metrics else None
+            result.track_index = build_track_index(track_view(result), distance_column)
+            # a streaming run calls the App per batch and writes the index of all batches at its end
+            if TrackIndexCollector.current() is None:
+                write_track_index(result.track_index, self.moveapps_io.create_artifacts_file(TRACK_INDEX_FILE))
+
         # return some useful data for next apps in the workflow
         return result
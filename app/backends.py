@@ -0,0 +1,190 @@
+import logging
+import os
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+from sdk.moveapps_broker import BrokerPool
+from sdk.moveapps_pool import MoveAppsPool
+from app.shared_transport import ArrayKernel
+
+# worker time per row assumed for functions that have not been measured yet
+DEFAULT_ROW_COST = 1e-5
+# seconds it takes to start worker processes and to send them the tracks
+PROCESS_OVERHEAD = 0.5
+# below this amount of work (in seconds) handing tracks to other threads does not pay off
+THREAD_OVERHEAD = 0.01
+
+# measured worker time per row, by function; updated after every run
+_row_costs = {}
+
+
+class ExecutionBackend:
+    """
+    Runs the work units of `parallelize`.
+    `pool(n_budget, n_cpu, timeout)` provides an object with an `imap_unordered(function, tasks)` method.
+    """
+    name = None
+    # whether the tasks run in the parent process (and therefore share its memory)
+    in_process = True
+    # whether the tasks may run on other hosts (and therefore can not use shared memory)
+    remote = False
+
+    # whether tasks that exceed a timeout can be stopped (see `restart`)
+    supports_timeout = False
+    # whether the pool stops tasks that exceed the timeout given to `pool` itself, instead of `restart`
+    pool_timeout = False
+
+    @contextmanager
+    def pool(self, n_budget: int, n_cpu: int, timeout: float | None = None):
+        """
+        :param timeout: seconds a task may run, only used by backends with `pool_timeout`
+        """
+        raise NotImplementedError
+
+    def restart(self):
+        """
+        Stops all running tasks of the pool provided by `pool`
+        :return: a new pool to use instead
+        """
+        raise NotImplementedError(f'Tasks of the {self.name} backend can not be stopped')
+
+
+class _SerialPool:
+
+    @staticmethod
+    def imap_unordered(function, tasks):
+        return map(function, tasks)
+
+
+class SerialBackend(ExecutionBackend):
+    """Runs all work units one after the other in the parent process"""
+    name = 'serial'
+
+    @contextmanager
+    def pool(self, n_budget: int, n_cpu: int, timeout: float | None = None):
+        yield _SerialPool()
+
+
+class ThreadBackend(ExecutionBackend):
+    """Runs the work units in a thread pool; suits kernels that release the GIL (e.g. NumPy)"""
+    name = 'threads'
+
+    @contextmanager
+    def pool(self, n_budget: int, n_cpu: int, timeout: float | None = None):
+        pool = ThreadPool(n_cpu)
+        try:
+            yield pool
+        finally:
+            pool.close()
+            pool.join()
+
+
+class ProcessBackend(ExecutionBackend):
+    """Runs the work units in worker processes"""
+    name = 'processes'
+    in_process = False
+    supports_timeout = True
+
+    @contextmanager
+    def pool(self, n_budget: int, n_cpu: int, timeout: float | None = None):
+        # the pool of the current app run is sized to the CPU budget, so it can be reused by every stage;
+        # without an app run the pool only lives for this call
+        managed = MoveAppsPool.current()
+        if managed is not None:
+            yield managed.get(n_budget)
+            return
+        with MoveAppsPool() as managed:
+            yield managed.get(n_cpu)
+
+    def restart(self):
+        return MoveAppsPool.current().restart()
+
+
+class DistributedBackend(ExecutionBackend):
+    """
+    Runs the work units on worker processes that pull them from a broker, also on other hosts (see `BrokerPool`).
+    The local workers (env variable `BROKER_LOCAL_WORKERS`, default: the number of CPUs used) are started with the
+    broker; with none, the run waits for remote workers. The broker hands tasks that exceed the timeout to another
+    worker and gives them up after its retries.
+    """
+    name = 'distributed'
+    in_process = False
+    remote = True
+    supports_timeout = True
+    pool_timeout = True
+
+    @contextmanager
+    def pool(self, n_budget: int, n_cpu: int, timeout: float | None = None):
+        local_workers = int(os.environ.get('BROKER_LOCAL_WORKERS', n_cpu))
+        with BrokerPool(local_workers=local_workers, task_timeout=timeout) as pool:
+            yield pool
+
+
+BACKENDS = {backend.name: backend for backend in (SerialBackend(), ThreadBackend(), ProcessBackend(),
+                                                    DistributedBackend())}
+
+
+def _cost_key(func) -> str:
+    # unwrap ArrayKernel and functools.partial (also nested)
+    while hasattr(func, 'func'):
+        func = func.func
+    return f'{getattr(func, "__module__", "")}.{getattr(func, "__qualname__", repr(func))}'
+
+
+def estimate_row_cost(func) -> float:
+    """
+    :return: the measured worker time per row of the function in seconds (or a default if not measured yet)
+    """
+    return _row_costs.get(_cost_key(func), DEFAULT_ROW_COST)
+
+
+def record_row_cost(func, rows: int, worker_seconds: float):
+    """
+    Updates the measured worker time per row of the function
+    :param func: the function that has been run
+    :param rows: number of rows processed
+    :param worker_seconds: time spent by all workers together
+    """
+    if rows <= 0:
+        return
+    key = _cost_key(func)
+    measured = worker_seconds / rows
+    _row_costs[key] = measured if key not in _row_costs else (_row_costs[key] + measured) / 2
+
+
+def choose_backend(func, rows: int, tracks: int, n_budget: int) -> ExecutionBackend:
+    """
+    Picks a backend from the expected amount of work
+    :param func: the function that will be run
+    :param rows: number of rows in total
+    :param tracks: number of tracks
+    :param n_budget: number of CPUs available
+    :return: serial if there is nothing to parallelize or too little work to pay for the overhead,
+        threads for array kernels, processes otherwise
+    """
+    work = rows * estimate_row_cost(func)
+    if n_budget == 1 or tracks == 1 or work < THREAD_OVERHEAD:
+        return BACKENDS['serial']
+    if isinstance(func, ArrayKernel):
+        return BACKENDS['threads']
+    if work > PROCESS_OVERHEAD:
+        return BACKENDS['processes']
+    return BACKENDS['serial']
+
+
+def get_backend(backend, func, rows: int, tracks: int, n_budget: int) -> ExecutionBackend:
+    """
+    :param backend: an ExecutionBackend or the name of one: 'serial', 'threads', 'processes', 'distributed' or
+        'auto'
+    :return: the backend to use
+    """
+    if isinstance(backend, ExecutionBackend):
+        return backend
+    if backend == 'auto':
+        chosen = choose_backend(func, rows, tracks, n_budget)
+        logging.info(f'Execution backend \'{chosen.name}\' chosen for {rows} rows in {tracks} tracks '
+                     f'({estimate_row_cost(func):.2e} s per row)')
+        return chosen
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown execution backend \'{backend}\', expected one of {list(BACKENDS)} or \'auto\'')
+    return BACKENDS[backend]
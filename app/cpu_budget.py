@@ -0,0 +1,120 @@
+import logging
+import math
+import multiprocessing as mp
+import os
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+
+def _read_file(path: str) -> str | None:
+    try:
+        with open(path) as fp:
+            return fp.read().strip()
+    except (OSError, ValueError):
+        return None
+
+
+def _quota_to_cpus(quota: int, period: int) -> int | None:
+    # a quota of -1 (cgroup v1) or 'max' (cgroup v2) means unlimited
+    if quota <= 0 or period <= 0:
+        return None
+    return max(1, math.floor(quota / period))
+
+
+def _own_cgroup_v2_path(cgroup_root: str) -> str | None:
+    """
+    :return: directory of the cgroup v2 of this process (e.g. `/sys/fs/cgroup/kubepods/pod-x`), if any
+    """
+    content = _read_file('/proc/self/cgroup')
+    if content is None:
+        return None
+    for line in content.splitlines():
+        if line.startswith('0::'):
+            return os.path.join(cgroup_root, line[3:].lstrip('/'))
+    return None
+
+
+def read_cgroup_v2_limit(cgroup_root: str = CGROUP_ROOT) -> int | None:
+    """
+    :param cgroup_root: mount point of the cgroup file system
+    :return: number of CPUs allowed by the cgroup v2 `cpu.max` quota or `None` if there is no quota
+    """
+    candidates = [_own_cgroup_v2_path(cgroup_root), cgroup_root]
+    for directory in [candidate for candidate in candidates if candidate]:
+        content = _read_file(os.path.join(directory, 'cpu.max'))
+        if content is None:
+            continue
+        fields = content.split()
+        if len(fields) != 2 or fields[0] == 'max':
+            return None
+        try:
+            return _quota_to_cpus(int(fields[0]), int(fields[1]))
+        except ValueError:
+            return None
+    return None
+
+
+def read_cgroup_v1_limit(cgroup_root: str = CGROUP_ROOT) -> int | None:
+    """
+    From https://donghao.org/2022/01/20/how-to-get-the-number-of-cpu-cores-inside-a-container/
+    :param cgroup_root: mount point of the cgroup file system
+    :return: number of CPUs allowed by the cgroup v1 CFS quota or `None` if there is no quota
+    """
+    for controller in ('cpu', 'cpu,cpuacct'):
+        quota = _read_file(os.path.join(cgroup_root, controller, 'cpu.cfs_quota_us'))
+        period = _read_file(os.path.join(cgroup_root, controller, 'cpu.cfs_period_us'))
+        if quota is None or period is None:
+            continue
+        try:
+            return _quota_to_cpus(int(quota), int(period))
+        except ValueError:
+            return None
+    return None
+
+
+def read_affinity_limit() -> int | None:
+    """
+    :return: number of CPUs this process may be scheduled on (cpuset) or `None` if the platform does not tell
+    """
+    if not hasattr(os, 'sched_getaffinity'):
+        return None
+    return len(os.sched_getaffinity(0)) or None
+
+
+def read_override_limit(override=None) -> int | None:
+    """
+    :param override: CPU limit from the app configuration
+    :return: the configured CPU limit (app configuration first, then env variable `CPU_LIMIT`) or `None`
+    """
+    for value in (override, os.environ.get('CPU_LIMIT')):
+        if value is None or value == '':
+            continue
+        try:
+            limit = int(value)
+        except (TypeError, ValueError):
+            logging.warning(f'Ignoring invalid CPU limit \'{value}\'')
+            continue
+        if limit > 0:
+            return limit
+    return None
+
+
+def get_cpu_budget(override=None, cgroup_root: str = CGROUP_ROOT) -> int:
+    """
+    Determines the number of CPUs this process may use inside its container: the minimum of the host CPU count,
+    the cgroup v2 and v1 CPU quotas, the CPU affinity (cpuset) and a configured override
+    :param override: CPU limit from the app configuration (optional)
+    :param cgroup_root: mount point of the cgroup file system
+    :return: number of CPUs available for parallel processing (at least 1)
+    """
+    limits = {
+        'cpu_count': mp.cpu_count(),
+        'cgroup v2 cpu.max': read_cgroup_v2_limit(cgroup_root),
+        'cgroup v1 cfs quota': read_cgroup_v1_limit(cgroup_root),
+        'cpu affinity': read_affinity_limit(),
+        'override': read_override_limit(override),
+    }
+    found = {source: limit for source, limit in limits.items() if limit is not None}
+    budget = max(1, min(found.values()))
+    logging.info(f'CPU budget: {budget} (limits found: {found})')
+    return budget
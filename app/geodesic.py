@@ -0,0 +1,206 @@
+import numpy as np
+
+# WGS84 ellipsoid (the default ellipsoid of geopy.distance.geodesic)
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+
+# Vincenty's inverse solution agrees with Karney's algorithm (used by geopy) to well below a millimetre for all
+# point pairs it converges on. Nearly antipodal pairs do not converge and are delegated to geographiclib (Karney's
+# algorithm, which geopy uses as well).
+GEODESIC_TOLERANCE_KM = 1e-6
+
+# radius of the sphere of the approximations: mean radius of the WGS84 ellipsoid (IUGG R1)
+MEAN_EARTH_RADIUS_KM = 6371.0088
+
+DEFAULT_DISTANCE_METHOD = 'ellipsoidal'
+# worst-case error of each distance method versus the ellipsoidal geodesic (checked in the unit tests)
+DISTANCE_ERROR_BOUNDS = {
+    'ellipsoidal': f'reference, within {GEODESIC_TOLERANCE_KM * 1e6:g} mm of geopy.distance.geodesic',
+    # the sphere is up to 0.56 % too small along the meridians and too large along the equator
+    'haversine': 'within 0.57 % of the ellipsoidal distance',
+    # a plane at the mean latitude: good for short segments, increasingly wrong for long segments and near the poles
+    'equirectangular': 'within 0.57 % of the ellipsoidal distance for segments up to 100 km between latitudes -85 '
+                       'and 85 degrees; larger for longer segments and closer to the poles',
+}
+
+_MAX_ITERATIONS = 200
+_CONVERGENCE_THRESHOLD = 1e-12
+
+
+def _vincenty_inverse(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray):
+    """
+    Solves the inverse geodesic problem on the WGS84 ellipsoid for arrays of point pairs (Vincenty, 1975)
+    :param lat1: latitudes of the start points in degrees
+    :param lon1: longitudes of the start points in degrees
+    :param lat2: latitudes of the end points in degrees
+    :param lon2: longitudes of the end points in degrees
+    :return: distances in metres, initial bearings in radians and a boolean mask of the pairs that did not converge
+    """
+    u1 = np.arctan((1 - WGS84_F) * np.tan(np.radians(lat1)))
+    u2 = np.arctan((1 - WGS84_F) * np.tan(np.radians(lat2)))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+    big_l = np.radians(lon2 - lon1)
+
+    n = len(big_l)
+    lam = big_l.copy()
+    sin_sigma = np.zeros(n)
+    cos_sigma = np.ones(n)
+    sigma = np.zeros(n)
+    cos_sq_alpha = np.ones(n)
+    cos_2sigma_m = np.zeros(n)
+
+    # only keep iterating on the pairs that have not converged yet
+    active = np.isfinite(lam) & np.isfinite(u1) & np.isfinite(u2)
+    for _ in range(_MAX_ITERATIONS):
+        idx = np.flatnonzero(active)
+        if len(idx) == 0:
+            break
+        sin_lam, cos_lam = np.sin(lam[idx]), np.cos(lam[idx])
+        a_cu1, a_su1, a_cu2, a_su2 = cos_u1[idx], sin_u1[idx], cos_u2[idx], sin_u2[idx]
+
+        s_sigma = np.hypot(a_cu2 * sin_lam, a_cu1 * a_su2 - a_su1 * a_cu2 * cos_lam)
+        c_sigma = a_su1 * a_su2 + a_cu1 * a_cu2 * cos_lam
+        sig = np.arctan2(s_sigma, c_sigma)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sin_alpha = np.where(s_sigma == 0, 0.0, a_cu1 * a_cu2 * sin_lam / s_sigma)
+            c_sq_alpha = 1 - sin_alpha ** 2
+            # equatorial lines have cos^2(alpha) == 0
+            c_2sigma_m = np.where(c_sq_alpha == 0, 0.0, c_sigma - 2 * a_su1 * a_su2 / c_sq_alpha)
+        c = WGS84_F / 16 * c_sq_alpha * (4 + WGS84_F * (4 - 3 * c_sq_alpha))
+        lam_prev = lam[idx]
+        lam_next = big_l[idx] + (1 - c) * WGS84_F * sin_alpha * (
+            sig + c * s_sigma * (c_2sigma_m + c * c_sigma * (-1 + 2 * c_2sigma_m ** 2))
+        )
+
+        lam[idx] = lam_next
+        sin_sigma[idx] = s_sigma
+        cos_sigma[idx] = c_sigma
+        sigma[idx] = sig
+        cos_sq_alpha[idx] = c_sq_alpha
+        cos_2sigma_m[idx] = c_2sigma_m
+        active[idx] = np.abs(lam_next - lam_prev) > _CONVERGENCE_THRESHOLD
+
+    u_sq = cos_sq_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (cos_2sigma_m + big_b / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+        - big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+    ))
+    distances = WGS84_B * big_a * (sigma - delta_sigma)
+
+    sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+    azimuths = np.arctan2(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+
+    finite = np.isfinite(lat1) & np.isfinite(lon1) & np.isfinite(lat2) & np.isfinite(lon2)
+    distances[~finite] = np.nan
+    azimuths[~finite] = np.nan
+    return distances, azimuths, active
+
+
+def geodesic_inverse(lat1, lon1, lat2, lon2) -> tuple:
+    """
+    Calculates the geodesic distance and the initial bearing between pairs of locations on the WGS84 ellipsoid
+    :param lat1: latitudes of the start points in degrees
+    :param lon1: longitudes of the start points in degrees
+    :param lat2: latitudes of the end points in degrees
+    :param lon2: longitudes of the end points in degrees
+    :return: distances in km (float64), within GEODESIC_TOLERANCE_KM of geopy.distance.geodesic, and initial bearings
+        in degrees clockwise from north in [0, 360) (float64, NaN for identical locations)
+    """
+    lat1, lon1, lat2, lon2 = (np.asarray(a, dtype=np.float64) for a in (lat1, lon1, lat2, lon2))
+    distances, azimuths, unconverged = _vincenty_inverse(lat1, lon1, lat2, lon2)
+    distances = distances / 1000
+    bearings = np.degrees(azimuths) % 360
+    bearings[distances == 0] = np.nan
+
+    # nearly antipodal pairs: fall back to Karney's algorithm
+    if unconverged.any():
+        from geographiclib.geodesic import Geodesic
+    for i in np.flatnonzero(unconverged):
+        solution = Geodesic.WGS84.Inverse(lat1[i], lon1[i], lat2[i], lon2[i])
+        distances[i] = solution['s12'] / 1000
+        bearings[i] = solution['azi1'] % 360
+
+    return distances, bearings
+
+
+def geodesic_distance(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Calculates the geodesic distance between pairs of locations on the WGS84 ellipsoid
+    :param lat1: latitudes of the start points in degrees
+    :param lon1: longitudes of the start points in degrees
+    :param lat2: latitudes of the end points in degrees
+    :param lon2: longitudes of the end points in degrees
+    :return: distances in km (float64), within GEODESIC_TOLERANCE_KM of geopy.distance.geodesic
+    """
+    return geodesic_inverse(lat1, lon1, lat2, lon2)[0]
+
+
+def haversine_distance(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Calculates the great-circle distance between pairs of locations on a sphere with the mean radius of the earth
+    :param lat1: latitudes of the start points in degrees
+    :param lon1: longitudes of the start points in degrees
+    :param lat2: latitudes of the end points in degrees
+    :param lon2: longitudes of the end points in degrees
+    :return: distances in km (float64), see DISTANCE_ERROR_BOUNDS
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * MEAN_EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def equirectangular_distance(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Calculates the distance between pairs of locations in the equirectangular projection at their mean latitude
+    (flat-earth approximation)
+    :param lat1: latitudes of the start points in degrees
+    :param lon1: longitudes of the start points in degrees
+    :param lat2: latitudes of the end points in degrees
+    :param lon2: longitudes of the end points in degrees
+    :return: distances in km (float64), see DISTANCE_ERROR_BOUNDS
+    """
+    lat1, lon1, lat2, lon2 = (np.asarray(a, dtype=np.float64) for a in (lat1, lon1, lat2, lon2))
+    # the shorter way around, also across the antimeridian
+    delta_lon = np.radians((lon2 - lon1 + 180) % 360 - 180)
+    x = delta_lon * np.cos(np.radians((lat1 + lat2) / 2))
+    y = np.radians(lat2 - lat1)
+    return MEAN_EARTH_RADIUS_KM * np.hypot(x, y)
+
+
+DISTANCE_METHODS = {
+    'ellipsoidal': geodesic_distance,
+    'haversine': haversine_distance,
+    'equirectangular': equirectangular_distance,
+}
+
+
+def check_distance_method(method: str | None) -> str:
+    """
+    :param method: name of a distance method (see DISTANCE_METHODS); `None` or empty for the default
+    :return: the name of the method
+    """
+    if not method:
+        return DEFAULT_DISTANCE_METHOD
+    if method not in DISTANCE_METHODS:
+        raise ValueError(f'Unknown distance method {method!r}, expected one of {list(DISTANCE_METHODS)}')
+    return method
+
+
+def distance_from_previous(lat, lon, method: str = DEFAULT_DISTANCE_METHOD) -> np.ndarray:
+    """
+    Calculates the distance between each location of a track and the previous location
+    :param lat: latitudes of the track in degrees
+    :param lon: longitudes of the track in degrees
+    :param method: how the distance is calculated, see DISTANCE_METHODS and DISTANCE_ERROR_BOUNDS
+    :return: distances in km (float64); the first element is NaN as it has no previous location
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    result = np.full(len(lat), np.nan)
+    if len(lat) > 1:
+        result[1:] = DISTANCE_METHODS[method](lat[:-1], lon[:-1], lat[1:], lon[1:])
+    return result
@@ -0,0 +1,135 @@
+import functools
+from typing import TYPE_CHECKING
+import numpy as np
+
+from app.geodesic import DEFAULT_DISTANCE_METHOD, DISTANCE_ERROR_BOUNDS, DISTANCE_METHODS, geodesic_inverse
+from app.shared_transport import ArrayKernel
+
+if TYPE_CHECKING:
+    from geopandas.geodataframe import GeoDataFrame
+
+# per-segment metrics (between each location and the previous location of the track) and their columns
+METRIC_COLUMNS = {
+    'distance': 'distance_from_previous_geopy',  # km
+    'time_delta': 'time_from_previous_s',  # seconds
+    'speed': 'speed_from_previous_kmh',  # km/h
+    'bearing': 'bearing_from_previous_deg',  # degrees clockwise from north, [0, 360)
+}
+METRIC_UNITS = {
+    'distance': 'km',
+    'time_delta': 's',
+    'speed': 'km/h',
+    'bearing': 'degrees',
+}
+DEFAULT_METRICS = ('distance',)
+
+# key of the per-column metadata (unit, distance method) in the `attrs` of the result data
+COLUMN_METADATA_KEY = 'column_metadata'
+
+
+def parse_metrics(metrics) -> tuple:
+    """
+    :param metrics: comma separated string or list of metric names (see METRIC_COLUMNS); `None` or empty for the default
+    :return: the metrics as tuple, in the order of METRIC_COLUMNS
+    """
+    if isinstance(metrics, str):
+        metrics = [metric.strip() for metric in metrics.split(',') if metric.strip()]
+    if not metrics:
+        return DEFAULT_METRICS
+    unknown = [metric for metric in metrics if metric not in METRIC_COLUMNS]
+    if unknown:
+        raise ValueError(f'Unknown movement metrics {unknown}, expected some of {list(METRIC_COLUMNS)}')
+    return tuple(metric for metric in METRIC_COLUMNS if metric in metrics)
+
+
+def movement_metrics(x: np.ndarray, y: np.ndarray, t: np.ndarray, metrics: tuple = DEFAULT_METRICS,
+                     distance_method: str = DEFAULT_DISTANCE_METHOD) -> dict:
+    """
+    Calculates the segment metrics of one track in a single pass over its arrays
+    :param x: longitudes in degrees
+    :param y: latitudes in degrees
+    :param t: timestamps in int64 nanoseconds
+    :param metrics: names of the metrics to calculate (see METRIC_COLUMNS)
+    :param distance_method: how distance and speed are calculated, see `app.geodesic.DISTANCE_METHODS`;
+        the bearing is always the one of the ellipsoidal geodesic
+    :return: one float64 array per column: `x`, `y` and the columns of the metrics; the first element of each metric
+        is NaN as the first location has no previous location
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    result = {'x': x, 'y': y}
+    values = {metric: np.full(n, np.nan) for metric in metrics}
+    if n > 1:
+        needs_distance = 'distance' in values or 'speed' in values
+        if 'bearing' in values or (needs_distance and distance_method == DEFAULT_DISTANCE_METHOD):
+            # distance and bearing come out of the same geodesic solution
+            distances, bearings = geodesic_inverse(y[:-1], x[:-1], y[1:], x[1:])
+        if needs_distance and distance_method != DEFAULT_DISTANCE_METHOD:
+            distances = DISTANCE_METHODS[distance_method](y[:-1], x[:-1], y[1:], x[1:])
+        if 'time_delta' in values or 'speed' in values:
+            seconds = np.diff(np.asarray(t, dtype=np.int64)) / 1e9
+        if 'distance' in values:
+            values['distance'][1:] = distances
+        if 'time_delta' in values:
+            values['time_delta'][1:] = seconds
+        if 'speed' in values:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values['speed'][1:] = np.where(seconds > 0, distances / (seconds / 3600), np.nan)
+        if 'bearing' in values:
+            values['bearing'][1:] = bearings
+    for metric in metrics:
+        result[METRIC_COLUMNS[metric]] = values[metric]
+    return result
+
+
+def metrics_kernel(metrics: tuple = DEFAULT_METRICS, distance_method: str = DEFAULT_DISTANCE_METHOD) -> ArrayKernel:
+    """
+    :return: the fused kernel of the given metrics for the shared memory transport
+    """
+    return ArrayKernel(
+        func=functools.partial(movement_metrics, metrics=metrics, distance_method=distance_method),
+        columns=('x', 'y') + tuple(METRIC_COLUMNS[metric] for metric in metrics)
+    )
+
+
+def calculate_movement_metrics(data: 'GeoDataFrame', metrics: tuple = DEFAULT_METRICS,
+                               distance_method: str = DEFAULT_DISTANCE_METHOD) -> 'GeoDataFrame':
+    """
+    Calculates the segment metrics between each location and the previous location of a track
+    :param data: the GeoDataFrame of one track
+    :param metrics: names of the metrics to calculate (see METRIC_COLUMNS)
+    :param distance_method: see `movement_metrics`
+    :return: input data with the columns `x`, `y` and one float64 column per metric
+    """
+    if data.crs is not None and not data.crs.is_geographic:
+        raise ValueError(f'Movement metrics can only be calculated for geographic coordinates, got CRS {data.crs}')
+    coordinates = data.get_coordinates(include_z=False)
+    times = np.asarray(data.index.values).astype('datetime64[ns]').view(np.int64)
+    columns = movement_metrics(coordinates['x'].to_numpy(), coordinates['y'].to_numpy(), times, metrics,
+                               distance_method)
+    for column, values in columns.items():
+        data[column] = values
+    return data
+
+
+def metrics_function(metrics: tuple = DEFAULT_METRICS, distance_method: str = DEFAULT_DISTANCE_METHOD):
+    """
+    :return: `calculate_movement_metrics` for the given metrics, as picklable function of a track's GeoDataFrame
+    """
+    return functools.partial(calculate_movement_metrics, metrics=metrics, distance_method=distance_method)
+
+
+def column_metadata(metrics: tuple = DEFAULT_METRICS, distance_method: str = DEFAULT_DISTANCE_METHOD) -> dict:
+    """
+    :return: unit of each metric column, for distance and speed also the distance method and its error bound
+    """
+    metadata = {}
+    for metric in metrics:
+        metadata[METRIC_COLUMNS[metric]] = {'unit': METRIC_UNITS[metric]}
+        if metric in ('distance', 'speed'):
+            metadata[METRIC_COLUMNS[metric]].update(
+                distance_method=distance_method,
+                error_bound=DISTANCE_ERROR_BOUNDS[distance_method]
+            )
+    return metadata
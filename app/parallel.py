@@ -1,97 +1,473 @@
-import pandas as pd
-from geopandas.geodataframe import GeoDataFrame
-from movingpandas import TrajectoryCollection
+import functools
+import numpy as np
 import logging
+import os
+import tempfile
 import time
-import geopy.distance
-import multiprocessing as mp
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
+from sdk.moveapps_broker import TaskFailure
+from sdk.moveapps_failures import FailureManifest
+from sdk.moveapps_formats import read_point_rows, write_point_rows
+from sdk.moveapps_instrumentation import Instrumentation, task_metrics
+from sdk.moveapps_logging import log_task
+from app.backends import ExecutionBackend, get_backend, record_row_cost
+from app.cpu_budget import get_cpu_budget
+from app.geodesic import DEFAULT_DISTANCE_METHOD, distance_from_previous
+from app.result_cache import TrackResultCache
+from app.scheduling import pack_work_units, UNITS_PER_CPU
+from app.shared_transport import ArrayKernel, FileTrackArrays, SharedTrackArrays, SlicedTrackArrays, TrackArrays
+from app.supervision import call_with_retries, run_supervised
+from app.tracks import TrackSplit, track_view
 
-
-def get_cpu_limit() -> int:
-    """
-    From https://donghao.org/2022/01/20/how-to-get-the-number-of-cpu-cores-inside-a-container/
-    :return: number of CPUs that is available in the docker container
-    """
-    with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as fp:
-        cfs_quota_us = int(fp.read())
-    with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as fp:
-        cfs_period_us = int(fp.read())
-    container_cpus = cfs_quota_us // cfs_period_us
-    # For physical machine, the `cfs_quota_us` could be '-1'
-    cpus = mp.cpu_count() if container_cpus < 1 else container_cpus
-    return cpus
+# pandas, geopandas and movingpandas are only imported where needed: workers running array kernels get by with numpy
+if TYPE_CHECKING:
+    from geopandas.geodataframe import GeoDataFrame
+    from movingpandas import TrajectoryCollection
 
 
-def calculate_distance(data: GeoDataFrame) -> GeoDataFrame:
+def calculate_distance(data: 'GeoDataFrame', method: str = DEFAULT_DISTANCE_METHOD) -> 'GeoDataFrame':
     """
     Calculates the distance between each location and the previous location
     :param data: a GeoDataFrame
+    :param method: how the distance is calculated, see `app.geodesic.DISTANCE_METHODS`
     :return: input data with distances in km
     """
-    mp.log_to_stderr(logging.INFO)
-
-    data.set_crs('epsg:4326')
-    data["x"] = data.get_coordinates(include_z=False)["x"]
-    data["y"] = data.get_coordinates(include_z=False)["y"]
+    if data.crs is not None and not data.crs.is_geographic:
+        raise ValueError(f'Distances can only be calculated for geographic coordinates, got CRS {data.crs}')
+    coordinates = data.get_coordinates(include_z=False)
+    data["x"] = coordinates["x"].to_numpy()
+    data["y"] = coordinates["y"].to_numpy()
 
     logging.info("Calculating distances")
 
-    # calculate the distance between the locations for each row in the data
-    distances = [None] * (len(data) - 1)
-    for row in range(len(data) - 1):
-        distances[row] = geopy.distance.distance((data["y"].iloc()[row], data["x"].iloc()[row]),
-                                                 (data["y"].iloc()[row + 1], data["x"].iloc()[row + 1])).km
-
-    data["distance_from_previous_geopy"] = [None] + distances
+    # calculate the distance between the locations for all rows of the track at once
+    data["distance_from_previous_geopy"] = distance_from_previous(data["y"].to_numpy(), data["x"].to_numpy(), method)
 
-    # now wait for 10 seconds
-    logging.info("Sleeping for 10 seconds")
-    time.sleep(10)
+    # now wait for 10 seconds (simulated work; set env variable `DISTANCE_SLEEP_SECONDS` to change or turn it off)
+    sleep_seconds = float(os.environ.get('DISTANCE_SLEEP_SECONDS', 10))
+    if sleep_seconds > 0:
+        logging.info(f"Sleeping for {sleep_seconds:g} seconds")
+        time.sleep(sleep_seconds)
 
     # return the data with distances
     return data
 
 
-def parallelize(data: TrajectoryCollection, func) -> GeoDataFrame:
+def _distance_arrays(x, y, t, method: str = DEFAULT_DISTANCE_METHOD) -> dict:
+    return {"x": x, "y": y, "distance_from_previous_geopy": distance_from_previous(y, x, method)}
+
+
+# array counterpart of calculate_distance for the shared memory transport
+distance_kernel = ArrayKernel(func=_distance_arrays, columns=("x", "y", "distance_from_previous_geopy"))
+
+
+def distance_function(method: str = DEFAULT_DISTANCE_METHOD):
+    """
+    :return: `calculate_distance` with the given distance method, as picklable function of a track's GeoDataFrame
+    """
+    if method == DEFAULT_DISTANCE_METHOD:
+        return calculate_distance
+    return functools.partial(calculate_distance, method=method)
+
+
+def distance_method_kernel(method: str = DEFAULT_DISTANCE_METHOD) -> ArrayKernel:
+    """
+    :return: `distance_kernel` with the given distance method
+    """
+    if method == DEFAULT_DISTANCE_METHOD:
+        return distance_kernel
+    return ArrayKernel(func=functools.partial(_distance_arrays, method=method), columns=distance_kernel.columns)
+
+
+def _run_work_unit(task: tuple) -> list:
+    """
+    Applies a function to every track of a work unit; a track that fails does not affect the other tracks
+    :param task: the function, a list of (position, track) tuples, whether to copy the tracks first and how often
+        to retry a track that raised an error
+    :return: list of (position, result, metrics) tuples; the result is `None` and the metrics hold the error if the
+        track failed
+    """
+    func, tracks, copy, retries = task
+    results = []
+    for position, track in tracks:
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        result, error, attempts = call_with_retries(lambda: func(track.copy() if copy else track), retries)
+        metrics = task_metrics(wall_start, cpu_start, position=position, rows=len(track), attempts=attempts)
+        if error is not None:
+            metrics['error'] = error
+        log_task(metrics)
+        results.append((position, result, metrics))
+    return results
+
+
+def _run_file_unit(task: tuple) -> list:
+    """
+    Like `_run_work_unit`, for a worker that reads the tracks from a file shared with the parent
+    :param task: the function, the path of a file written by `write_point_rows`, a list of (position, offset, length)
+        tuples and how often to retry a track that raised an error
+    """
+    func, path, tracks, retries = task
+    return _run_work_unit(
+        (func, [(position, read_point_rows(path, offset, length)) for position, offset, length in tracks], False,
+         retries)
+    )
+
+
+def parallelize(data: 'TrajectoryCollection', func, split: TrackSplit = None, cpu_limit=None,
+                transport: str = 'pickle', backend='processes', timeout: float = None,
+                retries: int = 0) -> 'GeoDataFrame':
     """
     :param data:
-    :param func: The function that needs to be executed in parallel
-    :return:
+    :param func: The function that needs to be executed in parallel: a function of a track's GeoDataFrame or,
+        for the shared memory transport, an `ArrayKernel`
+    :param split: the data already split by track (see `split_tracks`); the cached view of `data`
+        (see `track_view`) if not given
+    :param cpu_limit: configured upper limit for the number of CPUs (optional)
+    :param transport: how tracks are sent to the workers: 'pickle' sends each track's GeoDataFrame,
+        'shared_memory' puts the coordinate and time arrays into shared memory once and only sends row offsets
+    :param backend: an `ExecutionBackend` or its name: 'serial', 'threads', 'processes', 'distributed' (workers
+        pulling the tracks from a broker, see `BrokerPool`) or 'auto' (picks a backend from the number of rows and
+        tracks and the measured cost per row)
+    :param timeout: seconds a single track may take (optional); a track that takes longer is stopped.
+        Only backends running in worker processes can stop a track, 'auto' picks those if a timeout is given.
+    :param retries: how often a track that failed or timed out is tried again
+    :return: the per-track results concatenated in the order of the split. Tracks that failed are left out and
+        recorded in the `FailureManifest` of the app run; if all tracks fail, the error of the first one is raised.
+    """
+    if split is None:
+        split = track_view(data)
+    data_return, failures = _parallelize(data, func, split, cpu_limit, transport, backend, timeout, retries)
+    if failures and len(failures) == len(split):
+        _raise_all_failed(failures)
+    _report_failures(func, failures)
+    return data_return
+
+
+def _parallelize(data: 'TrajectoryCollection', func, split: TrackSplit = None, cpu_limit=None,
+                 transport: str = 'pickle', backend='processes', timeout: float = None, retries: int = 0) -> tuple:
+    """
+    :return: the results of the successful tracks and the metrics of the failed tracks (with track ID and error)
     """
 
     logging.info("Function parallelize has been started")
 
-    # transfer the data to a GeoDataFrame
-    data_gdf = data.to_point_gdf()
+    # the data split by trackID, converted only once per collection
+    if split is None:
+        split = track_view(data)
+    logging.info(f'Track IDs discovered: {split.track_ids}')
+
+    # find the number of CPUs that is available inside the container
+    n_budget = get_cpu_budget(cpu_limit)
 
-    # get all different track IDs
-    track_id_col_name = data.get_traj_id_col()
-    track_ids = data_gdf[track_id_col_name].unique()
-    logging.info(f'Track IDs discovered: {track_ids}')
+    logging.info(f'Number of cores currently available for parallel processing: {n_budget}')
 
-    # find the number of CPUs that is available
-    n_cpu = mp.cpu_count()
-    logging.info(f'mp.cpu_count() found {n_cpu} CPUs')
+    supervised = timeout is not None and timeout > 0
+    chosen = get_backend(backend, func, rows=len(split.data), tracks=len(split), n_budget=n_budget)
+    if supervised and not chosen.supports_timeout:
+        if backend == 'auto':
+            chosen = get_backend('processes', func, rows=len(split.data), tracks=len(split), n_budget=n_budget)
+        else:
+            logging.warning(f'The {chosen.name} backend can not stop tracks, the timeout of {timeout:g} s is ignored')
+            supervised = False
+    backend = chosen
+    if backend.name == 'serial':
+        n_budget = 1
 
-    logging.info(f'Number of cores currently available for parallel processing: {n_cpu}')
+    # pack the tracks into work units of similar size: the row count estimates the cost of a track;
+    # with a timeout every track is a unit of its own, so a unit that times out identifies the track
+    n_units = len(split) if supervised else n_budget * UNITS_PER_CPU
+    units = pack_work_units(split.lengths().tolist(), n_units)
+    logging.info(f'Tracks packed into {len(units)} work units')
 
     # determine the maximum number of cores available or needed
-    if len(track_ids) > n_cpu:
-        n_cpu = n_cpu
-    else:
-        n_cpu = len(track_ids)
+    n_cpu = min(n_budget, len(units))
 
-    logging.info(f'Number of cores that will be used for parallel processing: {n_cpu}')
+    logging.info(f'Number of cores that will be used for parallel processing: {n_cpu} ({backend.name})')
 
-    # split the data by trackID
-    data_split = [data_gdf[data_gdf[track_id_col_name] == tr_id] for tr_id in track_ids]
+    run = _Run(backend, units, split, timeout if supervised else None, retries, n_cpu)
+    with backend.pool(n_budget, n_cpu, run.timeout) as pool:
+        # workers on other hosts read the data from a directory they share with this process, if there is one
+        shared_dir = getattr(pool, 'data_dir', None) if backend.remote else None
+        if transport == 'shared_memory':
+            # only local worker processes can share memory with the parent
+            if backend.in_process:
+                arrays_class = TrackArrays
+            elif backend.remote:
+                arrays_class = functools.partial(FileTrackArrays, directory=shared_dir) if shared_dir \
+                    else SlicedTrackArrays
+            else:
+                arrays_class = SharedTrackArrays
+            data_return, metrics = _run_arrays(pool, run, func, arrays_class)
+        else:
+            data_return, metrics = _run_frames(pool, run, func, copy=backend.in_process, shared_dir=shared_dir)
+    # the time the workers spent on the tracks, without pool start-up and idle workers; tracks that timed out
+    # have no measured time
+    measured = [task for task in metrics if 'wall_seconds' in task]
+    record_row_cost(func, sum(task['rows'] for task in measured), sum(task['wall_seconds'] for task in measured))
 
-    # multiprocessing
-    pool = mp.Pool(n_cpu)
-    data_return = pd.concat(pool.map(func, data_split), ignore_index=False)
-    pool.close()
-    pool.join()
+    for task in metrics:
+        task['track_id'] = split.track_ids[task.pop('position')]
+    failures = [task for task in metrics if 'error' in task]
+
+    instrumentation = Instrumentation.current()
+    if instrumentation is not None:
+        instrumentation.record_tasks(f'parallelize:{_func_name(func)}', metrics)
 
     # return the resulting data
-    return data_return
+    return data_return, failures
+
+
+def parallelize_cached(data: 'TrajectoryCollection', func, cache: TrackResultCache, split: TrackSplit = None,
+                       columns: tuple = None, **kwargs) -> 'GeoDataFrame':
+    """
+    Like `parallelize`, but reuses the results of locations already processed in an earlier run: only the locations
+    appended to a track since then are computed, together with the last known location as their predecessor.
+    Only suitable for functions that compute every row from the location itself and the previous location.
+    :param data:
+    :param func: see `parallelize`
+    :param cache: the per-track results of earlier runs, updated with the results of this run
+    :param split: see `parallelize`
+    :param columns: the columns `func` writes (default: the columns of an `ArrayKernel`); only these are cached and
+        taken from the cache, also if the input has them already (e.g. the output of an earlier run)
+    :param kwargs: passed on to `parallelize`
+    :return: the per-track results concatenated in the order of the split; `func` must not change other columns.
+        Tracks that failed are left out and not cached; if all tracks fail, the error of the first one is raised.
+    """
+    if columns is None:
+        if not isinstance(func, ArrayKernel):
+            raise ValueError('The columns written by the function are needed to cache its results')
+        columns = func.columns
+    columns = list(columns)
+    if split is None:
+        split = track_view(data)
+    coordinates = split.data.get_coordinates(include_z=False)
+    x = coordinates['x'].to_numpy(dtype=np.float64)
+    y = coordinates['y'].to_numpy(dtype=np.float64)
+    t = np.asarray(split.data.index.values).astype('datetime64[ns]').view(np.int64)
+    offsets = split.offsets
+
+    # look up every track; a track only needs the rows after its cached prefix plus the last cached row
+    cached = {}
+    starts = {}
+    for position, track_id in enumerate(split.track_ids):
+        start, end = offsets[position], offsets[position + 1]
+        hit = cache.lookup(track_id, x[start:end], y[start:end], t[start:end])
+        reused = 0 if hit is None else hit.rows
+        if hit is not None:
+            cached[position] = hit
+        if reused < end - start:
+            starts[position] = start + max(reused - 1, 0)
+    logging.info(f'Result cache: {len(cached)} of {len(split)} tracks known, '
+                 f'{sum(offsets[position + 1] - start for position, start in starts.items())} of {len(split.data)} '
+                 f'rows to compute')
+
+    computed = None
+    failed = set()
+    if starts:
+        positions = list(starts)
+        lengths = np.array([offsets[position + 1] - starts[position] for position in positions], dtype=np.int64)
+        segment_offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=segment_offsets[1:])
+        segments = TrackSplit(
+            data=split.data.take(np.concatenate([
+                np.arange(starts[position], offsets[position + 1]) for position in positions
+            ])),
+            track_id_col=split.track_id_col,
+            track_ids=split.track_ids[positions],
+            offsets=segment_offsets,
+            t=split.t,
+            crs=split.crs
+        )
+        computed, failures = _parallelize(data, func, split=segments, **kwargs)
+        if failures:
+            _report_failures(func, failures)
+            failed_ids = {failure['track_id'] for failure in failures}
+            failed = {position for position in positions if split.track_ids[position] in failed_ids}
+        # the computed rows only hold the segments that succeeded
+        succeeded = [position for position in positions if position not in failed]
+        computed_offsets = np.zeros(len(succeeded) + 1, dtype=np.int64)
+        np.cumsum([offsets[position + 1] - starts[position] for position in succeeded], out=computed_offsets[1:])
+        segment_of = {position: index for index, position in enumerate(succeeded)}
+        # tracks taken from the cache count as successful
+        if len(failed) == len(split):
+            _raise_all_failed(failures)
+
+    # combine the cached prefixes with the computed rows, in the order of the split
+    pieces = {column: [] for column in columns}
+    for position in range(len(split)):
+        if position in failed:
+            continue
+        hit = cached.get(position)
+        reused = 0 if hit is None else hit.rows
+        for column in columns:
+            if reused > 0:
+                pieces[column].append(hit.columns[column][:reused])
+            if position in starts:
+                segment = segment_of[position]
+                values = computed[column].to_numpy()[computed_offsets[segment]:computed_offsets[segment + 1]]
+                # the first computed row is the last cached one, needed only as predecessor
+                pieces[column].append(values[1:] if reused > 0 else values)
+    result = _without_tracks(split.data, offsets, failed) if failed else split.data.copy(deep=False)
+    for column in columns:
+        result[column] = np.concatenate(pieces[column])
+
+    # offsets of the tracks in the result, which lacks the failed tracks
+    result_offsets = np.zeros(len(split) + 1, dtype=np.int64)
+    np.cumsum(np.where(np.isin(np.arange(len(split)), list(failed)), 0, np.diff(offsets)), out=result_offsets[1:])
+    for position in starts:
+        if position in failed:
+            continue
+        start, end = offsets[position], offsets[position + 1]
+        result_start, result_end = result_offsets[position], result_offsets[position + 1]
+        cache.store(
+            split.track_ids[position], x[start:end], y[start:end], t[start:end],
+            {column: result[column].to_numpy()[result_start:result_end] for column in columns}
+        )
+    cache.evict()
+    return result
+
+
+def _without_tracks(data: 'GeoDataFrame', offsets: np.ndarray, positions) -> 'GeoDataFrame':
+    """
+    :return: the rows of `data` (in the order of a split with the given offsets) without the tracks at `positions`
+    """
+    keep = np.ones(len(data), dtype=bool)
+    for position in positions:
+        keep[offsets[position]:offsets[position + 1]] = False
+    return data[keep]
+
+
+def _report_failures(func, failures: list):
+    """
+    Logs the tracks that failed and records them in the `FailureManifest` of the app run, if there is one
+    """
+    stage = f'parallelize:{_func_name(func)}'
+    for failure in failures:
+        logging.warning(f'{stage}: track {failure.get("track_id")} left out after {failure.get("attempts")} '
+                        f'attempt(s): {failure.get("error")}')
+    manifest = FailureManifest.current()
+    if failures and manifest is not None:
+        manifest.record(stage, failures)
+
+
+def _raise_all_failed(failures: list):
+    raise RuntimeError(f'All {len(failures)} tracks failed, e.g. track {failures[0]["track_id"]}: '
+                       f'{failures[0]["error"]}')
+
+
+def _func_name(func) -> str:
+    while hasattr(func, 'func'):
+        func = func.func
+    return getattr(func, '__name__', type(func).__name__)
+
+
+@dataclass
+class _Run:
+    """How the work units of one `parallelize` call are run"""
+    backend: ExecutionBackend
+    units: list
+    split: TrackSplit
+    timeout: float | None
+    retries: int
+    n_cpu: int
+
+    def dispatch(self, pool, unit_function, tasks: list):
+        """
+        :return: generator of (index of the unit, result of `unit_function`); the result is a list of failure
+            metrics if the unit timed out or, with a distributed backend, failed on every worker it was handed to
+        """
+        if self.timeout is None or self.backend.pool_timeout:
+            for index, result in enumerate_unordered(pool, unit_function, tasks):
+                yield index, self._failed(index, result.attempts, result.error) \
+                    if isinstance(result, TaskFailure) else result
+            return
+        for index, result, attempts in run_supervised(pool, self.backend, unit_function, tasks, self.timeout,
+                                                      self.retries, self.n_cpu):
+            yield index, result if result is not None else \
+                self._failed(index, attempts, f'timeout after {self.timeout:g} s')
+
+    def _failed(self, index: int, attempts: int, error: str) -> list:
+        # the failure metrics of every track of the unit
+        return [
+            {'position': position, 'rows': int(self.split.lengths()[position]), 'attempts': attempts, 'error': error}
+            for position in self.units[index]
+        ]
+
+
+def _numbered_unit(task: tuple):
+    index, unit_function, unit_task = task
+    return index, unit_function(unit_task)
+
+
+def enumerate_unordered(pool, unit_function, tasks: list):
+    """
+    :return: generator of (index of the task, result) in the order the tasks finish; the result of a task a
+        distributed backend gave up is its `TaskFailure`
+    """
+    numbered = [(index, unit_function, task) for index, task in enumerate(tasks)]
+    for result in pool.imap_unordered(_numbered_unit, numbered):
+        # the task of a failure is the numbered task
+        yield (result.task[0], result) if isinstance(result, TaskFailure) else result
+
+
+def _run_frames(pool, run: _Run, func, copy: bool, shared_dir: str | None = None) -> tuple:
+    # consume the units as they finish and restore the original track order afterwards;
+    # tracks handed to other processes are copies anyway, in-process they are copied so the split stays untouched
+    split = run.split
+    results = [None] * len(split)
+    metrics = []
+    with tempfile.TemporaryDirectory(prefix='tracks-', dir=shared_dir) if shared_dir else nullcontext() as directory:
+        if directory is None:
+            tasks = [(func, [(position, split.track(position)) for position in unit], copy, run.retries)
+                     for unit in run.units]
+            unit_function = _run_work_unit
+        else:
+            # the point data is written once, the tasks only carry the rows of their tracks
+            path = os.path.join(directory, 'tracks.arrow')
+            write_point_rows(split.data, path)
+            offsets, lengths = split.offsets, split.lengths()
+            tasks = [(func, path, [(position, int(offsets[position]), int(lengths[position])) for position in unit],
+                      run.retries) for unit in run.units]
+            unit_function = _run_file_unit
+        for _, unit_result in run.dispatch(pool, unit_function, tasks):
+            for entry in unit_result:
+                if isinstance(entry, dict):
+                    # the unit timed out or failed
+                    metrics.append(entry)
+                    continue
+                position, track_result, track_metrics = entry
+                results[position] = track_result
+                metrics.append(track_metrics)
+    frames = [result for result in results if result is not None]
+    if not frames:
+        return None, metrics
+    import pandas as pd
+    return pd.concat(frames, ignore_index=False), metrics
+
+
+def _run_arrays(pool, run: _Run, kernel: ArrayKernel, arrays_class: type) -> tuple:
+    if not isinstance(kernel, ArrayKernel):
+        raise TypeError(f'The shared memory transport needs an ArrayKernel, got {type(kernel).__name__}')
+    split = run.split
+    offsets, lengths = split.offsets, split.lengths()
+    with arrays_class(split, kernel.columns) as arrays:
+        tasks = [
+            arrays.task(kernel, [(int(offsets[position]), int(lengths[position])) for position in unit], run.retries)
+            for unit in run.units
+        ]
+        metrics = [track for index, unit in run.dispatch(pool, arrays.unit_function(), tasks)
+                   for track in arrays.collect(index, unit)]
+        logging.info(f'Processed {sum(track["rows"] for track in metrics)} rows ({type(arrays).__name__})')
+        # slices are identified by their offset, which is unique per track
+        positions = {int(offset): position for position, offset in enumerate(offsets[:-1])}
+        for track in metrics:
+            if 'offset' in track:
+                track['position'] = positions[track.pop('offset')]
+        result = arrays.attach_results(split.data)
+
+    # leave out the rows of the tracks that failed
+    failed = [track['position'] for track in metrics if 'error' in track]
+    return _without_tracks(result, offsets, failed) if failed else result, metrics
@@ -0,0 +1,136 @@
+import hashlib
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+import numpy as np
+
+# upper limit for the size of all cache entries together, see env variable `RESULT_CACHE_MAX_MB`
+DEFAULT_MAX_MB = 512
+
+_COLUMN_PREFIX = 'column:'
+
+
+def prefix_digest(x: np.ndarray, y: np.ndarray, t: np.ndarray, rows: int) -> str:
+    """
+    :param x: the x coordinates of a track (float64)
+    :param y: the y coordinates of a track (float64)
+    :param t: the timestamps of a track (int64 nanoseconds)
+    :param rows: length of the prefix
+    :return: content hash of the first `rows` locations of the track
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for values in (t, x, y):
+        digest.update(np.ascontiguousarray(values[:rows]).tobytes())
+    return digest.hexdigest()
+
+
+@dataclass
+class CachedTrack:
+    """Results of the first `rows` locations of a track"""
+    rows: int
+    columns: dict
+
+
+class TrackResultCache:
+    """
+    Persistent per-track results of a computation in which every row only depends on the location itself and the
+    previous location of the track (e.g. the distance from the previous location). When a track only grew since the
+    last run, the results of the known locations are reused and only the appended locations have to be computed.
+
+    An entry is keyed by track ID and holds the content hash of the locations it was computed from. Entries are stored
+    as `.npz` files below `directory/namespace`; the least recently used entries are removed once all entries
+    together are larger than `max_bytes`.
+    """
+
+    def __init__(self, directory: str, namespace: str, max_bytes: int = DEFAULT_MAX_MB * 1024 ** 2):
+        self.directory = os.path.join(directory, namespace)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, namespace: str) -> 'TrackResultCache | None':
+        """
+        :return: the cache configured by the env variables `RESULT_CACHE_DIR` and `RESULT_CACHE_MAX_MB` or `None`
+            if no directory is configured
+        """
+        directory = os.environ.get('RESULT_CACHE_DIR')
+        if not directory:
+            return None
+        max_mb = float(os.environ.get('RESULT_CACHE_MAX_MB', DEFAULT_MAX_MB))
+        return cls(directory, namespace, max_bytes=int(max_mb * 1024 ** 2))
+
+    def _path(self, track_id) -> str:
+        return os.path.join(self.directory, f'{hashlib.sha1(str(track_id).encode()).hexdigest()}.npz')
+
+    def lookup(self, track_id, x: np.ndarray, y: np.ndarray, t: np.ndarray) -> CachedTrack | None:
+        """
+        :param track_id: ID of the track
+        :param x: the x coordinates of the track as it is now
+        :param y: the y coordinates of the track as it is now
+        :param t: the timestamps of the track as it is now
+        :return: the cached results if the track starts with the locations they were computed from, `None` otherwise
+        """
+        path = self._path(track_id)
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                rows = int(entry['rows'])
+                if str(entry['track_id']) != str(track_id) or rows > len(t):
+                    return None
+                if str(entry['digest']) != prefix_digest(x, y, t, rows):
+                    return None
+                columns = {
+                    key[len(_COLUMN_PREFIX):]: entry[key]
+                    for key in entry.files if key.startswith(_COLUMN_PREFIX)
+                }
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as error:
+            logging.warning(f'Ignoring unreadable result cache entry of track {track_id}: {error}')
+            return None
+        # mark as recently used
+        os.utime(path)
+        return CachedTrack(rows=rows, columns=columns)
+
+    def store(self, track_id, x: np.ndarray, y: np.ndarray, t: np.ndarray, columns: dict):
+        """
+        :param track_id: ID of the track
+        :param x: the x coordinates of the track
+        :param y: the y coordinates of the track
+        :param t: the timestamps of the track
+        :param columns: the results of all locations of the track, one array per column
+        """
+        if any(values.dtype == object for values in columns.values()):
+            logging.debug(f'Results of track {track_id} are not cached: object columns')
+            return
+        entry = {
+            'track_id': np.asarray(str(track_id)),
+            'rows': np.asarray(len(t)),
+            'digest': np.asarray(prefix_digest(x, y, t, len(t))),
+            **{f'{_COLUMN_PREFIX}{name}': values for name, values in columns.items()},
+        }
+        descriptor, temporary = tempfile.mkstemp(suffix='.npz', dir=self.directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                np.savez(file, **entry)
+            os.replace(temporary, self._path(track_id))
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def evict(self):
+        """
+        Removes the least recently used entries until all entries together fit into `max_bytes`
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            logging.info(f'Evicted result cache entry {os.path.basename(path)} ({size} bytes)')
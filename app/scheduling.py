@@ -0,0 +1,29 @@
+import heapq
+
+# number of work units per CPU; more units than CPUs lets fast workers pick up the remaining small units
+UNITS_PER_CPU = 2
+
+
+def pack_work_units(costs: list, n_units: int) -> list:
+    """
+    Packs tasks into work units of similar total cost (longest-processing-time-first)
+    :param costs: estimated cost of each task (e.g. the number of rows of a track)
+    :param n_units: maximum number of work units to create
+    :return: list of work units, each a list of task positions; units are ordered by descending total cost
+    """
+    n_units = max(1, min(n_units, len(costs)))
+    order = sorted(range(len(costs)), key=lambda i: costs[i], reverse=True)
+
+    # min-heap of (total cost, unit number): the next task always goes to the least loaded unit
+    heap = [(0, unit) for unit in range(n_units)]
+    units = [[] for _ in range(n_units)]
+    totals = [0] * n_units
+    for task in order:
+        total, unit = heapq.heappop(heap)
+        units[unit].append(task)
+        totals[unit] = total + costs[task]
+        heapq.heappush(heap, (totals[unit], unit))
+
+    # hand out the most expensive units first so that they do not end up running alone at the end
+    ranked = sorted(range(n_units), key=lambda unit: totals[unit], reverse=True)
+    return [units[unit] for unit in ranked if units[unit]]
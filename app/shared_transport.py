@@ -0,0 +1,325 @@
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from typing import TYPE_CHECKING, Callable
+import numpy as np
+
+from sdk.moveapps_instrumentation import task_metrics
+from sdk.moveapps_logging import log_task
+from app.supervision import call_with_retries
+from app.tracks import TrackSplit
+
+if TYPE_CHECKING:
+    from geopandas.geodataframe import GeoDataFrame
+
+
+@dataclass(frozen=True)
+class ArrayKernel:
+    """
+    A per-track computation on plain arrays that can run on shared memory.
+    `func(x, y, t)` receives the coordinates (float64) and timestamps (int64 nanoseconds) of one track and returns
+    a dict with one float64 array of the same length per name in `columns`.
+    """
+    func: Callable
+    columns: tuple
+
+
+@dataclass(frozen=True)
+class SharedBlock:
+    """Descriptor of a shared memory block holding a 1-dimensional array"""
+    name: str
+    dtype: str
+    length: int
+
+    def view(self, shm: shared_memory.SharedMemory) -> np.ndarray:
+        return np.ndarray((self.length,), dtype=self.dtype, buffer=shm.buf)
+
+
+def _output_key(column: str) -> str:
+    return f'out:{column}'
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Attaches to a block owned by the parent process. The block must not be registered with the resource tracker of
+    the worker, otherwise the tracker would unlink it when the worker exits.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class TrackArrays:
+    """
+    The coordinates, timestamps and track offsets of a split as plain arrays, plus one output array per kernel column.
+    Used by backends that run the kernel in the parent process.
+    """
+
+    def __init__(self, split: TrackSplit, columns: tuple):
+        coordinates = split.data.get_coordinates(include_z=False)
+        times = np.asarray(split.data.index.values).astype('datetime64[ns]').view(np.int64)
+        self._arrays = {}
+        try:
+            self._store('x', coordinates['x'].to_numpy(dtype=np.float64))
+            self._store('y', coordinates['y'].to_numpy(dtype=np.float64))
+            self._store('t', times)
+            self._store('offsets', split.offsets)
+            for column in columns:
+                self._store(_output_key(column), np.full(len(split.data), np.nan))
+        except BaseException:
+            self.close()
+            raise
+        self.columns = columns
+
+    def _store(self, key: str, values: np.ndarray):
+        self._arrays[key] = values
+
+    def task(self, kernel: ArrayKernel, slices: list, retries: int = 0) -> tuple:
+        """
+        :param retries: how often a track that raised an error is tried again
+        :return: the task for `unit_function` processing the given (offset, length) slices
+        """
+        return kernel, self._arrays, slices, retries
+
+    @staticmethod
+    def unit_function():
+        return run_array_unit
+
+    def collect(self, index: int, unit_result) -> list:
+        """
+        :param index: index of the task
+        :param unit_result: what `unit_function` returned for the task
+        :return: metrics of each track of the task
+        """
+        return unit_result
+
+    def attach_results(self, data: 'GeoDataFrame') -> 'GeoDataFrame':
+        """
+        :param data: the (sorted) data of the split
+        :return: a shallow copy of the data with the kernel columns attached
+        """
+        result = data.copy(deep=False)
+        for column in self.columns:
+            result[column] = self._arrays[_output_key(column)]
+        return result
+
+    def close(self):
+        self._arrays = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SharedTrackArrays(TrackArrays):
+    """
+    Owns shared memory blocks with the coordinates, timestamps and track offsets of a split,
+    as well as one output block per kernel column. Workers only receive the block descriptors.
+    """
+
+    def __init__(self, split: TrackSplit, columns: tuple):
+        self._blocks = {}
+        super().__init__(split, columns)
+
+    def _store(self, key: str, values: np.ndarray):
+        shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        self._blocks[key] = (shm, SharedBlock(name=shm.name, dtype=values.dtype.str, length=len(values)))
+        array = np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)
+        array[:] = values
+        self._arrays[key] = array
+
+    def descriptors(self) -> dict:
+        return {key: block for key, (_, block) in self._blocks.items()}
+
+    def task(self, kernel: ArrayKernel, slices: list, retries: int = 0) -> tuple:
+        return kernel, self.descriptors(), slices, retries
+
+    @staticmethod
+    def unit_function():
+        return run_shared_unit
+
+    def attach_results(self, data: 'GeoDataFrame') -> 'GeoDataFrame':
+        result = data.copy(deep=False)
+        for column in self.columns:
+            # copy once out of the shared memory, it is released afterwards
+            result[column] = self._arrays[_output_key(column)].copy()
+        return result
+
+    def close(self):
+        super().close()
+        for shm, _ in self._blocks.values():
+            shm.close()
+            shm.unlink()
+        self._blocks = {}
+
+
+class SlicedTrackArrays(TrackArrays):
+    """
+    For workers on other hosts, which can not reach the memory of the parent: every task carries only the
+    coordinates and timestamps of its own tracks, the worker sends back their outputs and the parent writes them into
+    its output arrays (see `collect`).
+    """
+
+    def __init__(self, split: TrackSplit, columns: tuple):
+        super().__init__(split, columns)
+        self._task_slices = []
+
+    def task(self, kernel: ArrayKernel, slices: list, retries: int = 0) -> tuple:
+        self._task_slices.append(slices)
+        return kernel, _slice_arrays(self._arrays, slices), _local_slices(slices), retries
+
+    @staticmethod
+    def unit_function():
+        return run_sliced_unit
+
+    def collect(self, index: int, unit_result) -> list:
+        if isinstance(unit_result, list):
+            # failure metrics of a unit that did not run
+            return unit_result
+        metrics, outputs = unit_result
+        # the worker refers to the tracks by their offset in the arrays of the task
+        global_offsets = {}
+        local = 0
+        for offset, length in self._task_slices[index]:
+            for column in self.columns:
+                self._arrays[_output_key(column)][offset:offset + length] = outputs[column][local:local + length]
+            global_offsets[local] = offset
+            local += length
+        for track in metrics:
+            track['offset'] = global_offsets[track['offset']]
+        return metrics
+
+
+class FileTrackArrays(SlicedTrackArrays):
+    """
+    For workers that share a directory with the parent (see `BrokerPool.data_dir`): the coordinates and timestamps
+    are written there once, every task carries only the offsets of its tracks and the worker reads their rows from the
+    memory-mapped files. The outputs come back with the results, like with `SlicedTrackArrays`.
+    """
+
+    def __init__(self, split: TrackSplit, columns: tuple, directory: str):
+        self.directory = tempfile.mkdtemp(prefix='tracks-', dir=directory)
+        try:
+            super().__init__(split, columns)
+            for key in ('x', 'y', 't'):
+                np.save(os.path.join(self.directory, f'{key}.npy'), self._arrays[key])
+        except BaseException:
+            self.close()
+            raise
+
+    def task(self, kernel: ArrayKernel, slices: list, retries: int = 0) -> tuple:
+        self._task_slices.append(slices)
+        return kernel, self.directory, slices, retries
+
+    @staticmethod
+    def unit_function():
+        return run_file_unit
+
+    def close(self):
+        super().close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _slice_arrays(arrays: dict, slices: list) -> dict:
+    """
+    :return: the coordinates and timestamps of the given (offset, length) slices, one after the other
+    """
+    return {
+        key: np.concatenate([arrays[key][offset:offset + length] for offset, length in slices])
+        for key in ('x', 'y', 't')
+    }
+
+
+def _local_slices(slices: list) -> list:
+    """
+    :return: the (offset, length) of the given slices in the arrays of `_slice_arrays`
+    """
+    local_offsets = np.cumsum([0] + [length for _, length in slices[:-1]]).tolist()
+    return [(local, length) for local, (_, length) in zip(local_offsets, slices)]
+
+
+def run_file_unit(task: tuple) -> tuple:
+    """
+    Applies an array kernel to the tracks of a work unit, reading their rows from the files of `FileTrackArrays`
+    :param task: the kernel, the directory of the files, a list of (offset, length) tuples and the number of retries
+    :return: see `run_sliced_unit`
+    """
+    kernel, directory, slices, retries = task
+    arrays = {key: np.load(os.path.join(directory, f'{key}.npy'), mmap_mode='r') for key in ('x', 'y', 't')}
+    return run_sliced_unit((kernel, _slice_arrays(arrays, slices), _local_slices(slices), retries))
+
+
+def run_sliced_unit(task: tuple) -> tuple:
+    """
+    Applies an array kernel to the tracks of a work unit whose arrays travel with the task
+    :param task: the kernel, the arrays of the unit's tracks, a list of (offset, length) tuples into these arrays
+        and the number of retries
+    :return: metrics of each track and the output arrays
+    """
+    kernel, arrays, slices, retries = task
+    length = len(arrays['x'])
+    outputs = {column: np.full(length, np.nan) for column in kernel.columns}
+    metrics = _apply_kernel(kernel, {**arrays, **{_output_key(column): values for column, values in outputs.items()}},
+                            slices, retries)
+    return metrics, outputs
+
+
+def run_array_unit(task: tuple) -> list:
+    """
+    Applies an array kernel to the tracks of a work unit in the current process
+    :param task: the kernel, the arrays, a list of (offset, length) tuples and the number of retries
+    :return: metrics of each track
+    """
+    kernel, arrays, slices, retries = task
+    return _apply_kernel(kernel, arrays, slices, retries)
+
+
+def run_shared_unit(task: tuple) -> list:
+    """
+    Applies an array kernel to the tracks of a work unit, reading and writing shared memory
+    :param task: the kernel, the block descriptors, a list of (offset, length) tuples and the number of retries
+    :return: metrics of each track
+    """
+    kernel, descriptors, slices, retries = task
+    attached = {key: _attach(block.name) for key, block in descriptors.items()}
+    try:
+        metrics = _apply_kernel(kernel, {key: block.view(attached[key]) for key, block in descriptors.items()},
+                                slices, retries)
+    finally:
+        for shm in attached.values():
+            # views kept alive by a traceback are released by the garbage collector instead
+            with contextlib.suppress(BufferError):
+                shm.close()
+    return metrics
+
+
+def _apply_kernel(kernel: ArrayKernel, arrays: dict, slices: list, retries: int = 0) -> list:
+    """
+    :return: metrics of each track; a track that failed keeps NaN outputs and its metrics hold the error
+    """
+    def run(offset: int, end: int):
+        outputs = kernel.func(arrays['x'][offset:end], arrays['y'][offset:end], arrays['t'][offset:end])
+        for column in kernel.columns:
+            arrays[_output_key(column)][offset:end] = outputs[column]
+
+    metrics = []
+    for offset, length in slices:
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        _, error, attempts = call_with_retries(lambda: run(offset, offset + length), retries)
+        metrics.append(task_metrics(wall_start, cpu_start, offset=offset, rows=length, attempts=attempts))
+        if error is not None:
+            metrics[-1]['error'] = error
+        log_task(metrics[-1])
+    return metrics
@@ -0,0 +1,72 @@
+import logging
+import time
+from collections import Counter, deque
+
+# how often the supervisor checks the running tasks for timeouts
+POLL_SECONDS = 0.05
+
+
+def call_with_retries(function, retries: int) -> tuple:
+    """
+    Calls `function()` until it succeeds, at most `retries + 1` times
+    :return: the result (or `None`), the error of the last attempt as string (or `None`) and the number of attempts
+    """
+    for attempt in range(1, retries + 2):
+        try:
+            return function(), None, attempt
+        except Exception as error:
+            if attempt > retries:
+                return None, f'{type(error).__name__}: {error}', attempt
+            logging.warning(f'attempt {attempt} failed, retrying: {type(error).__name__}: {error}')
+
+
+def run_supervised(pool, backend, unit_function, tasks: list, timeout: float, retries: int, in_flight: int):
+    """
+    Runs the tasks with a timeout per task: a task that takes longer is given up and the pool is restarted to stop it.
+    The other tasks that were running at that moment are run again. A task that timed out is retried at most
+    `retries` times.
+    :param pool: the pool provided by `backend.pool`
+    :param backend: an `ExecutionBackend` that supports timeouts
+    :param unit_function: function of a task, run in the pool
+    :param tasks: the tasks
+    :param timeout: seconds a task may run
+    :param retries: how often a task that timed out is started again
+    :param in_flight: number of tasks submitted at once; at most the number of workers, so a task starts running
+        when it is submitted
+    :return: generator of (index of the task, result of `unit_function` or `None` if the task timed out and
+        the number of attempts)
+    """
+    pending = deque(enumerate(tasks))
+    attempts = Counter()
+    running = {}
+    while pending or running:
+        while pending and len(running) < in_flight:
+            index, task = pending.popleft()
+            attempts[index] += 1
+            running[index] = (pool.apply_async(unit_function, (task,)), time.monotonic(), task)
+
+        for index, (result, _, _) in list(running.items()):
+            if result.ready():
+                del running[index]
+                yield index, result.get(), attempts[index]
+
+        now = time.monotonic()
+        expired = [index for index, (_, started, _) in running.items() if now - started > timeout]
+        if not expired:
+            if running:
+                next(iter(running.values()))[0].wait(POLL_SECONDS)
+            continue
+
+        for index in expired:
+            _, _, task = running.pop(index)
+            logging.warning(f'task {index} exceeded the timeout of {timeout:g} s (attempt {attempts[index]})')
+            if attempts[index] <= retries:
+                pending.append((index, task))
+            else:
+                yield index, None, attempts[index]
+        # the tasks that were running besides are stopped by the restart: run them again, not as a retry
+        for index, (_, _, task) in running.items():
+            attempts[index] -= 1
+            pending.appendleft((index, task))
+        running.clear()
+        pool = backend.restart()
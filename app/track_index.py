@@ -0,0 +1,86 @@
+import logging
+from typing import TYPE_CHECKING
+import numpy as np
+
+from sdk.moveapps_track_index import TRACK_INDEX_DATE_FORMAT
+from app.tracks import TrackSplit
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def build_track_index(split: TrackSplit, distance_column: str | None = None) -> 'pd.DataFrame':
+    """
+    Summarizes every track of the point data in one row, computed in a single vectorized pass over the contiguous
+    track slices: consumers can find the rows of a track or filter tracks by area and time window without reading
+    the point data
+    :param split: the point data split by track, in the row order of the output (see `track_view`)
+    :param distance_column: column with the distance from the previous location in km (optional); adds its sum,
+        mean and maximum per track
+    :return: one row per track, in the order of the split: track ID, row offset and count, first and last timestamp
+        and bounding box (min/max x and y in the CRS of the data)
+    """
+    import pandas as pd
+
+    starts = split.offsets[:-1]
+    ends = split.offsets[1:]
+    index = pd.DataFrame({
+        split.track_id_col: split.track_ids,
+        'offset': starts,
+        'rows': ends - starts,
+    })
+    if len(split) == 0:
+        return index
+
+    times = split.data.index
+    # each track is sorted by time
+    index['start_time'] = times[starts]
+    index['end_time'] = times[ends - 1]
+    coordinates = split.data.get_coordinates(include_z=False)
+    for axis in ('x', 'y'):
+        values = coordinates[axis].to_numpy(dtype=np.float64)
+        # fmin/fmax skip missing coordinates
+        index[f'min_{axis}'] = np.fmin.reduceat(values, starts)
+        index[f'max_{axis}'] = np.fmax.reduceat(values, starts)
+
+    if distance_column is not None and distance_column in split.data.columns:
+        distances = split.data[distance_column].to_numpy(dtype=np.float64)
+        known = ~np.isnan(distances)
+        total = np.add.reduceat(np.where(known, distances, 0), starts)
+        counts = np.add.reduceat(known.astype(np.int64), starts)
+        index['distance_km_total'] = total
+        with np.errstate(invalid='ignore', divide='ignore'):
+            index['distance_km_mean'] = np.where(counts > 0, total / counts, np.nan)
+        index['distance_km_max'] = np.fmax.reduceat(distances, starts)
+    return index
+
+
+def select_tracks(index: 'pd.DataFrame', bbox: tuple | None = None, start=None, end=None) -> 'pd.DataFrame':
+    """
+    :param index: see `build_track_index`
+    :param bbox: (min x, min y, max x, max y); tracks whose bounding box intersects it (optional)
+    :param start: tracks with locations at or after this time (optional)
+    :param end: tracks with locations at or before this time (optional)
+    :return: the rows of the index of the matching tracks; `offset` and `rows` give their rows in the point data
+    """
+    mask = np.ones(len(index), dtype=bool)
+    if bbox is not None:
+        min_x, min_y, max_x, max_y = bbox
+        mask &= ((index['max_x'] >= min_x) & (index['min_x'] <= max_x)
+                 & (index['max_y'] >= min_y) & (index['min_y'] <= max_y)).to_numpy()
+    if start is not None:
+        mask &= (index['end_time'] >= start).to_numpy()
+    if end is not None:
+        mask &= (index['start_time'] <= end).to_numpy()
+    return index[mask]
+
+
+def write_track_index(index: 'pd.DataFrame', path: str) -> str:
+    """
+    Writes the index as CSV, e.g. to the path of an artifact (see `MoveAppsIo.create_artifacts_file`); in streaming
+    runs the index of all batches is written by `TrackIndexCollector` instead
+    :return: the path
+    """
+    index.to_csv(path, index=False, date_format=TRACK_INDEX_DATE_FORMAT)
+    logging.info(f'Track index of {len(index)} tracks written to {path}')
+    return path
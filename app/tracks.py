@@ -0,0 +1,162 @@
+import copy
+import weakref
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING
+import numpy as np
+
+if TYPE_CHECKING:
+    from geopandas.geodataframe import GeoDataFrame
+    from movingpandas import TrajectoryCollection
+
+
+@dataclass
+class TrackSplit:
+    """
+    Point data sorted by track and time together with the row offsets of each track.
+    Track `i` occupies the rows `offsets[i]:offsets[i + 1]`.
+    """
+    data: 'GeoDataFrame'
+    track_id_col: str
+    track_ids: np.ndarray
+    offsets: np.ndarray
+    # name of the time column (the index of `data`) and CRS of the points
+    t: str = None
+    crs: object = None
+
+    def __len__(self) -> int:
+        return len(self.track_ids)
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def track(self, position: int) -> 'GeoDataFrame':
+        return self.data.iloc[self.offsets[position]:self.offsets[position + 1]]
+
+    def tracks(self) -> list:
+        return [self.track(position) for position in range(len(self))]
+
+
+def split_tracks(data_gdf: 'GeoDataFrame', track_id_col: str) -> TrackSplit:
+    """
+    Splits point data into tracks in a single pass: the data is sorted once by track and time
+    (keeping the tracks in order of appearance) and each track becomes a contiguous slice.
+    :param data_gdf: point data with a time index
+    :param track_id_col: name of the track ID column
+    :return: the sorted data and the row offsets of the tracks
+    """
+    import pandas as pd
+
+    codes, track_ids = pd.factorize(data_gdf[track_id_col])
+    times = data_gdf.index.to_numpy()
+
+    # data from TrajectoryCollection.to_point_gdf() is already grouped and sorted, only sort otherwise
+    same_track = codes[1:] == codes[:-1]
+    is_sorted = np.all(codes[1:] >= codes[:-1]) and np.all(times[1:][same_track] >= times[:-1][same_track])
+    if not is_sorted:
+        order = np.lexsort((times, codes))
+        data_gdf = data_gdf.take(order)
+        codes = codes[order]
+
+    offsets = np.zeros(len(track_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=len(track_ids)), out=offsets[1:])
+    return TrackSplit(
+        data=data_gdf,
+        track_id_col=track_id_col,
+        track_ids=np.asarray(track_ids),
+        offsets=offsets,
+        t=data_gdf.index.name,
+        crs=data_gdf.crs
+    )
+
+
+# views of the collections seen so far, with the state of the collection they were made of (see `_state`);
+# an entry is dropped together with its collection
+_views = weakref.WeakKeyDictionary()
+
+
+def _state(data: 'TrajectoryCollection') -> list:
+    # the data frame of each trajectory and its columns: methods like `add_speed` replace the frame or add columns
+    return [(trajectory.df, tuple(trajectory.df.columns)) for trajectory in data.trajectories]
+
+
+def _unchanged(state: list, data: 'TrajectoryCollection') -> bool:
+    return len(state) == len(data.trajectories) and all(
+        trajectory.df is frame and tuple(trajectory.df.columns) == columns
+        for (frame, columns), trajectory in zip(state, data.trajectories)
+    )
+
+
+def track_view(data: 'TrajectoryCollection') -> TrackSplit:
+    """
+    Columnar view of a TrajectoryCollection: its point GeoDataFrame split by track.
+    The view is built on first use and cached for the lifetime of the collection, so every caller shares a single
+    conversion of the trajectories. It is built again if trajectories, their data frames or their columns changed
+    since (e.g. by `add_speed` in a chained hook); changes of values within the same columns are not noticed.
+    :param data: the trajectories
+    :return: the point data, track offsets, time column and CRS of the collection
+    """
+    cached = _views.get(data)
+    if cached is not None and _unchanged(cached[1], data):
+        return cached[0]
+    view = split_tracks(data.to_point_gdf(), data.get_traj_id_col())
+    _views[data] = (view, _state(data))
+    return view
+
+
+def _reuses_trajectories(result: 'GeoDataFrame', split: TrackSplit, source: 'TrajectoryCollection') -> bool:
+    """
+    :return: whether the trajectories of `source` correspond one to one (same order, IDs, lengths and CRS) to the
+        tracks of the split and the result rows keep the time index of the split
+    """
+    trajectories = source.trajectories
+    return (
+        len(trajectories) == len(split)
+        and len(result) == split.offsets[-1]
+        and result.crs == split.crs
+        and result.index.equals(split.data.index)
+        and all(trajectory.id == track_id for trajectory, track_id in zip(trajectories, split.track_ids))
+        and all(len(trajectory.df) == length for trajectory, length in zip(trajectories, split.lengths()))
+    )
+
+
+def rebuild_collection(result: 'GeoDataFrame', split: TrackSplit, crs=None,
+                       source: 'TrajectoryCollection' = None) -> 'TrajectoryCollection':
+    """
+    Translates the concatenated per-track results back to a TrajectoryCollection using the track offsets
+    :param result: per-track results in the order of the split, usually one row per input row
+    :param split: the split the results were computed from; if the result has a different number of rows (e.g. rows
+        or tracks were dropped), it is split again by its track ID column instead
+    :param crs: CRS of the trajectories (default: the CRS of the split)
+    :param source: the collection the split was made of; if its trajectories match the tracks of the split, they are
+        reused as templates and only their data is replaced, which skips sorting and validating every track again
+    :return: TrajectoryCollection of the results
+    """
+    from movingpandas import Trajectory, TrajectoryCollection
+
+    crs = crs if crs is not None else split.crs
+    if source is not None and crs == split.crs and _reuses_trajectories(result, split, source):
+        trajectories = []
+        for position, template in enumerate(source.trajectories):
+            # the slices are sorted by time and free of duplicates already, like the data of the template
+            trajectory = copy.copy(template)
+            trajectory.df = result.iloc[split.offsets[position]:split.offsets[position + 1]]
+            trajectories.append(trajectory)
+        collection = TrajectoryCollection(trajectories, t=result.index.name)
+        # the result is the point data of the new collection already: a following step (e.g. the next app of a
+        # chained run) gets its view without converting the trajectories again
+        _views[collection] = (replace(split, data=result), _state(collection))
+        return collection
+
+    if len(result) != split.offsets[-1]:
+        # the offsets of the split do not apply to the result
+        split = split_tracks(result, split.track_id_col)
+    trajectories = [
+        Trajectory(
+            result.iloc[split.offsets[position]:split.offsets[position + 1]],
+            track_id,
+            traj_id_col=split.track_id_col,
+            crs=crs
+        )
+        for position, track_id in enumerate(split.track_ids)
+    ]
+    return TrajectoryCollection(trajectories, t=result.index.name)
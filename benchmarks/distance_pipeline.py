@@ -0,0 +1,168 @@
+"""
+Benchmark of the distance pipeline (`parallelize` and `calculate_distance`) on synthetic TrajectoryCollections.
+
+Example:
+    python -m benchmarks.distance_pipeline --tracks 200 --points 5000 --skew 1.2 --workers 1,2,4 --output bench.json
+
+The artificial sleep in `calculate_distance` is turned off unless `--sleep` is given.
+Peak RSS is the high-water mark of the benchmark process and of its (finished) child processes up to the end of a
+configuration, so configurations are best compared in the order of increasing memory use.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import movingpandas as mpd
+
+from app.parallel import calculate_distance, distance_kernel, parallelize
+from app.tracks import track_view
+from sdk.moveapps_instrumentation import peak_rss_mb
+
+
+def track_sizes(n_tracks: int, points_per_track: int, skew: float) -> np.ndarray:
+    """
+    :param n_tracks: number of tracks
+    :param points_per_track: average number of locations per track
+    :param skew: Zipf exponent of the track sizes; 0 gives tracks of equal size
+    :return: number of locations of each track (at least 2)
+    """
+    weights = 1 / np.arange(1, n_tracks + 1) ** skew
+    sizes = np.floor(weights / weights.sum() * n_tracks * points_per_track).astype(np.int64)
+    return np.maximum(sizes, 2)
+
+
+def synthetic_collection(n_tracks: int, points_per_track: int, skew: float = 0.0, seed: int = 0) \
+        -> mpd.TrajectoryCollection:
+    """
+    Creates random walks in lat/lon with hourly fixes
+    :return: TrajectoryCollection with the requested track sizes
+    """
+    rng = np.random.default_rng(seed)
+    sizes = track_sizes(n_tracks, points_per_track, skew)
+    n = int(sizes.sum())
+    track_ids = np.repeat([f'track_{i:06d}' for i in range(n_tracks)], sizes)
+    starts = np.repeat(np.cumsum(sizes) - sizes, sizes)
+    steps = np.arange(n) - starts
+    lon = np.repeat(rng.uniform(-170, 170, n_tracks), sizes) + np.cumsum(rng.normal(0, 0.01, n))
+    lat = np.clip(np.repeat(rng.uniform(-60, 60, n_tracks), sizes) + np.cumsum(rng.normal(0, 0.01, n)), -89, 89)
+    times = pd.Timestamp('2020-01-01') + pd.to_timedelta(steps, unit='h')
+    gdf = gpd.GeoDataFrame(
+        {'track_id': track_ids, 'timestamp_utc': times},
+        geometry=gpd.points_from_xy(lon, lat),
+        crs='epsg:4326'
+    )
+    return mpd.TrajectoryCollection(gdf, traj_id_col='track_id', t='timestamp_utc')
+
+
+def summarize(name: str, config: dict, rows: int, latencies: list) -> dict:
+    latencies = np.asarray(latencies)
+    return {
+        'benchmark': name,
+        **config,
+        'rows': rows,
+        'repeats': len(latencies),
+        'p50_seconds': float(np.percentile(latencies, 50)),
+        'p95_seconds': float(np.percentile(latencies, 95)),
+        'rows_per_second': float(rows / np.percentile(latencies, 50)),
+        'peak_rss_mb': peak_rss_mb(include_children=True),
+    }
+
+
+def bench_calculate_distance(data: mpd.TrajectoryCollection, repeats: int) -> dict:
+    """
+    Runs `calculate_distance` on every track in the current process
+    """
+    split = track_view(data)
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for position in range(len(split)):
+            calculate_distance(split.track(position).copy())
+        latencies.append(time.perf_counter() - start)
+    return summarize('calculate_distance', {}, len(split.data), latencies)
+
+
+def bench_parallelize(data: mpd.TrajectoryCollection, repeats: int, workers: int, backend: str,
+                      transport: str) -> dict:
+    """
+    Runs `parallelize` end to end, including starting the pool; the columnar view of the data is built by the
+    first repetition and shared by all others, like in an app run
+    """
+    func = distance_kernel if transport == 'shared_memory' else calculate_distance
+    latencies = []
+    rows = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rows = len(parallelize(data, func, cpu_limit=workers, transport=transport, backend=backend))
+        latencies.append(time.perf_counter() - start)
+    config = {'backend': backend, 'transport': transport, 'workers': workers}
+    return summarize('parallelize', config, rows, latencies)
+
+
+def run(args) -> dict:
+    start = time.perf_counter()
+    data = synthetic_collection(args.tracks, args.points, args.skew, args.seed)
+    setup_seconds = time.perf_counter() - start
+
+    results = [bench_calculate_distance(data, args.repeats)]
+    for workers, backend, transport in itertools.product(args.workers, args.backends, args.transports):
+        results.append(bench_parallelize(data, args.repeats, workers, backend, transport))
+        print(json.dumps(results[-1]), file=sys.stderr)
+
+    return {
+        'dataset': {
+            'tracks': args.tracks,
+            'points_per_track': args.points,
+            'skew': args.skew,
+            'seed': args.seed,
+            'setup_seconds': setup_seconds,
+        },
+        'environment': {
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'sleep_seconds': float(os.environ['DISTANCE_SLEEP_SECONDS']),
+        },
+        'results': results,
+    }
+
+
+def parse_args(argv=None):
+    def int_list(value: str) -> list:
+        return [int(item) for item in value.split(',')]
+
+    def str_list(value: str) -> list:
+        return value.split(',')
+
+    parser = argparse.ArgumentParser(description='Benchmark of the distance pipeline on synthetic data')
+    parser.add_argument('--tracks', type=int, default=50, help='number of tracks')
+    parser.add_argument('--points', type=int, default=2000, help='average number of locations per track')
+    parser.add_argument('--skew', type=float, default=1.0, help='Zipf exponent of the track sizes (0: equal sizes)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=5, help='repetitions per configuration')
+    parser.add_argument('--workers', type=int_list, default=[1, 2, 4], help='comma separated worker counts')
+    parser.add_argument('--backends', type=str_list, default=['serial', 'threads', 'processes', 'auto'])
+    parser.add_argument('--transports', type=str_list, default=['pickle', 'shared_memory'])
+    parser.add_argument('--sleep', type=float, default=0, help='artificial sleep per track in calculate_distance')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    # set before any worker process is started, so the workers inherit it
+    os.environ['DISTANCE_SLEEP_SECONDS'] = str(arguments.sleep)
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    report = run(arguments)
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,129 @@
+"""
+Start-up benchmark: import time of the app run in the parent process and in a pool worker, measured with
+`python -X importtime` in fresh interpreters, checked against a budget.
+
+Example:
+    python -m benchmarks.startup --repeats 5 --output startup.json
+
+Only the modules imported by the measured statement count, not those the interpreter imports at start-up anyway.
+The exit code is 1 if a target exceeds its budget. The test suite checks the default budgets as well
+(tests/app/test_startup.py), so import time regressions fail the tests.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# default budgets: about twice the import time on a current laptop, movingpandas in the parent would exceed them;
+# checked by tests/app/test_startup.py
+PARENT_BUDGET_MS = 500
+WORKER_BUDGET_MS = 1500
+
+# what `sdk.py` imports before the input is read
+PARENT_STATEMENT = 'import sdk.moveapps_execution, app.app'
+# what a worker imports before its first task: the preloaded modules and the modules of the task functions
+WORKER_STATEMENT = (
+    'import importlib, sdk.moveapps_pool\n'
+    'for module in sdk.moveapps_pool.preload_modules(): importlib.import_module(module)\n'
+    'import app.parallel, app.movement_metrics'
+)
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    :param stderr: output of `python -X importtime`
+    :return: (module, self microseconds, cumulative microseconds, depth) of each imported module, in import order
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+def import_profile(statement: str, env: dict | None = None) -> list:
+    """
+    :return: the modules imported by `statement` in a fresh interpreter, see `parse_importtime`; the modules the
+        interpreter imports at start-up are left out
+    """
+    def run(code: str) -> list:
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=ROOT_DIR, env={**os.environ, **(env or {})}, capture_output=True, text=True, check=True
+        )
+        return parse_importtime(completed.stderr)
+
+    baseline = {module for module, _, _, _ in run('pass')}
+    return [entry for entry in run(statement) if entry[0] not in baseline]
+
+
+def measure(name: str, statement: str, repeats: int, budget_ms: float | None, top: int, env: dict | None = None) \
+        -> dict:
+    """
+    :return: the fastest of `repeats` runs (the least disturbed by other load): total import time of the top-level
+        imports, the slowest modules (self time) and whether the budget is kept
+    """
+    runs = [import_profile(statement, env) for _ in range(repeats)]
+    totals = [sum(cumulative for _, _, cumulative, depth in modules if depth == 0) / 1000 for modules in runs]
+    best = min(range(len(runs)), key=totals.__getitem__)
+    slowest = sorted(runs[best], key=lambda entry: entry[1], reverse=True)[:top]
+    return {
+        'target': name,
+        'statement': statement,
+        'import_ms': totals[best],
+        'all_runs_ms': totals,
+        'modules': len(runs[best]),
+        'slowest_modules': [{'module': module, 'self_ms': self_us / 1000} for module, self_us, _, _ in slowest],
+        'budget_ms': budget_ms,
+        'within_budget': budget_ms is None or totals[best] <= budget_ms,
+    }
+
+
+def run(args) -> dict:
+    env = {'POOL_PRELOAD': args.preload} if args.preload is not None else None
+    results = [
+        measure('parent', PARENT_STATEMENT, args.repeats, args.parent_budget_ms, args.top),
+        measure('worker', WORKER_STATEMENT, args.repeats, args.worker_budget_ms, args.top, env),
+    ]
+    for result in results:
+        exceeded = '' if result['within_budget'] else f' (budget of {result["budget_ms"]:.0f} ms exceeded)'
+        print(f'{result["target"]}: {result["import_ms"]:.0f} ms for {result["modules"]} modules{exceeded}',
+              file=sys.stderr)
+    return {
+        'environment': {
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Import time of the app run in the parent and in a pool worker')
+    parser.add_argument('--repeats', type=int, default=5, help='runs per target, the fastest one counts')
+    parser.add_argument('--parent-budget-ms', type=float, default=PARENT_BUDGET_MS,
+                        help='maximum import time of the parent process')
+    parser.add_argument('--worker-budget-ms', type=float, default=WORKER_BUDGET_MS,
+                        help='maximum import time of a pool worker')
+    parser.add_argument('--preload', help='modules preloaded by the workers (env variable POOL_PRELOAD)')
+    parser.add_argument('--top', type=int, default=10, help='number of slowest modules to report')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    report = run(arguments)
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    sys.exit(0 if all(result['within_budget'] for result in report['results']) else 1)
@@ -0,0 +1,474 @@
+"""
+Task broker for worker processes on other hosts, built on `multiprocessing.managers`.
+
+The app run starts a `BrokerPool`: a manager server that holds the queue of tasks and the queue of results.
+Workers connect to it over TCP, pull tasks, run them and push the results back (see `run_worker`). A worker can be
+started on any host that has the app installed and reaches the broker:
+
+    BROKER_AUTHKEY=secret python -m sdk.moveapps_broker broker-host:50000
+
+A task whose worker stops sending heartbeats (host down, process killed) is handed to another worker; so is a task
+that raised an error, which might be caused by the host, and a task that runs longer than its timeout. A worker whose
+task exceeds the timeout stops itself to end the task and is started again. A task that failed on `retries + 1`
+workers is given up: its result is a `TaskFailure` and the other tasks go on.
+
+Tasks and results are pickled by the parent and the workers, the broker only passes on bytes. To keep the data off
+the broker, the app run and the workers share a directory (`BrokerPool.data_dir`): the data is written there once and
+the tasks only say which rows to read.
+"""
+import argparse
+import logging
+import multiprocessing as mp
+import os
+import pickle
+import secrets
+import socket
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from multiprocessing.managers import BaseManager
+
+# how often a worker reports that it is alive, and after how many seconds without a report its tasks are reassigned
+HEARTBEAT_SECONDS = 1.0
+LEASE_SECONDS = 30.0
+# how long the parent waits for results before it checks the leases
+POLL_SECONDS = 0.2
+# returned by `BrokerState.fetch` when the broker is closed
+STOP = 'stop'
+# exit code of a worker that stopped itself because its task exceeded the timeout
+TIMEOUT_EXIT_CODE = 3
+# hosts only reachable from this host
+LOOPBACK_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+
+@dataclass(frozen=True)
+class TaskFailure:
+    """Result of a task that failed on `retries + 1` workers: it raised an error, its worker got lost or it timed out"""
+    task: object
+    error: str
+    attempts: int
+
+
+class BrokerState:
+    """
+    Queues of the broker, living in the manager server. Tasks handed to a worker stay leased to it until the worker
+    delivers the result, so they can be reassigned if the worker disappears or the task exceeds its timeout.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending = deque()
+        self._leases = {}
+        self._results = deque()
+        self._heartbeats = {}
+        self._closed = False
+
+    def submit(self, task_id, payload: bytes, task_timeout: float | None = None):
+        """
+        :param task_timeout: seconds the task may run (optional)
+        """
+        with self._condition:
+            self._pending.append((task_id, payload, task_timeout))
+            self._condition.notify_all()
+
+    def fetch(self, worker_id: str, timeout: float):
+        """
+        :return: (task ID, payload, task timeout) of the next task, `None` if there is none within the timeout or
+            `STOP`
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._heartbeats[worker_id] = time.monotonic()
+            while not self._pending and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            if self._closed:
+                return STOP
+            task_id, payload, task_timeout = self._pending.popleft()
+            self._leases[task_id] = (worker_id, task_timeout, time.monotonic())
+            return task_id, payload, task_timeout
+
+    def complete(self, worker_id: str, task_id, error: str | None, result: bytes | None):
+        """
+        :param error: the error of the task as string, `None` if it succeeded
+        :param result: the pickled result
+        """
+        with self._condition:
+            # a task reassigned meanwhile is delivered by whichever worker finishes first
+            if self._leases.pop(task_id, None) is None:
+                return
+            self._results.append((task_id, worker_id, error, result))
+            self._condition.notify_all()
+
+    def results(self, timeout: float) -> list:
+        """
+        :return: the results delivered so far, (task ID, worker ID, error, pickled result) each; waits up to
+            `timeout` seconds for the first one
+        """
+        with self._condition:
+            if not self._results:
+                self._condition.wait(timeout)
+            results = list(self._results)
+            self._results.clear()
+            return results
+
+    def heartbeat(self, worker_id: str):
+        with self._condition:
+            self._heartbeats[worker_id] = time.monotonic()
+
+    def expire(self, lease_seconds: float) -> list:
+        """
+        Takes back the tasks that exceeded their timeout and those of the workers that did not report within
+        `lease_seconds`
+        :return: (task ID, worker ID, whether the task timed out) of each task taken back
+        """
+        now = time.monotonic()
+        with self._condition:
+            lost = []
+            for task_id, (worker_id, task_timeout, started) in self._leases.items():
+                if task_timeout is not None and now - started > task_timeout:
+                    lost.append((task_id, worker_id, True))
+                elif now - self._heartbeats.get(worker_id, 0) > lease_seconds:
+                    lost.append((task_id, worker_id, False))
+            for task_id, _, _ in lost:
+                del self._leases[task_id]
+            return lost
+
+    def release(self, worker_id: str) -> list:
+        """
+        Takes back the tasks of a worker known to be gone
+        :return: the IDs of the tasks taken back
+        """
+        with self._condition:
+            self._heartbeats.pop(worker_id, None)
+            released = [task_id for task_id, (leased_to, _, _) in self._leases.items() if leased_to == worker_id]
+            for task_id in released:
+                del self._leases[task_id]
+            return released
+
+    def workers(self, max_age: float) -> int:
+        """
+        :return: number of workers that reported within `max_age` seconds
+        """
+        now = time.monotonic()
+        with self._condition:
+            return sum(1 for seen in self._heartbeats.values() if now - seen <= max_age)
+
+    def close(self):
+        """
+        Lets the workers stop; tasks not yet fetched are dropped
+        """
+        with self._condition:
+            self._closed = True
+            self._pending.clear()
+            self._condition.notify_all()
+
+
+_state = None
+
+
+def _broker_state() -> BrokerState:
+    # called in the manager server, which holds a single broker
+    global _state
+    if _state is None:
+        _state = BrokerState()
+    return _state
+
+
+class _BrokerManager(BaseManager):
+    pass
+
+
+_BrokerManager.register('broker', callable=_broker_state)
+
+
+def parse_address(address: str) -> tuple:
+    """
+    :param address: `host:port`
+    :return: (host, port)
+    """
+    host, _, port = address.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f'Invalid broker address \'{address}\', expected host:port')
+    return host, int(port)
+
+
+def _authkey(authkey: bytes | str | None) -> bytes | None:
+    if authkey is None:
+        authkey = os.environ.get('BROKER_AUTHKEY')
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+
+def _connect(address: tuple, authkey: bytes, wait: float) -> _BrokerManager:
+    deadline = time.monotonic() + wait
+    while True:
+        manager = _BrokerManager(address=address, authkey=authkey)
+        try:
+            manager.connect()
+            return manager
+        except (ConnectionRefusedError, FileNotFoundError):
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(HEARTBEAT_SECONDS)
+
+
+def _send_heartbeats(address: tuple, authkey: bytes, worker_id: str, stopped: threading.Event, running: dict):
+    # a connection of its own: proxies must not be shared between threads
+    try:
+        broker = _connect(address, authkey, 0).broker()
+        while not stopped.wait(HEARTBEAT_SECONDS):
+            deadline = running.get('deadline')
+            if deadline is not None and time.monotonic() > deadline:
+                # only ending the process stops the task, the broker hands it to another worker
+                logging.warning(f'Worker {worker_id} stops: task {running["task_id"]} exceeded its timeout')
+                os._exit(TIMEOUT_EXIT_CODE)
+            broker.heartbeat(worker_id)
+    except (OSError, EOFError):
+        pass
+
+
+def run_worker(address: tuple, authkey: bytes | str | None = None, wait: float = 0) -> int:
+    """
+    Runs the tasks of a broker until the broker is closed or can not be reached anymore. The process exits with
+    `TIMEOUT_EXIT_CODE` when a task exceeds its timeout.
+    :param address: (host, port) of the broker
+    :param authkey: shared secret of the broker (default: env variable `BROKER_AUTHKEY`)
+    :param wait: seconds to wait for the broker to come up
+    :return: number of tasks run
+    """
+    authkey = _authkey(authkey)
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    broker = _connect(address, authkey, wait).broker()
+    logging.info(f'Worker {worker_id} connected to broker {address[0]}:{address[1]}')
+    stopped = threading.Event()
+    # the task being run and when it has to be done, checked by the heartbeat thread
+    running = {'task_id': None, 'deadline': None}
+    heartbeats = threading.Thread(target=_send_heartbeats, args=(address, authkey, worker_id, stopped, running),
+                                  daemon=True)
+    heartbeats.start()
+    done = 0
+    try:
+        while True:
+            task = broker.fetch(worker_id, HEARTBEAT_SECONDS)
+            if task is None:
+                continue
+            if task == STOP:
+                break
+            task_id, payload, task_timeout = task
+            running['task_id'] = task_id
+            running['deadline'] = time.monotonic() + task_timeout if task_timeout is not None else None
+            try:
+                function, argument = pickle.loads(payload)
+                error, result = None, pickle.dumps(function(argument), protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception as exception:
+                error, result = f'{type(exception).__name__}: {exception}', None
+            running['deadline'] = None
+            broker.complete(worker_id, task_id, error, result)
+            done += 1
+    except (OSError, EOFError):
+        logging.info(f'Worker {worker_id} lost the connection to the broker')
+    finally:
+        stopped.set()
+    logging.info(f'Worker {worker_id} stopped after {done} tasks')
+    return done
+
+
+def _run_logged_worker(address: tuple, authkey: bytes | str | None, wait: float):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    run_worker(address, authkey, wait)
+
+
+def run_worker_process(address: tuple, authkey: bytes | str | None = None, wait: float = 0) -> int:
+    """
+    Runs `run_worker` in a child process, started again whenever it stopped itself because its task exceeded the
+    timeout
+    :return: exit code of the last worker process
+    """
+    context = mp.get_context()
+    while True:
+        worker = context.Process(target=_run_logged_worker, args=(address, authkey, wait))
+        worker.start()
+        worker.join()
+        if worker.exitcode != TIMEOUT_EXIT_CODE:
+            return worker.exitcode
+        logging.info('Worker stopped after a timeout, starting it again')
+
+
+class BrokerPool:
+    """
+    Runs tasks on the workers connected to a broker, with the `imap_unordered` interface of a process pool.
+    Used as context manager: the broker is started on enter and closed on exit, which stops the workers.
+    Local workers that stopped (e.g. after a timeout) are replaced while tasks are pending.
+
+    Env variables:
+    - `BROKER_ADDRESS`: `host:port` the broker listens on (default: `127.0.0.1:0`, a free port on localhost);
+      use e.g. `0.0.0.0:50000` for workers on other hosts
+    - `BROKER_AUTHKEY`: shared secret of broker and workers (default: random, only local workers can connect)
+    - `BROKER_LOCAL_WORKERS`: number of worker processes started on this host (default: the number of CPUs used)
+    - `BROKER_RETRIES`: how often a task is handed to another worker after its worker failed or disappeared
+      (default `2`)
+    - `BROKER_CONNECT_TIMEOUT`: seconds to wait for the first worker (default `60`)
+    - `BROKER_DATA_DIR`: directory the app run shares with all workers at the same path, e.g. a network file system
+      (see `data_dir`); default: a temporary directory if the broker only listens on this host. Set it to an empty
+      value to send the data with the tasks.
+    """
+
+    def __init__(self, local_workers: int = 0, address: tuple | None = None, authkey: bytes | str | None = None,
+                 retries: int | None = None, lease_seconds: float = LEASE_SECONDS,
+                 connect_timeout: float | None = None, task_timeout: float | None = None,
+                 data_dir: str | None = None):
+        """
+        :param task_timeout: seconds a task may run before it is handed to another worker (optional)
+        :param data_dir: see `BROKER_DATA_DIR`
+        """
+        self.local_workers = local_workers
+        self.address = address or parse_address(os.environ.get('BROKER_ADDRESS', '127.0.0.1:0'))
+        self._authkey = _authkey(authkey) or secrets.token_bytes(16)
+        self.retries = retries if retries is not None else int(os.environ.get('BROKER_RETRIES', 2))
+        self.lease_seconds = lease_seconds
+        self.connect_timeout = connect_timeout if connect_timeout is not None \
+            else float(os.environ.get('BROKER_CONNECT_TIMEOUT', 60))
+        self.task_timeout = task_timeout
+        # where the data of the tasks is written for the workers to read it, `None` if it is sent with the tasks
+        self.data_dir = data_dir if data_dir is not None else os.environ.get('BROKER_DATA_DIR')
+        self._own_data_dir = None
+        self._manager = None
+        self._broker = None
+        self._workers = []
+        self._run = 0
+
+    def start(self):
+        self._manager = _BrokerManager(address=self.address, authkey=self._authkey)
+        self._manager.start()
+        self.address = self._manager.address
+        self._broker = self._manager.broker()
+        if self.data_dir is None and self.address[0] in LOOPBACK_HOSTS:
+            # only workers on this host can connect, they all reach its temporary directory
+            self._own_data_dir = tempfile.mkdtemp(prefix='broker-')
+            self.data_dir = self._own_data_dir
+        self.data_dir = self.data_dir or None
+        logging.info(f'Broker listening on {self.address[0]}:{self.address[1]}, '
+                     f'starting {self.local_workers} local workers, '
+                     f'{"data sent with the tasks" if self.data_dir is None else f"data shared in {self.data_dir}"}')
+        for _ in range(self.local_workers):
+            self._workers.append(self._start_worker())
+
+    def _start_worker(self) -> mp.Process:
+        worker = mp.get_context().Process(target=run_worker, args=(self.address, self._authkey), daemon=True)
+        worker.start()
+        return worker
+
+    def _replace_stopped_workers(self) -> list:
+        """
+        :return: (task ID, worker ID, error) of each task of a local worker that stopped; the worker is replaced
+        """
+        lost = []
+        for index, worker in enumerate(self._workers):
+            if worker.exitcode is None:
+                continue
+            logging.warning(f'Local worker {worker.pid} stopped with exit code {worker.exitcode}, starting a new one')
+            # the ID the worker reports with, see `run_worker`
+            worker_id = f'{socket.gethostname()}:{worker.pid}'
+            error = f'timeout after {self.task_timeout:g} s' if worker.exitcode == TIMEOUT_EXIT_CODE \
+                else f'worker stopped with exit code {worker.exitcode}'
+            lost.extend((task_id, worker_id, error) for task_id in self._broker.release(worker_id))
+            self._workers[index] = self._start_worker()
+        return lost
+
+    def imap_unordered(self, function, tasks):
+        """
+        Every task is pickled together with `function` and sent through the broker; tasks that hold only the
+        location of their data in `data_dir` keep the data off the broker
+        :return: generator of the results of `function(task)` in the order they arrive; a `TaskFailure` for a task
+            that failed on `retries + 1` workers
+        :raise RuntimeError: if no worker connected in time
+        """
+        self._run += 1
+        run = self._run
+        pending = {}
+        for index, task in enumerate(tasks):
+            payload = pickle.dumps((function, task), protocol=pickle.HIGHEST_PROTOCOL)
+            pending[index] = (task, payload, 1)
+            self._broker.submit((run, index), payload, self.task_timeout)
+        started = time.monotonic()
+        while pending:
+            for (task_run, index), worker_id, error, result in self._broker.results(POLL_SECONDS):
+                if task_run != run or index not in pending:
+                    continue
+                if error is None:
+                    del pending[index]
+                    yield pickle.loads(result)
+                else:
+                    yield from self._retry(run, index, pending, worker_id, error)
+            lost = [(task_id, worker_id, f'timeout after {self.task_timeout:g} s' if timed_out else 'worker lost')
+                    for task_id, worker_id, timed_out in self._broker.expire(self.lease_seconds)]
+            lost.extend(self._replace_stopped_workers())
+            for (task_run, index), worker_id, error in lost:
+                if task_run == run and index in pending:
+                    yield from self._retry(run, index, pending, worker_id, error)
+            if self._broker.workers(self.lease_seconds) == 0 and time.monotonic() - started > self.connect_timeout:
+                raise RuntimeError(f'No worker connected to the broker at {self.address[0]}:{self.address[1]} '
+                                   f'within {self.connect_timeout:g} s')
+
+    def _retry(self, run: int, index: int, pending: dict, worker_id: str, error: str):
+        """
+        Hands a task that failed to another worker
+        :return: generator of the `TaskFailure` of the task if it failed on `retries + 1` workers
+        """
+        task, payload, attempts = pending[index]
+        if attempts > self.retries:
+            logging.warning(f'Task {index} failed on worker {worker_id}: {error} (attempt {attempts}), giving up')
+            del pending[index]
+            yield TaskFailure(task=task, error=error, attempts=attempts)
+            return
+        logging.warning(f'Task {index} failed on worker {worker_id}: {error}, handing it to another worker '
+                        f'(attempt {attempts})')
+        pending[index] = (task, payload, attempts + 1)
+        self._broker.submit((run, index), payload, self.task_timeout)
+
+    def shutdown(self):
+        if self._broker is not None:
+            try:
+                self._broker.close()
+            except (OSError, EOFError):
+                pass
+        for worker in self._workers:
+            worker.join(HEARTBEAT_SECONDS * 5)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
+        if self._manager is not None:
+            self._manager.shutdown()
+        self._manager = None
+        self._broker = None
+        if self._own_data_dir is not None:
+            shutil.rmtree(self._own_data_dir, ignore_errors=True)
+            self.data_dir = self._own_data_dir = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Worker that runs the tasks of a broker')
+    parser.add_argument('address', help='host:port of the broker')
+    parser.add_argument('--wait', type=float, default=60, help='seconds to wait for the broker to come up')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    arguments = parse_args()
+    if os.environ.get('BROKER_AUTHKEY') is None:
+        sys.exit('Set the shared secret of the broker in the env variable BROKER_AUTHKEY')
+    sys.exit(run_worker_process(parse_address(arguments.address), wait=arguments.wait))
@@ -1,10 +1,18 @@
-import pandas as pd
 import json
 import os
 import logging
-import pluggy
 from dotenv import load_dotenv
 from dataclasses import dataclass
+from typing import TYPE_CHECKING
+from sdk.moveapps_formats import PICKLE, TrajectoryWriter, describe, detect_format, iter_trajectories, read_trajectories, \
+    write_pickle, write_trajectories
+from sdk.moveapps_failures import FailureManifest
+from sdk.moveapps_instrumentation import Instrumentation
+from sdk.moveapps_pool import MoveAppsPool
+from sdk.moveapps_track_index import TrackIndexCollector
+
+if TYPE_CHECKING:
+    import pluggy
 
 
 @dataclass
@@ -13,31 +21,58 @@ class Environment:
     output_file: str
     error_file: str
     app_configuration: dict
+    source_columns: list | None = None
+    output_pickle_file: str | None = None
+    stream_batch_rows: int | None = None
+    stream_prefetch: int = 1
+    chain_hooks: bool = False
 
 
 class MoveAppsExecutor:
 
-    def __init__(self, plugin_manager: pluggy.PluginManager):
+    def __init__(self, plugin_manager: 'pluggy.PluginManager'):
         load_dotenv()
         self._pm = plugin_manager
 
     def execute(self):
+        instrumentation = Instrumentation()
+        # tracks that failed without failing the run
+        failures = FailureManifest()
         try:
             self.__configure_logging()
-            self.__load_environment()
-            data = self.__load_input()
-            output = self.__call_app(data)
-            self.__store_output(output)
+            with instrumentation, failures:
+                with instrumentation.stage('load_environment'):
+                    self.__load_environment()
+                # worker pool shared by all parallel stages of this run
+                if self.env.stream_batch_rows:
+                    with MoveAppsPool(), instrumentation.stage('stream'):
+                        self.__stream()
+                else:
+                    with MoveAppsPool():
+                        with instrumentation.stage('load_input'):
+                            data = self.__load_input()
+                        with instrumentation.stage('call_app'):
+                            output = self.__call_app(data)
+                    with instrumentation.stage('store_output'):
+                        self.__store_output(output)
         except Exception as exception:
             self.__store_error(exception)
             raise exception
+        finally:
+            self.__store_instrumentation(instrumentation)
+            self.__store_failures(failures)
 
     def __load_environment(self):
         self.env = Environment(
             source_file=os.environ.get('SOURCE_FILE'),
             output_file=os.environ.get('OUTPUT_FILE', 'resources/output/output.pickle'),
             error_file=os.environ.get('ERROR_FILE', 'resources/output/error.txt'),
-            app_configuration=self.__load_config()
+            app_configuration=self.__load_config(),
+            source_columns=self.__load_source_columns(),
+            output_pickle_file=os.environ.get('OUTPUT_PICKLE_FILE'),
+            stream_batch_rows=int(os.environ.get('STREAM_BATCH_ROWS') or 0) or None,
+            stream_prefetch=int(os.environ.get('STREAM_PREFETCH', 1)),
+            chain_hooks=os.environ.get('CHAIN_HOOKS', 'no') == 'yes'
         )
 
     @staticmethod
@@ -49,7 +84,14 @@ class MoveAppsExecutor:
         )
 
     def __load_input(self):
-        return pd.read_pickle(self.env.source_file)
+        return read_trajectories(self.env.source_file, columns=self.env.source_columns)
+
+    @staticmethod
+    def __load_source_columns():
+        # columns of a GeoParquet/Arrow input to read in addition to geometry, time and track ID
+        if 'SOURCE_COLUMNS' not in os.environ:
+            return None
+        return [column.strip() for column in os.environ['SOURCE_COLUMNS'].split(',') if column.strip()]
 
     @staticmethod
     def __load_config():
@@ -64,14 +106,93 @@ class MoveAppsExecutor:
         return parsed
 
     def __store_output(self, data):
-        logging.info(f'storing output: {data}')
-        pd.to_pickle(data, self.env.output_file)
+        # only a summary: formatting the whole data would take longer than writing it
+        logging.info(f'storing output: {describe(data)}')
+        if data is None and detect_format(self.env.output_file) != PICKLE:
+            logging.warning(f'no output data, nothing written to {self.env.output_file}')
+        else:
+            write_trajectories(
+                data,
+                self.env.output_file,
+                compression=os.environ.get('OUTPUT_COMPRESSION'),
+                out_of_band=os.environ.get('OUTPUT_PICKLE_OUT_OF_BAND', 'no') == 'yes'
+            )
+            logging.info(f'stored output: {os.path.getsize(self.env.output_file)} bytes')
+        # a plain pickle for a downstream app that expects one
+        if self.env.output_pickle_file:
+            write_pickle(data, self.env.output_pickle_file)
+
+    def __stream(self):
+        # the input is read and the App is called batch by batch of complete tracks, every output batch is appended
+        # to the output file right away: only `stream_prefetch + 1` batches of input are in memory at once
+        if self.env.output_pickle_file:
+            logging.warning('OUTPUT_PICKLE_FILE is not supported in streaming mode and is ignored')
+        batches = iter_trajectories(
+            self.env.source_file,
+            self.env.stream_batch_rows,
+            columns=self.env.source_columns,
+            prefetch=self.env.stream_prefetch
+        )
+        # the per-track index of each output batch (if the App provides one), with offsets into the output file
+        with TrajectoryWriter(self.env.output_file) as writer, TrackIndexCollector() as track_index:
+            for index, data in enumerate(batches):
+                logging.info(f'streaming batch {index}: {describe(data)}')
+                output = self.__call_app(data)
+                if output is not None:
+                    rows_before = writer.rows
+                    writer.write(output)
+                    track_index.add(getattr(output, 'track_index', None), rows_before)
+        track_index.write()
+        if writer.rows == 0:
+            logging.warning(f'no output data, nothing written to {self.env.output_file}')
+        else:
+            logging.info(f'stored output: {writer.rows} rows, {os.path.getsize(self.env.output_file)} bytes')
 
     def __store_error(self, error: Exception):
         logging.info(f'storing error to {self.env.error_file}')
         with open(self.env.error_file, 'w') as error_file:
             error_file.write(error.__str__())
 
+    @staticmethod
+    def __store_instrumentation(instrumentation: Instrumentation):
+        if os.environ.get('INSTRUMENTATION', 'yes') != 'yes':
+            return
+        try:
+            instrumentation.write()
+        except OSError as error:
+            logging.warning(f'could not store instrumentation report: {error}')
+
+    @staticmethod
+    def __store_failures(failures: FailureManifest):
+        try:
+            path = failures.write()
+        except OSError as error:
+            logging.warning(f'could not store failure manifest: {error}')
+            return
+        if path is not None:
+            logging.warning(f'{len(failures.failures)} track(s) failed, see {path}')
+
     def __call_app(self, data):
+        if self.env.chain_hooks:
+            return self.__call_chain(data)
         outputs = self._pm.hook.execute(data=data, config=self.env.app_configuration)
         return outputs[0]
+
+    def __call_chain(self, data):
+        # the hooks run one after the other in registration order, each on the output of the previous one: the data
+        # stays in this process, and the worker pool and the cached track views are shared by all steps
+        instrumentation = Instrumentation.current()
+        hooks = self._pm.hook.execute.get_hookimpls()
+        for step, hook in enumerate(hooks):
+            name = f'call_app:{step}:{type(hook.plugin).__name__}'
+            if data is None:
+                logging.warning(f'no output data after step {step - 1}, skipping the remaining {len(hooks) - step} '
+                                f'step(s)')
+                break
+            logging.info(f'chained step {step}: {name} on {describe(data)}')
+            if instrumentation is not None:
+                with instrumentation.stage(name):
+                    data = hook.function(data=data, config=self.env.app_configuration)
+            else:
+                data = hook.function(data=data, config=self.env.app_configuration)
+        return data
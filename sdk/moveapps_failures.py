@@ -0,0 +1,50 @@
+import json
+from sdk.moveapps_io import MoveAppsIo
+
+
+class FailureManifest:
+    """
+    Collects the tracks that could not be processed in an app run (errors and timeouts after all retries),
+    so the run can finish with the other tracks. Written as artifact `failures.json` if there are any failures.
+    """
+
+    _current = None
+
+    def __init__(self):
+        self.failures = []
+        self._previous = None
+
+    @classmethod
+    def current(cls) -> 'FailureManifest | None':
+        """
+        :return: the manifest of the active app run or `None` if there is no active run
+        """
+        return cls._current
+
+    def record(self, stage: str, failures: list):
+        """
+        :param stage: name of the stage the tracks failed in
+        :param failures: one dict per failed track, e.g. with track ID, error and number of attempts; logging them is
+            left to the caller
+        """
+        self.failures.extend({'stage': stage, **failure} for failure in failures)
+
+    def write(self, artifact_file_name: str = 'failures.json') -> str | None:
+        """
+        :return: path of the artifact or `None` if nothing failed
+        """
+        if not self.failures:
+            return None
+        path = MoveAppsIo.create_artifacts_file(artifact_file_name)
+        with open(path, 'w') as file:
+            json.dump({'failed_tracks': len(self.failures), 'failures': self.failures}, file, indent=2, default=str)
+        return path
+
+    def __enter__(self):
+        self._previous = FailureManifest._current
+        FailureManifest._current = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        FailureManifest._current = self._previous
+        self._previous = None
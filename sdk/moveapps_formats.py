@@ -0,0 +1,594 @@
+import contextlib
+import gzip
+import importlib
+import io
+import json
+import logging
+import os
+import pickle
+import queue
+import struct
+import sys
+import tempfile
+import threading
+from typing import TYPE_CHECKING
+
+# pandas, geopandas and movingpandas are imported on first use: they make up most of the start-up time
+if TYPE_CHECKING:
+    import geopandas as gpd
+    from movingpandas import TrajectoryCollection
+
+PICKLE = 'pickle'
+PARQUET = 'parquet'
+ARROW = 'arrow'
+
+_EXTENSIONS = {
+    '.parquet': PARQUET,
+    '.geoparquet': PARQUET,
+    '.arrow': ARROW,
+    '.feather': ARROW,
+    '.ipc': ARROW,
+}
+
+# key of the trajectory metadata in the `attrs` of the point data (stored in the file schema metadata)
+METADATA_KEY = 'moveapps'
+
+# start of a pickle written with out-of-band buffers (readable by `read_trajectories` only)
+OUT_OF_BAND_MAGIC = b'MAPKL5OB'
+_LENGTH = struct.Struct('<Q')
+
+# magic bytes of the streaming compression formats
+_COMPRESSION_MAGIC = {
+    'gzip': b'\x1f\x8b',
+    'zstd': b'\x28\xb5\x2f\xfd',
+    'lz4': b'\x04\x22\x4d\x18',
+}
+
+
+def detect_format(path: str) -> str:
+    """
+    :param path: path of an input or output file
+    :return: `parquet` (GeoParquet), `arrow` (Arrow IPC / Feather) or `pickle`, by file extension
+    """
+    return _EXTENSIONS.get(os.path.splitext(path)[1].lower(), PICKLE)
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as error:
+        raise ImportError('Reading and writing GeoParquet/Arrow files requires the package `pyarrow`') from error
+    return pyarrow
+
+
+def _read_schema_metadata(path: str, file_format: str) -> dict:
+    """
+    Reads the trajectory metadata from the file schema without loading any data
+    """
+    pa = _require_pyarrow()
+    if file_format == PARQUET:
+        import pyarrow.parquet as pq
+        schema = pq.read_schema(path, memory_map=True)
+    else:
+        with pa.memory_map(path) as source:
+            schema = pa.ipc.open_file(source).schema
+    attrs = json.loads((schema.metadata or {}).get(b'PANDAS_ATTRS', b'{}'))
+    if METADATA_KEY not in attrs:
+        raise ValueError(f'{path} has no trajectory metadata, it must be written by `write_trajectories`')
+    return {**attrs[METADATA_KEY], 'columns': schema.names}
+
+
+def _optional_module(name: str):
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def resolve_compression(compression: str | None) -> str | None:
+    """
+    :param compression: `zstd`, `lz4`, `gzip`, `auto` (zstd or lz4 if installed, gzip otherwise) or `None`/`none`
+    :return: the compression to use or `None`
+    """
+    if compression in (None, '', 'none'):
+        return None
+    if compression == 'auto':
+        if _optional_module('zstandard') is not None:
+            return 'zstd'
+        if _optional_module('lz4.frame') is not None:
+            return 'lz4'
+        return 'gzip'
+    if compression not in _COMPRESSION_MAGIC:
+        raise ValueError(f'Unknown compression \'{compression}\', expected one of {list(_COMPRESSION_MAGIC)} or auto')
+    return compression
+
+
+@contextlib.contextmanager
+def _compressed_writer(raw, compression: str | None):
+    if compression is None:
+        yield raw
+    elif compression == 'zstd':
+        with _optional_module('zstandard').ZstdCompressor().stream_writer(raw, closefd=False) as stream:
+            yield stream
+    elif compression == 'lz4':
+        with _optional_module('lz4.frame').LZ4FrameFile(raw, mode='wb') as stream:
+            yield stream
+    else:
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as stream:
+            yield stream
+
+
+@contextlib.contextmanager
+def _decompressed_reader(raw):
+    head = raw.peek(4)[:4]
+    if head.startswith(_COMPRESSION_MAGIC['zstd']):
+        zstandard = _optional_module('zstandard')
+        if zstandard is None:
+            raise ImportError('Reading zstd compressed files requires the package `zstandard`')
+        with zstandard.ZstdDecompressor().stream_reader(raw, closefd=False) as stream:
+            yield stream
+    elif head.startswith(_COMPRESSION_MAGIC['lz4']):
+        lz4_frame = _optional_module('lz4.frame')
+        if lz4_frame is None:
+            raise ImportError('Reading lz4 compressed files requires the package `lz4`')
+        with lz4_frame.LZ4FrameFile(raw, mode='rb') as stream:
+            yield stream
+    elif head.startswith(_COMPRESSION_MAGIC['gzip']):
+        with gzip.GzipFile(fileobj=raw, mode='rb') as stream:
+            yield stream
+    else:
+        yield raw
+
+
+def _read_exactly(stream, size: int) -> bytearray:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    position = 0
+    while position < size:
+        read = stream.readinto(view[position:])
+        if not read:
+            raise EOFError('unexpected end of pickle file')
+        position += read
+    return buffer
+
+
+def _read_length(stream) -> int:
+    return _LENGTH.unpack(_read_exactly(stream, _LENGTH.size))[0]
+
+
+def read_pickle(path: str):
+    """
+    Reads a pickle written by `write_pickle` (compressed and/or with out-of-band buffers) or any plain pickle
+    :param path: path of the file
+    :return: the unpickled object
+    """
+    with open(path, 'rb') as raw, _decompressed_reader(raw) as decompressed:
+        stream = raw if decompressed is raw else io.BufferedReader(decompressed)
+        if stream.peek(len(OUT_OF_BAND_MAGIC))[:len(OUT_OF_BAND_MAGIC)] != OUT_OF_BAND_MAGIC:
+            # plain pickles are left to pandas, which handles compatibility with older pandas versions
+            if stream is raw:
+                import pandas as pd
+                return pd.read_pickle(path)
+            return pickle.load(stream)
+        stream.read(len(OUT_OF_BAND_MAGIC))
+        header = _read_exactly(stream, _read_length(stream))
+        buffers = [_read_exactly(stream, _read_length(stream)) for _ in range(_read_length(stream))]
+        return pickle.loads(header, buffers=buffers)
+
+
+def _read_umask() -> int:
+    # the umask can only be read by setting it; done once at import, before threads that create files are started
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+_UMASK = _read_umask()
+
+
+def _file_mode(path: str) -> int:
+    """
+    :return: the permissions of the existing file at `path`, else those of a newly created file (0666 minus the umask)
+    """
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+@contextlib.contextmanager
+def _atomic_path(path: str):
+    """
+    Provides a temporary path next to `path` that replaces `path` once the block finished without error.
+    The file keeps the permissions of the file it replaces, a new file gets those of a newly created file (0666 minus
+    the umask), not the 0600 of temporary files.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    descriptor, temporary = tempfile.mkstemp(prefix=f'.{name}.', suffix=os.path.splitext(name)[1], dir=directory)
+    try:
+        os.fchmod(descriptor, _file_mode(path))
+    finally:
+        os.close(descriptor)
+    try:
+        yield temporary
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def write_pickle(data, path: str, compression: str | None = None, out_of_band: bool = False):
+    """
+    Writes a pickle (protocol 5) atomically: the file only appears once it is complete
+    :param data: the object to write
+    :param path: path of the file
+    :param compression: streaming compression, see `resolve_compression`; compressed files can be read with
+        `read_pickle`, `pd.read_pickle` can read them only with matching file extension and compression package
+    :param out_of_band: write large buffers (e.g. the arrays of the data frames) out-of-band, directly from memory
+        instead of copying them into the pickle stream. Such files can only be read with `read_pickle`.
+    """
+    compression = resolve_compression(compression)
+    with _atomic_path(path) as temporary:
+        with open(temporary, 'wb') as raw, _compressed_writer(raw, compression) as stream:
+            if not out_of_band:
+                pickle.dump(data, stream, protocol=5)
+                return
+            buffers = []
+            header = pickle.dumps(data, protocol=5, buffer_callback=buffers.append)
+            stream.write(OUT_OF_BAND_MAGIC)
+            stream.write(_LENGTH.pack(len(header)))
+            stream.write(header)
+            stream.write(_LENGTH.pack(len(buffers)))
+            for buffer in buffers:
+                with buffer.raw() as view:
+                    stream.write(_LENGTH.pack(view.nbytes))
+                    stream.write(view)
+
+
+def describe(data) -> str:
+    """
+    :param data: a TrajectoryCollection (or anything else)
+    :return: a short summary that does not depend on the size of the data
+    """
+    # without movingpandas loaded, the data can not be a TrajectoryCollection
+    if 'movingpandas' not in sys.modules or not isinstance(data, sys.modules['movingpandas'].TrajectoryCollection):
+        return f'{type(data).__name__}'
+    rows = sum(len(trajectory.df) for trajectory in data.trajectories)
+    columns = len(data.trajectories[0].df.columns) if data.trajectories else 0
+    return f'TrajectoryCollection with {len(data)} tracks, {rows} rows, {columns} columns'
+
+
+def _projected_columns(path: str, metadata: dict, columns: list | None) -> list | None:
+    if columns is None:
+        return None
+    required = [metadata['t'], metadata['traj_id_col'], metadata['geometry']]
+    columns = required + [column for column in columns if column not in required]
+    missing = [column for column in columns if column not in metadata['columns']]
+    if missing:
+        raise ValueError(f'{path} does not contain the columns {missing}')
+    return columns
+
+
+def read_trajectories(path: str, columns: list | None = None) -> 'TrajectoryCollection':
+    """
+    Reads a TrajectoryCollection from a pickle, GeoParquet or Arrow IPC file.
+    Columnar files are memory-mapped and only the requested columns are read.
+    :param path: path of the file
+    :param columns: columns to read in addition to geometry, time and trajectory ID (columnar formats only);
+        `None` reads all columns
+    :return: the trajectories
+    """
+    file_format = detect_format(path)
+    if file_format == PICKLE:
+        return read_pickle(path)
+
+    import geopandas as gpd
+    from movingpandas import TrajectoryCollection
+
+    metadata = _read_schema_metadata(path, file_format)
+    traj_id_col, t = metadata['traj_id_col'], metadata['t']
+    columns = _projected_columns(path, metadata, columns)
+    logging.info(f'reading {file_format} input {path} (columns: {"all" if columns is None else columns})')
+
+    if file_format == PARQUET:
+        gdf = gpd.read_parquet(path, columns=columns, memory_map=True)
+    else:
+        gdf = gpd.read_feather(path, columns=columns, memory_map=True)
+    if gdf.index.name != t:
+        gdf = gdf.set_index(t)
+    return TrajectoryCollection(gdf, traj_id_col=traj_id_col, t=t, crs=gdf.crs)
+
+
+def _point_frame(data: 'TrajectoryCollection') -> 'gpd.GeoDataFrame':
+    """
+    :return: the point data of the trajectories with the trajectory metadata in its `attrs`
+    """
+    gdf = data.to_point_gdf().copy(deep=False)
+    gdf.attrs = {
+        **gdf.attrs,
+        METADATA_KEY: {
+            'traj_id_col': data.get_traj_id_col(),
+            't': gdf.index.name,
+            'geometry': gdf.geometry.name,
+        }
+    }
+    return gdf
+
+
+def write_trajectories(data: 'TrajectoryCollection', path: str, compression: str | None = None,
+                       out_of_band: bool = False):
+    """
+    Writes a TrajectoryCollection atomically to a pickle, GeoParquet or Arrow IPC file (by file extension).
+    Columnar files hold the point data with the time as index and the trajectory metadata in the schema.
+    :param data: the trajectories
+    :param path: path of the file
+    :param compression: compression of a pickle, see `write_pickle`
+    :param out_of_band: write a pickle with out-of-band buffers, see `write_pickle`
+    """
+    file_format = detect_format(path)
+    if file_format == PICKLE:
+        write_pickle(data, path, compression=compression, out_of_band=out_of_band)
+        return
+
+    _require_pyarrow()
+    gdf = _point_frame(data)
+    with _atomic_path(path) as temporary:
+        if file_format == PARQUET:
+            gdf.to_parquet(temporary, index=True)
+        else:
+            gdf.to_feather(temporary, index=True)
+
+
+def write_point_rows(gdf: 'gpd.GeoDataFrame', path: str):
+    """
+    Writes point data (with its index and `attrs`) to an uncompressed Arrow IPC file, from which `read_point_rows`
+    reads ranges of rows without loading the rest
+    """
+    pa = _require_pyarrow()
+
+    table = _frame_to_table(pa, gdf)
+    with _atomic_path(path) as temporary:
+        with pa.OSFile(temporary, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def read_point_rows(path: str, offset: int, length: int) -> 'gpd.GeoDataFrame':
+    """
+    :param path: a file written by `write_point_rows`
+    :return: the rows `offset:offset + length` of the point data; the file is memory-mapped, only these rows are read
+    """
+    pa = _require_pyarrow()
+
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all().slice(offset, length)
+    geometry = json.loads(table.schema.metadata[b'geo'])['primary_column']
+    return _table_to_frame(table, geometry)
+
+
+def _record_batches(path: str, file_format: str, columns: list | None, batch_rows: int):
+    pa = _require_pyarrow()
+    if file_format == PARQUET:
+        import pyarrow.parquet as pq
+        yield from pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=batch_rows, columns=columns)
+        return
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for index in range(reader.num_record_batches):
+            batch = reader.get_batch(index)
+            batch = batch if columns is None else batch.select(columns)
+            # memory-mapped slices, the rows are only read when they are converted
+            for start in range(0, batch.num_rows, batch_rows):
+                yield batch.slice(start, batch_rows)
+
+
+def _table_to_frame(table, geometry: str) -> 'gpd.GeoDataFrame':
+    """
+    Converts an Arrow table of a GeoParquet or Arrow IPC file with WKB geometries to a GeoDataFrame, restoring the
+    `attrs` stored in the schema (key `PANDAS_ATTRS`, as written by geopandas)
+    :param geometry: name of the geometry column
+    """
+    import geopandas as gpd
+
+    metadata = table.schema.metadata or {}
+    field = table.schema.field(geometry)
+    if b'ARROW:extension:name' not in (field.metadata or {}):
+        # files written by older geopandas versions only describe the geometries in the GeoParquet metadata
+        crs = json.loads(metadata.get(b'geo', b'{}')).get('columns', {}).get(geometry, {}).get('crs')
+        field = field.with_metadata({b'ARROW:extension:name': b'geoarrow.wkb',
+                                     b'ARROW:extension:metadata': json.dumps({'crs': crs}).encode()})
+        table = table.cast(table.schema.set(table.schema.get_field_index(geometry), field))
+    gdf = gpd.GeoDataFrame.from_arrow(table, geometry=geometry)
+    if b'PANDAS_ATTRS' in metadata:
+        gdf.attrs = json.loads(metadata[b'PANDAS_ATTRS'])
+    return gdf
+
+
+def _frame_to_table(pa, gdf: 'gpd.GeoDataFrame'):
+    """
+    Converts a GeoDataFrame (with its index) to an Arrow table with WKB geometries and the schema metadata of
+    geopandas: the GeoParquet metadata (key `geo`, without geometry types and bounding box, which would only be the
+    ones of the first of several appended tables) and the `attrs` (key `PANDAS_ATTRS`)
+    """
+    import geopandas as gpd
+
+    table = pa.table(gdf.to_arrow(index=True, geometry_encoding='WKB'))
+    geo = {
+        'primary_column': gdf.geometry.name,
+        'columns': {
+            column: {
+                'encoding': 'WKB',
+                'crs': gdf[column].crs.to_json_dict() if gdf[column].crs is not None else None,
+                'geometry_types': [],
+            }
+            for column in gdf.columns[gdf.dtypes == 'geometry']
+        },
+        'version': '1.0.0',
+        'creator': {'library': 'geopandas', 'version': gpd.__version__},
+    }
+    metadata = {**(table.schema.metadata or {}), b'geo': json.dumps(geo).encode()}
+    if gdf.attrs:
+        metadata[b'PANDAS_ATTRS'] = json.dumps(gdf.attrs).encode()
+    return table.replace_schema_metadata(metadata)
+
+
+def _split_track_batches(path: str, batch_rows: int, columns: list | None = None):
+    """
+    Groups the record batches of a columnar file into tables of complete tracks with at least `batch_rows` rows
+    (except for the last one); a track that continues in the next record batch is carried over
+    """
+    pa = _require_pyarrow()
+    from movingpandas import TrajectoryCollection
+
+    file_format = detect_format(path)
+    if file_format == PICKLE:
+        raise ValueError(f'Streaming needs a GeoParquet or Arrow input, {path} is a pickle')
+    metadata = _read_schema_metadata(path, file_format)
+    traj_id_col, t = metadata['traj_id_col'], metadata['t']
+    columns = _projected_columns(path, metadata, columns)
+    seen = set()
+
+    def to_collection(table) -> TrajectoryCollection:
+        gdf = _table_to_frame(table, metadata['geometry'])
+        if gdf.index.name != t:
+            gdf = gdf.set_index(t)
+        track_ids = set(gdf[traj_id_col].unique())
+        if not seen.isdisjoint(track_ids):
+            raise ValueError(f'Streaming needs the rows of {path} grouped by track, '
+                             f'tracks {sorted(seen & track_ids)} are split up')
+        seen.update(track_ids)
+        return TrajectoryCollection(gdf, traj_id_col=traj_id_col, t=t, crs=gdf.crs)
+
+    pending, pending_rows = [], 0
+    for batch in _record_batches(path, file_format, columns, batch_rows):
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        if pending_rows < batch_rows:
+            continue
+        table = pa.Table.from_batches(pending)
+        track_ids = table.column(traj_id_col).to_numpy(zero_copy_only=False)
+        # the rows of the last track may continue in the next record batch
+        other = track_ids != track_ids[-1]
+        cut = len(track_ids) - int(other[::-1].argmax()) if other.any() else 0
+        if cut == 0:
+            continue
+        yield to_collection(table.slice(0, cut))
+        pending = table.slice(cut).to_batches()
+        pending_rows = len(track_ids) - cut
+    if pending_rows > 0:
+        yield to_collection(pa.Table.from_batches(pending))
+
+
+def iter_trajectories(path: str, batch_rows: int, columns: list | None = None, prefetch: int = 1):
+    """
+    Reads a GeoParquet or Arrow IPC file as a sequence of TrajectoryCollections of complete tracks, so the file never
+    has to fit into memory as a whole. The rows of each track must be contiguous in the file, like in files written by
+    `write_trajectories` or `TrajectoryWriter`.
+    :param path: path of the file
+    :param batch_rows: number of rows per collection; a collection is larger if a single track is
+    :param columns: columns to read in addition to geometry, time and trajectory ID; `None` reads all columns
+    :param prefetch: number of collections read ahead in a background thread while the caller processes the current
+        one; at most `prefetch + 1` collections are in memory at once
+    :return: generator of TrajectoryCollections
+    """
+    if batch_rows <= 0:
+        raise ValueError(f'batch_rows must be positive, got {batch_rows}')
+    batches = _split_track_batches(path, batch_rows, columns)
+    if prefetch <= 0:
+        yield from batches
+        return
+
+    ready = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # give up once the consumer stopped, so the thread never blocks forever on a full queue
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def read():
+        try:
+            for batch in batches:
+                put(batch)
+                if stop.is_set():
+                    return
+            put(done)
+        except BaseException as error:
+            put(error)
+
+    reader = threading.Thread(target=read, name='trajectory-reader', daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = ready.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        reader.join()
+
+
+class TrajectoryWriter:
+    """
+    Appends TrajectoryCollections to a GeoParquet or Arrow IPC file (by file extension), one after the other.
+    The file is written to a temporary path first and replaces `path` only when the writer is closed without error.
+    All collections must have the same columns; the schema is taken from the first one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.format = detect_format(path)
+        if self.format == PICKLE:
+            raise ValueError(f'Appending needs a GeoParquet or Arrow output, {path} is a pickle')
+        self.rows = 0
+        self._atomic = None
+        self._schema = None
+        self._writer = None
+
+    def write(self, data: 'TrajectoryCollection'):
+        """
+        :param data: the trajectories to append
+        """
+        pa = _require_pyarrow()
+
+        table = _frame_to_table(pa, _point_frame(data))
+        if self._writer is None:
+            self._schema = table.schema
+            self._open(pa, self._schema)
+        if not table.schema.equals(self._schema, check_metadata=False):
+            table = table.cast(self._schema)
+        self._writer.write_table(table)
+        self.rows += table.num_rows
+
+    def _open(self, pa, schema):
+        self._atomic = contextlib.ExitStack()
+        temporary = self._atomic.enter_context(_atomic_path(self.path))
+        if self.format == PARQUET:
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(temporary, schema)
+        else:
+            self._writer = pa.ipc.new_file(temporary, schema)
+
+    def close(self, exc_type=None, exc_val=None, exc_tb=None):
+        """
+        Completes the file; if an exception is given, the file written so far is discarded instead
+        """
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._writer = None
+        atomic, self._atomic = self._atomic, None
+        atomic.__exit__(exc_type, exc_val, exc_tb)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(exc_type, exc_val, exc_tb)
@@ -0,0 +1,174 @@
+import cProfile
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from sdk.moveapps_io import MoveAppsIo
+
+
+def peak_rss_mb(include_children: bool = False) -> float:
+    """
+    :param include_children: also consider the (terminated and waited for) child processes, e.g. pool workers
+    :return: high-water mark of the resident memory of this process (or of its largest child) in MB since it started
+    """
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 / 1024 ** 2 if platform.system() == 'Darwin' else 1 / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if include_children:
+        peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak * scale
+
+
+def task_metrics(wall_start: float, cpu_start: float, **fields) -> dict:
+    """
+    Metrics of a task that started at the given `time.perf_counter()` and `time.thread_time()`
+    :param fields: additional fields, e.g. the number of rows
+    :return: dict with wall and CPU time, PID and peak memory of the worker
+    """
+    return {
+        **fields,
+        'wall_seconds': time.perf_counter() - wall_start,
+        'cpu_seconds': time.thread_time() - cpu_start,
+        'pid': os.getpid(),
+        'worker_peak_rss_mb': peak_rss_mb(),
+    }
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread at a fixed interval and counts the collapsed stacks
+    (`file:function;file:function ...` - the input format of flame graph tools)
+    """
+
+    def __init__(self, interval: float = 0.005, thread_id: int = None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f'{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: str):
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+
+class Instrumentation:
+    """
+    Records wall time, CPU time and peak memory of the stages of an app run and the metrics of the track tasks
+    of `parallelize`. Optionally profiles the run, see env variable `PROFILE`:
+    - `cprofile`: deterministic profile, written as artifact `profile.prof` (read it with `pstats`)
+    - `sampling`: low overhead sampling of the main thread, written as artifact `profile.folded` (collapsed stacks)
+    """
+
+    _current = None
+
+    def __init__(self, profile: str | None = None):
+        self.profile = profile if profile is not None else os.environ.get('PROFILE', '')
+        self.stages = []
+        self.tasks = []
+        self._profiler = None
+        self._previous = None
+
+    @classmethod
+    def current(cls) -> 'Instrumentation | None':
+        """
+        :return: the instrumentation of the active app run or `None` if there is no active run
+        """
+        return cls._current
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Measures the enclosed block as a stage of the run
+        :param name: name of the stage
+        """
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        peak_start = peak_rss_mb()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            entry = {
+                'stage': name,
+                'wall_seconds': time.perf_counter() - wall_start,
+                'cpu_seconds': time.process_time() - cpu_start,
+                # the high-water mark only grows: the process peak so far and how much the stage raised it
+                'process_peak_rss_mb': peak_rss_mb(),
+            }
+            entry['peak_rss_growth_mb'] = entry['process_peak_rss_mb'] - peak_start
+            if failed:
+                entry['failed'] = True
+            self.stages.append(entry)
+            logging.info(f'stage {name}: {entry["wall_seconds"]:.3f} s wall, {entry["cpu_seconds"]:.3f} s CPU, '
+                         f'process peak RSS {entry["process_peak_rss_mb"]:.0f} MB (+{entry["peak_rss_growth_mb"]:.0f} MB)')
+
+    def record_tasks(self, stage: str, tasks: list):
+        """
+        :param stage: name of the parallel stage
+        :param tasks: one dict of metrics per track task (e.g. rows, wall_seconds, cpu_seconds, pid)
+        """
+        self.tasks.extend({'stage': stage, **task} for task in tasks)
+
+    def report(self) -> dict:
+        return {
+            'stages': self.stages,
+            'tasks': self.tasks,
+            'profile': self.profile or None,
+        }
+
+    def write(self, artifact_file_name: str = 'instrumentation.json'):
+        """
+        Writes the report (and the profile, if enabled) as app artifacts
+        """
+        with open(MoveAppsIo.create_artifacts_file(artifact_file_name), 'w') as file:
+            json.dump(self.report(), file, indent=2, default=str)
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.dump_stats(MoveAppsIo.create_artifacts_file('profile.prof'))
+        elif isinstance(self._profiler, SamplingProfiler):
+            self._profiler.write(MoveAppsIo.create_artifacts_file('profile.folded'))
+
+    def __enter__(self):
+        self._previous = Instrumentation._current
+        Instrumentation._current = self
+        if self.profile == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == 'sampling':
+            self._profiler = SamplingProfiler(float(os.environ.get('PROFILE_INTERVAL', 0.005)))
+            self._profiler.start()
+        elif self.profile:
+            logging.warning(f'Unknown profiler \'{self.profile}\', expected \'cprofile\' or \'sampling\'')
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        Instrumentation._current = self._previous
+        self._previous = None
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.disable()
+        elif isinstance(self._profiler, SamplingProfiler):
+            self._profiler.stop()
@@ -1,6 +1,55 @@
+import functools
+import mmap
 import os
 import logging
-from deprecated import deprecated
+import threading
+import warnings
+
+# resolved auxiliary files by setting and directories, with the mtimes of the setting directories they are valid for
+_resolved_files = {}
+# loaded files by path and parser, with the mtime and size of the file they are valid for
+_loaded_files = {}
+_loaded_files_lock = threading.RLock()
+
+
+def _deprecated(reason: str):
+    """
+    Like `deprecated.deprecated`, without importing the package (and its dependencies): the warning points at the
+    caller's line
+    """
+    def decorator(func):
+        if isinstance(func, staticmethod):
+            return staticmethod(decorator(func.__func__))
+        message = f'Call to deprecated function (or staticmethod) {func.__name__}. ({reason})'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            warnings.warn(message, category=DeprecationWarning, stacklevel=2)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _mtime(path: str) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def _listdir(path: str) -> list | None:
+    try:
+        return os.listdir(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def _map_file(path: str) -> memoryview:
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            # an empty file can not be mapped
+            return memoryview(b'')
+        return memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
 
 
 class MoveAppsIo:
@@ -31,27 +80,103 @@ class MoveAppsIo:
             local_app_files_root,
             os.environ.get('USER_APP_FILE_FALLBACK_DIR', 'provided-app-files')
         )
-        path = MoveAppsIo.get_upload_dir_or_fallback_dir(
+        # resolved once per setting; a file added to or removed from a setting directory changes its mtime
+        key = (appspec_user_file_setting_id, fallback_to_provided_file, user_upload_dir, app_dev_fallback_dir)
+        stamp = tuple(
+            _mtime(os.path.join(directory, appspec_user_file_setting_id))
+            for directory in (user_upload_dir, app_dev_fallback_dir)
+        ) if appspec_user_file_setting_id else None
+        cached = _resolved_files.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        result = MoveAppsIo._resolve_auxiliary_file(
             appspec_user_file_setting_id,
             fallback_to_provided_file,
             user_upload_dir,
             app_dev_fallback_dir
         )
-        if path is None:
+        _resolved_files[key] = (stamp, result)
+        return result
+
+    @staticmethod
+    def _resolve_auxiliary_file(
+            appspec_user_file_setting_id: str,
+            fallback_to_provided_file: bool,
+            user_upload_dir: str,
+            app_dev_fallback_dir: str
+    ) -> str | None:
+        found = MoveAppsIo._find_setting_files(
+            appspec_user_file_setting_id,
+            fallback_to_provided_file,
+            user_upload_dir,
+            app_dev_fallback_dir
+        )
+        if found is None:
             return None
-        if len(os.listdir(path)) != 1:
+        path, files = found
+        if len(files) != 1:
             logging.warning(
                 f'[\'{appspec_user_file_setting_id}\'] '
                 f'A App setting of type `USER_FILE` must contain exactly 0 or 1 file(s). '
-                f'The setting contains \'{len(os.listdir(path))}\' file(s). Therefor returning `None`..'
+                f'The setting contains \'{len(files)}\' file(s). Therefor returning `None`..'
             )
             return None
-        file = os.listdir(path)[0]
-        result = os.path.join(path, file)
+        result = os.path.join(path, files[0])
         logging.info(f'[\'{appspec_user_file_setting_id}\'] Resolved file-name: \'{result}\'')
         return result
 
-    @deprecated(reason="Replaced by app-setting type `USER_FILE` and `get_auxiliary_file_path()`")
+    @staticmethod
+    def load_auxiliary_file(appspec_user_file_setting_id: str, parser=None, fallback_to_provided_file: bool = True):
+        """
+        Provides the content of the auxiliary file (see `get_auxiliary_file_path`), loaded once per process.
+
+        :param appspec_user_file_setting_id The ID of the requested set of app-files
+        :param parser: function of the file path returning the parsed content (e.g. `pandas.read_csv`);
+            without a parser the file is memory-mapped
+        :param fallback_to_provided_file: see `get_auxiliary_file_path`
+        :return: the result of the parser or a read-only `memoryview` of the memory-mapped file
+            (e.g. for `numpy.frombuffer`). Or `None` if there is no file.
+        """
+        path = MoveAppsIo.get_auxiliary_file_path(appspec_user_file_setting_id, fallback_to_provided_file)
+        if path is None:
+            return None
+        return MoveAppsIo.load_file(path, parser)
+
+    @staticmethod
+    def load_file(path: str, parser=None):
+        """
+        Loads a file once per process and parser: later calls return the same object until the file changes
+        (mtime or size). The object is shared by all callers and must be treated as read-only.
+        Worker processes forked after the file was loaded inherit it without loading it again; other workers map the
+        same file and share its pages in the OS page cache.
+
+        :param path: path of the file
+        :param parser: function of the file path returning the parsed content; without a parser the file is
+            memory-mapped
+        :return: the result of the parser or a read-only `memoryview` of the memory-mapped file
+        """
+        stat = os.stat(path)
+        key = (os.path.realpath(path), parser)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with _loaded_files_lock:
+            cached = _loaded_files.get(key)
+            if cached is not None and cached[0] == stamp:
+                return cached[1]
+            content = parser(path) if parser is not None else _map_file(path)
+            _loaded_files[key] = (stamp, content)
+            logging.info(f'Loaded \'{path}\' ({stat.st_size} bytes)')
+            return content
+
+    @staticmethod
+    def clear_caches():
+        """
+        Forgets the resolved and loaded auxiliary files
+        """
+        with _loaded_files_lock:
+            _resolved_files.clear()
+            _loaded_files.clear()
+
+    @_deprecated(reason="Replaced by app-setting type `USER_FILE` and `get_auxiliary_file_path()`")
     @staticmethod
     def get_app_file_path(appspec_local_file_setting_id: str, fallback_to_provided_files: bool = True) -> str | None:
         """
@@ -92,26 +217,46 @@ class MoveAppsIo:
             user_upload_dir: str,
             app_dev_fallback_dir: str
     ) -> str | None:
+        found = MoveAppsIo._find_setting_files(
+            appspec_setting_id,
+            fallback_to_provided_files,
+            user_upload_dir,
+            app_dev_fallback_dir
+        )
+        return None if found is None else found[0]
+
+    @staticmethod
+    def _find_setting_files(
+            appspec_setting_id: str,
+            fallback_to_provided_files: bool,
+            user_upload_dir: str,
+            app_dev_fallback_dir: str
+    ) -> tuple | None:
+        """
+        :return: the directory of the setting and the names of its files; `None` if there are no files
+        """
         if appspec_setting_id:
             user_upload = os.path.join(
                 user_upload_dir,
                 appspec_setting_id
             )
-            if os.path.exists(user_upload) and len(os.listdir(user_upload)) > 0:
+            files = _listdir(user_upload)
+            if files:
                 # directory exists and is not empty: user provided some files
                 logging.info(f'[\'{appspec_setting_id}\'] Detected app-files provided by user.')
-                return user_upload
+                return user_upload, files
             elif fallback_to_provided_files:
                 # fallback to directory provided by app developer
                 app_dev_fallback = os.path.join(
                     app_dev_fallback_dir,
                     appspec_setting_id
                 )
-                if os.path.exists(app_dev_fallback) and len(os.listdir(app_dev_fallback)) > 0:
+                files = _listdir(app_dev_fallback)
+                if files:
                     logging.info(
                         f'[\'{appspec_setting_id}\'] Using fallback files provided by app developer.'
                     )
-                    return app_dev_fallback
+                    return app_dev_fallback, files
         logging.warning(
             f'[\'{appspec_setting_id}\'] No files present for app-files. '
             f'User did not upload anything and the app did not provide fallback files.'
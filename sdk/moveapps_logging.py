@@ -0,0 +1,134 @@
+import logging
+import logging.handlers
+import multiprocessing as mp
+import os
+import threading
+import time
+
+# logger of the per-task metrics of the workers (rows, duration, PID), see `log_task`
+TASK_LOGGER = 'moveapps.tasks'
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `rate` records per second below WARNING pass (token bucket with a burst of one second);
+    the number of dropped records is appended to the next record that passes
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self._tokens = rate
+        self._last = time.monotonic()
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return self._pass(record)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens < 1:
+                self._dropped += 1
+                return False
+            self._tokens -= 1
+        return self._pass(record)
+
+    def _pass(self, record: logging.LogRecord) -> bool:
+        with self._lock:
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            record.msg = f'{record.getMessage()} ({dropped} messages suppressed)'
+            record.args = None
+        return True
+
+
+class _ParentDispatch(logging.Handler):
+    """Hands the records of the workers to the loggers of the parent process, so its configuration applies"""
+
+    def emit(self, record: logging.LogRecord):
+        logger = logging.getLogger(None if record.name == 'root' else record.name)
+        if logger.isEnabledFor(record.levelno):
+            logger.handle(record)
+
+
+def install_worker_logging(log_queue, level: int, rate: float):
+    """
+    Initializer of a worker process: replaces the handlers of the worker (e.g. inherited from the parent by `fork`)
+    by a single handler that sends the records to the parent
+    :param log_queue: the queue of the parent's `WorkerLogging`
+    :param level: records below this level are dropped in the worker, before they are formatted
+    :param rate: maximum number of records below WARNING per second (0: unlimited)
+    """
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.setFormatter(logging.Formatter('[%(processName)s] %(message)s'))
+    if rate > 0:
+        handler.addFilter(RateLimitFilter(rate))
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def log_task(metrics: dict):
+    """
+    Logs the metrics of a finished task at DEBUG level; free if DEBUG is not enabled
+    :param metrics: see `sdk.moveapps_instrumentation.task_metrics`
+    """
+    logger = logging.getLogger(TASK_LOGGER)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f'task done: {metrics.get("rows")} rows in {metrics.get("wall_seconds", 0):.3f} s '
+                     f'(pid {metrics.get("pid")})')
+
+
+class WorkerLogging:
+    """
+    Collects the log records of worker processes in the parent: the workers put them into a queue
+    (see `install_worker_logging`, installed once per worker as pool initializer) and a listener thread in the parent
+    hands them to the parent's loggers. Worker output therefore goes through the same handlers and format as the
+    output of the parent and does not interleave within lines.
+
+    Env variables:
+    - `WORKER_LOG_LEVEL`: minimum level of worker records (default: `INFO`); use `WARNING` in production to keep
+      logging out of the hot path of the workers
+    - `WORKER_LOG_RATE`: maximum number of worker records below WARNING per second and worker (default: `0`, unlimited)
+    """
+
+    def __init__(self, context=None, level: str | int | None = None, rate: float | None = None):
+        context = context or mp.get_context()
+        level = level if level is not None else os.environ.get('WORKER_LOG_LEVEL', 'INFO')
+        self.level = logging.getLevelName(level.upper()) if isinstance(level, str) else level
+        self.rate = rate if rate is not None else float(os.environ.get('WORKER_LOG_RATE', 0))
+        self.queue = context.Queue()
+        self._listener = logging.handlers.QueueListener(self.queue, _ParentDispatch())
+        self._started = False
+
+    def initializer_args(self) -> tuple:
+        """
+        :return: the arguments of `install_worker_logging` for the workers
+        """
+        return self.queue, self.level, self.rate
+
+    def start(self):
+        self._listener.start()
+        self._started = True
+
+    def stop(self):
+        """
+        Handles the records still in the queue and stops the listener
+        """
+        if self._started:
+            self._listener.stop()
+            self._started = False
+        self.queue.close()
+        self.queue.join_thread()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,127 @@
+import importlib
+import logging
+import multiprocessing as mp
+import multiprocessing.pool
+import os
+import threading
+
+from sdk.moveapps_logging import WorkerLogging, install_worker_logging
+
+# modules every worker needs; importing them once per worker up front keeps them out of the first task.
+# Workers only receive GeoDataFrames or arrays, movingpandas (most of the import time) is left to the parent.
+PRELOAD_MODULES = ('numpy', 'geopandas')
+
+
+def preload_modules() -> tuple:
+    """
+    :return: the modules to import in every worker: env variable `POOL_PRELOAD` or PRELOAD_MODULES
+    """
+    if 'POOL_PRELOAD' not in os.environ:
+        return PRELOAD_MODULES
+    return tuple(module.strip() for module in os.environ['POOL_PRELOAD'].split(',') if module.strip())
+
+
+def _initialize_worker(modules: tuple, logging_args: tuple):
+    # runs once per worker: logging first, so the imports can already log
+    install_worker_logging(*logging_args)
+    for module in modules:
+        importlib.import_module(module)
+
+
+class MoveAppsPool:
+    """
+    Process pool shared by all parallel stages of one app run.
+    The pool is started on first use and shut down when the run ends, also if the run fails.
+
+    The start method can be set via env variable `POOL_START_METHOD` (`fork`, `spawn` or `forkserver`).
+    With `forkserver` the heavy modules are preloaded once in the fork server, otherwise every worker imports them in
+    its initializer (a no-op for `fork`, where the workers inherit the modules of the parent).
+    The preloaded modules can be set via env variable `POOL_PRELOAD` (comma separated, empty for none), e.g. `numpy`
+    for runs with the shared memory transport, whose workers do not need pandas.
+    The log records of the workers are handled by the parent, see `WorkerLogging`.
+    """
+
+    _current = None
+
+    def __init__(self, start_method: str | None = None, preload: tuple | None = None):
+        self._context = mp.get_context(start_method or os.environ.get('POOL_START_METHOD') or None)
+        self._preload = tuple(preload) if preload is not None else preload_modules()
+        if self._context.get_start_method() == 'forkserver':
+            self._context.set_forkserver_preload(list(self._preload))
+        self._pool = None
+        self._processes = 0
+        self._logging = None
+        self._lock = threading.Lock()
+        self._previous = None
+
+    @classmethod
+    def current(cls) -> 'MoveAppsPool | None':
+        """
+        :return: the pool of the active app run or `None` if there is no active run (e.g. in unit tests)
+        """
+        return cls._current
+
+    def get(self, processes: int) -> multiprocessing.pool.Pool:
+        """
+        :param processes: number of worker processes
+        :return: the running pool; it is only restarted if a different number of processes is requested
+        """
+        with self._lock:
+            if self._pool is not None and self._processes != processes:
+                logging.info(f'Restarting worker pool with {processes} instead of {self._processes} processes')
+                self._close(terminate=False)
+            if self._pool is None:
+                logging.info(f'Starting worker pool with {processes} processes '
+                             f'(start method: {self._context.get_start_method()})')
+                self._logging = WorkerLogging(self._context)
+                self._logging.start()
+                self._pool = self._context.Pool(
+                    processes,
+                    initializer=_initialize_worker,
+                    initargs=(self._preload, self._logging.initializer_args())
+                )
+                self._processes = processes
+            return self._pool
+
+    def restart(self) -> multiprocessing.pool.Pool:
+        """
+        Replaces the pool by a new one of the same size, e.g. to get rid of a worker that hangs in a task
+        :return: the new pool
+        """
+        with self._lock:
+            processes = self._processes
+            logging.info(f'Restarting worker pool with {processes} processes')
+            self._close(terminate=True)
+        return self.get(processes)
+
+    def shutdown(self, terminate: bool = False):
+        """
+        :param terminate: stop the workers immediately instead of letting them finish their current tasks
+        """
+        with self._lock:
+            self._close(terminate)
+
+    def _close(self, terminate: bool):
+        if self._pool is None:
+            return
+        if terminate:
+            self._pool.terminate()
+        else:
+            self._pool.close()
+        self._pool.join()
+        self._pool = None
+        self._processes = 0
+        # after the workers are gone, so no record is lost
+        self._logging.stop()
+        self._logging = None
+
+    def __enter__(self):
+        self._previous = MoveAppsPool._current
+        MoveAppsPool._current = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        MoveAppsPool._current = self._previous
+        self._previous = None
+        # after a failure the workers might still be busy with tasks nobody waits for anymore
+        self.shutdown(terminate=exc_type is not None)
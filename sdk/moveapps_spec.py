@@ -1,5 +1,8 @@
+from typing import TYPE_CHECKING
 import pluggy
-from movingpandas import TrajectoryCollection
+
+if TYPE_CHECKING:
+    from movingpandas import TrajectoryCollection
 
 HOOK_NAMESPACE = "co-pilot-python"
 hook_spec = pluggy.HookspecMarker(HOOK_NAMESPACE)
@@ -8,7 +11,7 @@ hook_impl = pluggy.HookimplMarker(HOOK_NAMESPACE)
 
 class MoveAppsSpec(object):
     @hook_spec
-    def execute(self, data: TrajectoryCollection, config: dict) -> TrajectoryCollection:
+    def execute(self, data: 'TrajectoryCollection', config: dict) -> 'TrajectoryCollection':
         """Invokes your main business logic
 
         :param data: the input data for this app. It is the output of the predecessor app in a MoveApps workflow.
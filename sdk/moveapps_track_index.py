@@ -0,0 +1,62 @@
+import logging
+from sdk.moveapps_io import MoveAppsIo
+
+# artifact with one row per track of the output, see `app.track_index`
+TRACK_INDEX_FILE = 'track_index.csv'
+TRACK_INDEX_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f%z'
+
+
+class TrackIndexCollector:
+    """
+    Collects the per-track index of the output over all batches of a streaming run (see `app.track_index`): the
+    App is called once per batch, so the row offsets of each batch index are shifted to the rows of the output file.
+    Written as artifact `track_index.csv` at the end of the run. While a collector is active, the App leaves the
+    artifact to it.
+    """
+
+    _current = None
+
+    def __init__(self):
+        self.indexes = []
+        self._previous = None
+
+    @classmethod
+    def current(cls) -> 'TrackIndexCollector | None':
+        """
+        :return: the collector of the active streaming run or `None` if there is none
+        """
+        return cls._current
+
+    def add(self, index, row_offset: int):
+        """
+        :param index: the index of one output batch (a DataFrame with the column `offset`), or `None`
+        :param row_offset: number of rows written to the output before the batch
+        """
+        if index is None:
+            return
+        index = index.copy()
+        index['offset'] += row_offset
+        self.indexes.append(index)
+
+    def write(self, artifact_file_name: str = TRACK_INDEX_FILE) -> str | None:
+        """
+        :return: path of the artifact or `None` if no batch had an index
+        """
+        if not self.indexes:
+            return None
+        import pandas as pd
+
+        index = pd.concat(self.indexes, ignore_index=True)
+        path = MoveAppsIo.create_artifacts_file(artifact_file_name)
+        index.to_csv(path, index=False, date_format=TRACK_INDEX_DATE_FORMAT)
+        logging.info(f'Track index of {len(index)} tracks written to {path}')
+        return path
+
+    def __enter__(self):
+        self._previous = TrackIndexCollector._current
+        TrackIndexCollector._current = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        TrackIndexCollector._current = self._previous
+        self._previous = None
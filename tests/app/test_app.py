@@ -1,5 +1,6 @@
 import unittest
 import os
+from unittest import mock
 from tests.config.definitions import ROOT_DIR
 from app.app import App
 from sdk.moveapps_io import MoveAppsIo
@@ -88,6 +89,40 @@ class MyTestCase(unittest.TestCase):
             )
         )
 
+    def test_distance_method_is_recorded(self):
+        # prepare
+        data: mpd.TrajectoryCollection = pd.read_pickle(os.path.join(ROOT_DIR, 'resources/samples/input3_LatLon.pickle'))
+        config = {'distance-method': 'equirectangular', 'transport': 'shared_memory'}
+
+        # execute
+        actual = self.sut.execute(data=data, config=config)
+
+        # verify: every trajectory and the point data know the method of the distance column
+        metadata = [trajectory.df.attrs['column_metadata'] for trajectory in actual.trajectories]
+        metadata.append(actual.to_point_gdf().attrs['column_metadata'])
+        for columns in metadata:
+            self.assertEqual('equirectangular', columns['distance_from_previous_geopy']['distance_method'])
+            self.assertEqual('km', columns['distance_from_previous_geopy']['unit'])
+
+    def test_track_index_is_attached_and_written(self):
+        # prepare
+        data: mpd.TrajectoryCollection = pd.read_pickle(os.path.join(ROOT_DIR, 'resources/samples/input3_LatLon.pickle'))
+
+        # execute: without the simulated work
+        with mock.patch.dict(os.environ, {'DISTANCE_SLEEP_SECONDS': '0'}):
+            actual = self.sut.execute(data=data, config={})
+
+        # verify: the offsets of the index address the tracks in the point data of the output
+        index = actual.track_index
+        points = actual.to_point_gdf()
+        self.assertEqual(len(actual.trajectories), len(index))
+        self.assertEqual(len(points), index['rows'].sum())
+        for row in index.itertuples():
+            track = points.iloc[row.offset:row.offset + row.rows]
+            self.assertTrue((track[actual.get_traj_id_col()] == getattr(row, actual.get_traj_id_col())).all())
+        written = pd.read_csv(self.sut.moveapps_io.create_artifacts_file('track_index.csv'))
+        self.assertEqual(index['rows'].tolist(), written['rows'].tolist())
+
     """
     # Use this test if the App should return the input data
     def test_app_returns_input(self):
@@ -0,0 +1,54 @@
+import unittest
+from unittest import mock
+from app.backends import choose_backend, get_backend, record_row_cost, estimate_row_cost, SerialBackend
+from app.parallel import distance_kernel
+
+
+def expensive(data):
+    return data
+
+
+def cheap(data):
+    return data
+
+
+class TestBackends(unittest.TestCase):
+
+    def setUp(self) -> None:
+        # without the row costs measured by earlier tests
+        row_costs = mock.patch.dict('app.backends._row_costs', clear=True)
+        row_costs.start()
+        self.addCleanup(row_costs.stop)
+
+    def test_serial_for_single_cpu_or_track(self):
+        # execute / verify
+        self.assertEqual('serial', choose_backend(expensive, rows=10 ** 9, tracks=10, n_budget=1).name)
+        self.assertEqual('serial', choose_backend(expensive, rows=10 ** 9, tracks=1, n_budget=8).name)
+
+    def test_serial_for_little_work(self):
+        # execute / verify
+        self.assertEqual('serial', choose_backend(distance_kernel, rows=100, tracks=3, n_budget=8).name)
+
+    def test_threads_for_array_kernels(self):
+        # execute / verify
+        self.assertEqual('threads', choose_backend(distance_kernel, rows=10 ** 7, tracks=3, n_budget=8).name)
+
+    def test_measured_cost_decides_between_serial_and_processes(self):
+        # prepare
+        record_row_cost(expensive, rows=10, worker_seconds=10)
+        record_row_cost(cheap, rows=10 ** 6, worker_seconds=0.1)
+
+        # execute / verify
+        self.assertEqual(1, estimate_row_cost(expensive))
+        self.assertEqual('processes', choose_backend(expensive, rows=10, tracks=3, n_budget=8).name)
+        self.assertEqual('serial', choose_backend(cheap, rows=10 ** 4, tracks=3, n_budget=8).name)
+
+    def test_get_backend(self):
+        # prepare
+        backend = SerialBackend()
+
+        # execute / verify
+        self.assertIs(backend, get_backend(backend, cheap, rows=1, tracks=1, n_budget=1))
+        self.assertEqual('threads', get_backend('threads', cheap, rows=1, tracks=1, n_budget=1).name)
+        with self.assertRaises(ValueError):
+            get_backend('gpu', cheap, rows=1, tracks=1, n_budget=1)
@@ -0,0 +1,87 @@
+import unittest
+import os
+import tempfile
+from unittest import mock
+from app.cpu_budget import get_cpu_budget, read_cgroup_v1_limit, read_cgroup_v2_limit, read_override_limit
+
+
+class TestCpuBudget(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cgroup_root = tempfile.TemporaryDirectory()
+        os.environ.pop('CPU_LIMIT', None)
+
+    def tearDown(self) -> None:
+        self.cgroup_root.cleanup()
+        os.environ.pop('CPU_LIMIT', None)
+
+    def _write(self, path: str, content: str):
+        path = os.path.join(self.cgroup_root.name, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(content)
+
+    def test_cgroup_v2_quota(self):
+        # prepare
+        self._write('cpu.max', '250000 100000\n')
+
+        # execute
+        actual = read_cgroup_v2_limit(self.cgroup_root.name)
+
+        # verify
+        self.assertEqual(2, actual)
+
+    def test_cgroup_v2_unlimited(self):
+        # prepare
+        self._write('cpu.max', 'max 100000\n')
+
+        # execute
+        actual = read_cgroup_v2_limit(self.cgroup_root.name)
+
+        # verify
+        self.assertIsNone(actual)
+
+    def test_cgroup_v1_quota(self):
+        # prepare
+        self._write('cpu/cpu.cfs_quota_us', '300000')
+        self._write('cpu/cpu.cfs_period_us', '100000')
+
+        # execute
+        actual = read_cgroup_v1_limit(self.cgroup_root.name)
+
+        # verify
+        self.assertEqual(3, actual)
+
+    def test_cgroup_v1_unlimited(self):
+        # prepare
+        self._write('cpu/cpu.cfs_quota_us', '-1')
+        self._write('cpu/cpu.cfs_period_us', '100000')
+
+        # execute
+        actual = read_cgroup_v1_limit(self.cgroup_root.name)
+
+        # verify
+        self.assertIsNone(actual)
+
+    def test_override(self):
+        # prepare
+        os.environ['CPU_LIMIT'] = '3'
+
+        # execute / verify: the app configuration wins over the env variable
+        self.assertEqual(2, read_override_limit(2))
+        self.assertEqual(3, read_override_limit(None))
+        self.assertEqual(3, read_override_limit('not-a-number'))
+
+    def test_budget_is_minimum_of_all_limits(self):
+        # prepare
+        self._write('cpu.max', '400000 100000')
+
+        # execute
+        with mock.patch('app.cpu_budget.read_affinity_limit', return_value=3), \
+                mock.patch('app.cpu_budget.mp.cpu_count', return_value=64):
+            actual = get_cpu_budget(cgroup_root=self.cgroup_root.name)
+            actual_with_override = get_cpu_budget(override=1, cgroup_root=self.cgroup_root.name)
+
+        # verify
+        self.assertEqual(3, actual)
+        self.assertEqual(1, actual_with_override)
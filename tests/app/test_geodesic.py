@@ -0,0 +1,126 @@
+import unittest
+import numpy as np
+import geopy.distance
+from geographiclib.geodesic import Geodesic
+from app.geodesic import check_distance_method, distance_from_previous, equirectangular_distance, geodesic_distance, \
+    geodesic_inverse, haversine_distance, GEODESIC_TOLERANCE_KM
+
+
+class TestGeodesic(unittest.TestCase):
+
+    def test_matches_geopy(self):
+        # prepare
+        rng = np.random.default_rng(42)
+        lat1 = rng.uniform(-90, 90, 500)
+        lon1 = rng.uniform(-180, 180, 500)
+        lat2 = np.clip(lat1 + rng.normal(0, 5, 500), -90, 90)
+        lon2 = lon1 + rng.normal(0, 5, 500)
+
+        # execute
+        actual = geodesic_distance(lat1, lon1, lat2, lon2)
+
+        # verify
+        expected = [geopy.distance.geodesic((a, b), (c, d)).km for a, b, c, d in zip(lat1, lon1, lat2, lon2)]
+        self.assertTrue(np.allclose(actual, expected, rtol=0, atol=GEODESIC_TOLERANCE_KM))
+
+    def test_bearing_matches_geographiclib(self):
+        # prepare: random pairs and a nearly antipodal pair
+        rng = np.random.default_rng(7)
+        lat1 = np.append(rng.uniform(-80, 80, 500), 0.0)
+        lon1 = np.append(rng.uniform(-180, 180, 500), 0.0)
+        lat2 = np.append(np.clip(lat1[:-1] + rng.normal(0, 5, 500), -89, 89), 0.5)
+        lon2 = np.append(lon1[:-1] + rng.normal(0, 5, 500), 179.7)
+
+        # execute
+        _, actual = geodesic_inverse(lat1, lon1, lat2, lon2)
+
+        # verify: compare on the circle
+        expected = np.array([Geodesic.WGS84.Inverse(a, b, c, d)['azi1'] for a, b, c, d in zip(lat1, lon1, lat2, lon2)])
+        difference = (actual - expected + 180) % 360 - 180
+        self.assertTrue(np.all(np.abs(difference) < 1e-6))
+        self.assertTrue(np.all((actual >= 0) & (actual < 360)))
+
+    def test_bearing_of_identical_locations(self):
+        # execute
+        _, actual = geodesic_inverse([10.0], [20.0], [10.0], [20.0])
+
+        # verify
+        self.assertTrue(np.isnan(actual[0]))
+
+    def test_special_cases(self):
+        # prepare: identical points, equatorial line, poles and a nearly antipodal pair
+        lat1 = np.array([10.0, 0.0, 90.0, 0.0])
+        lon1 = np.array([20.0, 0.0, 0.0, 0.0])
+        lat2 = np.array([10.0, 0.0, -90.0, 0.5])
+        lon2 = np.array([20.0, 90.0, 0.0, 179.7])
+
+        # execute
+        actual = geodesic_distance(lat1, lon1, lat2, lon2)
+
+        # verify
+        expected = [geopy.distance.geodesic((a, b), (c, d)).km for a, b, c, d in zip(lat1, lon1, lat2, lon2)]
+        self.assertTrue(np.allclose(actual, expected, rtol=0, atol=GEODESIC_TOLERANCE_KM))
+
+    def test_distance_from_previous(self):
+        # execute
+        actual = distance_from_previous([5, 4, np.nan, 2], [1, 2, 3, 4])
+
+        # verify
+        self.assertEqual(actual.dtype, np.float64)
+        self.assertTrue(np.isnan(actual[0]))
+        self.assertAlmostEqual(actual[1], 156.66564184752647, delta=GEODESIC_TOLERANCE_KM)
+        self.assertTrue(np.isnan(actual[2]) and np.isnan(actual[3]))
+
+    def test_distance_from_previous_single_location(self):
+        # execute
+        actual = distance_from_previous([5], [1])
+
+        # verify
+        self.assertEqual(len(actual), 1)
+        self.assertTrue(np.isnan(actual[0]))
+
+    def test_haversine_error_bound(self):
+        # prepare: pairs all over the globe, up to antipodal
+        rng = np.random.default_rng(3)
+        lat1, lat2 = rng.uniform(-90, 90, (2, 20000))
+        lon1, lon2 = rng.uniform(-180, 180, (2, 20000))
+
+        # execute
+        actual = haversine_distance(lat1, lon1, lat2, lon2)
+
+        # verify
+        expected = geodesic_distance(lat1, lon1, lat2, lon2)
+        self.assertLess(np.max(np.abs(actual - expected) / expected), 0.0057)
+
+    def test_equirectangular_error_bound(self):
+        # prepare: segments of up to 100 km between latitudes -85 and 85, some across the antimeridian
+        rng = np.random.default_rng(5)
+        lat1 = rng.uniform(-84, 84, 20000)
+        lon1 = np.append(rng.uniform(-180, 180, 19000), np.full(1000, 179.9))
+        bearing = rng.uniform(0, 2 * np.pi, 20000)
+        degrees = rng.uniform(1e-5, 0.9, 20000)
+        lat2 = lat1 + degrees * np.cos(bearing)
+        lon2 = lon1 + degrees * np.sin(bearing) / np.cos(np.radians(lat1))
+
+        # execute
+        actual = equirectangular_distance(lat1, lon1, lat2, lon2)
+
+        # verify
+        expected = geodesic_distance(lat1, lon1, lat2, lon2)
+        valid = (expected <= 100) & (np.abs(lat2) <= 85)
+        self.assertLess(np.max(np.abs(actual - expected)[valid] / expected[valid]), 0.0057)
+
+    def test_distance_methods(self):
+        # execute
+        actual = {
+            method: distance_from_previous([10.0, 10.1, 10.1], [20.0, 20.0, 20.1], method)
+            for method in ('ellipsoidal', 'haversine', 'equirectangular')
+        }
+
+        # verify
+        for distances in actual.values():
+            self.assertTrue(np.isnan(distances[0]))
+            self.assertTrue(np.allclose(distances[1:], actual['ellipsoidal'][1:], rtol=0.0057))
+        self.assertEqual('ellipsoidal', check_distance_method(None))
+        with self.assertRaises(ValueError):
+            check_distance_method('vincenty')
@@ -0,0 +1,94 @@
+import unittest
+import numpy as np
+import pandas as pd
+import movingpandas as mpd
+from app.geodesic import haversine_distance
+from app.movement_metrics import METRIC_COLUMNS, calculate_movement_metrics, column_metadata, metrics_function, \
+    metrics_kernel, movement_metrics, parse_metrics
+from app.parallel import parallelize
+
+
+class TestMovementMetrics(unittest.TestCase):
+
+    def setUp(self) -> None:
+        df = pd.DataFrame([
+            {'timestamp_utc': "2001-06-11 09:00:00", 'coords_x': 0, 'coords_y': 0, 'track_id': 'ID_1'},
+            {'timestamp_utc': "2001-06-11 10:00:00", 'coords_x': 0, 'coords_y': 1, 'track_id': 'ID_1'},
+            {'timestamp_utc': "2001-06-11 10:00:00", 'coords_x': 1, 'coords_y': 1, 'track_id': 'ID_1'},
+            {'timestamp_utc': "2001-06-11 12:00:00", 'coords_x': 1, 'coords_y': 1, 'track_id': 'ID_1'},
+            {'timestamp_utc': "2000-06-11 09:00:00", 'coords_x': 1, 'coords_y': 5, 'track_id': 'ID_2'},
+            {'timestamp_utc': "2000-06-11 09:30:00", 'coords_x': 2, 'coords_y': 4, 'track_id': 'ID_2'},
+        ])
+        self.data = mpd.TrajectoryCollection(
+            df,
+            traj_id_col='track_id',
+            t='timestamp_utc',
+            crs='epsg:4326',
+            x='coords_x', y='coords_y'
+        )
+
+    def test_parse_metrics(self):
+        # execute / verify
+        self.assertEqual(('distance',), parse_metrics(None))
+        self.assertEqual(('distance',), parse_metrics(''))
+        self.assertEqual(('distance', 'speed', 'bearing'), parse_metrics('bearing, speed,distance'))
+        with self.assertRaises(ValueError):
+            parse_metrics('distance,acceleration')
+
+    def test_metrics_of_one_track(self):
+        # prepare
+        x = np.array([0.0, 0.0, 1.0, 1.0])
+        y = np.array([0.0, 1.0, 1.0, 1.0])
+        t = pd.to_datetime(['2001-06-11 09:00', '2001-06-11 10:00', '2001-06-11 10:00', '2001-06-11 12:00'])
+        t = t.values.astype('datetime64[ns]').view(np.int64)
+
+        # execute
+        actual = movement_metrics(x, y, t, metrics=tuple(METRIC_COLUMNS))
+
+        # verify
+        distance = actual['distance_from_previous_geopy']
+        self.assertTrue(np.allclose(actual['time_from_previous_s'], [np.nan, 3600, 0, 7200], equal_nan=True))
+        self.assertTrue(np.allclose(actual['speed_from_previous_kmh'], [np.nan, distance[1], np.nan, 0],
+                                    equal_nan=True))
+        self.assertTrue(np.allclose(actual['bearing_from_previous_deg'][:3], [np.nan, 0, 90], equal_nan=True,
+                                    atol=0.01))
+        self.assertTrue(np.isnan(actual['bearing_from_previous_deg'][3]))
+        self.assertTrue(all(values.dtype == np.float64 for values in actual.values()))
+
+    def test_kernel_and_frame_function_give_same_result(self):
+        # prepare
+        metrics = tuple(METRIC_COLUMNS)
+
+        # execute
+        frames = parallelize(self.data, metrics_function(metrics), backend='serial')
+        arrays = parallelize(self.data, metrics_kernel(metrics), transport='shared_memory', backend='threads')
+
+        # verify
+        columns = ['x', 'y'] + list(METRIC_COLUMNS.values())
+        pd.testing.assert_frame_equal(frames[columns], arrays[columns])
+
+    def test_distance_method(self):
+        # prepare
+        x = np.array([0.0, 0.0, 1.0])
+        y = np.array([0.0, 1.0, 1.0])
+        t = np.array([0, 3600, 7200], dtype=np.int64) * 10 ** 9
+
+        # execute
+        actual = movement_metrics(x, y, t, ('distance', 'speed', 'bearing'), distance_method='haversine')
+
+        # verify: distance and speed follow the method, the bearing stays ellipsoidal
+        expected = haversine_distance(y[:-1], x[:-1], y[1:], x[1:])
+        self.assertTrue(np.allclose(expected, actual['distance_from_previous_geopy'][1:]))
+        self.assertTrue(np.allclose(expected, actual['speed_from_previous_kmh'][1:]))
+        self.assertTrue(np.allclose(movement_metrics(x, y, t, ('bearing',))['bearing_from_previous_deg'][1:],
+                                    actual['bearing_from_previous_deg'][1:]))
+        self.assertEqual('haversine', column_metadata(('distance', 'speed'), 'haversine')['speed_from_previous_kmh'][
+            'distance_method'])
+
+    def test_projected_data_is_rejected(self):
+        # prepare
+        track = self.data.to_point_gdf().to_crs('esri:54009')
+
+        # execute / verify
+        with self.assertRaises(ValueError):
+            calculate_movement_metrics(track)
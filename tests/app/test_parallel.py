@@ -0,0 +1,368 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+import pandas as pd
+import movingpandas as mpd
+import numpy as np
+from sdk.moveapps_failures import FailureManifest
+from sdk.moveapps_instrumentation import Instrumentation
+from sdk.moveapps_pool import MoveAppsPool
+from app.geodesic import distance_from_previous
+from app.parallel import _distance_arrays, _run_work_unit, distance_kernel, parallelize, parallelize_cached
+from app.shared_transport import ArrayKernel
+from app.result_cache import TrackResultCache
+
+
+def add_distance(data):
+    coordinates = data.get_coordinates()
+    data['x'] = coordinates['x'].to_numpy()
+    data['y'] = coordinates['y'].to_numpy()
+    data['distance_from_previous_geopy'] = distance_from_previous(data['y'], data['x'])
+    return data
+
+
+def add_distance_counted(data):
+    add_distance_counted.rows += len(data)
+    return add_distance(data)
+
+
+def broken(data):
+    raise ValueError('broken track')
+
+
+def add_distance_failing(data):
+    if data['track_id'].iloc[0] == 'ID_2':
+        raise ValueError('broken track')
+    return add_distance(data)
+
+
+def add_distance_flaky(data):
+    # fails at the first attempt of each track
+    track_id = data['track_id'].iloc[0]
+    if track_id not in add_distance_flaky.attempted:
+        add_distance_flaky.attempted.add(track_id)
+        raise ConnectionError('temporary')
+    return add_distance(data)
+
+
+def add_distance_hanging(data):
+    if data['track_id'].iloc[0] == 'ID_2':
+        time.sleep(60)
+    return add_distance(data)
+
+
+def add_distance_crashing(data):
+    # the worker process dies without a result
+    if data['track_id'].iloc[0] == 'ID_2':
+        os._exit(1)
+    return add_distance(data)
+
+
+def _distance_arrays_failing(x, y, t):
+    if x[0] == 1 and len(x) == 2:
+        raise ValueError('broken track')
+    return _distance_arrays(x, y, t)
+
+
+class TestParallel(unittest.TestCase):
+
+    def setUp(self) -> None:
+        df = pd.DataFrame([
+            {'timestamp_utc': "2001-06-11 09:00:00", 'coords_x': 1, 'coords_y': 5, 'track_id': 'ID_1'},
+            {'timestamp_utc': "2001-07-12 09:00:00", 'coords_x': 2, 'coords_y': 4, 'track_id': 'ID_1'},
+            {'timestamp_utc': "2002-08-13 09:00:00", 'coords_x': 3, 'coords_y': 3, 'track_id': 'ID_1'},
+            {'timestamp_utc': "2000-06-11 09:00:00", 'coords_x': 1, 'coords_y': 5, 'track_id': 'ID_2'},
+            {'timestamp_utc': "2000-07-12 09:00:00", 'coords_x': 2, 'coords_y': 4, 'track_id': 'ID_2'},
+            {'timestamp_utc': "2000-06-11 09:00:00", 'coords_x': 4, 'coords_y': 2, 'track_id': 'ID_3'},
+            {'timestamp_utc': "2000-07-12 09:00:00", 'coords_x': 5, 'coords_y': 1, 'track_id': 'ID_3'}
+        ])
+        self.data = mpd.TrajectoryCollection(
+            df,
+            traj_id_col='track_id',
+            t='timestamp_utc',
+            crs='epsg:4326',
+            x='coords_x', y='coords_y'
+        )
+
+    def test_shared_memory_transport(self):
+        # execute
+        actual = parallelize(self.data, distance_kernel, cpu_limit=2, transport='shared_memory')
+
+        # verify
+        self.assertEqual(actual['track_id'].tolist(), ['ID_1'] * 3 + ['ID_2'] * 2 + ['ID_3'] * 2)
+        self.assertEqual(actual['x'].tolist(), [1, 2, 3, 1, 2, 4, 5])
+        self.assertTrue(
+            np.allclose(
+                actual['distance_from_previous_geopy'].tolist(),
+                [np.nan, 156.66564184752647, 156.75914242784864, np.nan, 156.66564184752647,
+                 np.nan, 156.87614940188664],
+                equal_nan=True
+            )
+        )
+
+    def test_backends_give_same_result(self):
+        # execute
+        expected = parallelize(self.data, distance_kernel, cpu_limit=2, transport='shared_memory')
+        for backend in ('serial', 'threads', 'processes', 'distributed', 'auto'):
+            for transport in ('pickle', 'shared_memory'):
+                func = distance_kernel if transport == 'shared_memory' else add_distance
+                actual = parallelize(self.data, func, cpu_limit=2, transport=transport, backend=backend)
+
+                # verify
+                self.assertTrue(
+                    actual[expected.columns].equals(expected),
+                    f'different result for backend {backend} with {transport} transport'
+                )
+
+    def test_in_process_backends_do_not_modify_input(self):
+        # execute
+        parallelize(self.data, add_distance, backend='serial')
+
+        # verify
+        self.assertNotIn('distance_from_previous_geopy', self.data.to_point_gdf().columns)
+
+    def test_shared_memory_transport_needs_array_kernel(self):
+        # execute / verify
+        with self.assertRaises(TypeError):
+            parallelize(self.data, len, cpu_limit=1, transport='shared_memory')
+
+    def test_pool_of_app_run_is_reused(self):
+        # execute
+        with MoveAppsPool() as pool:
+            before = pool.get(1)
+            first = parallelize(self.data, distance_kernel, cpu_limit=1, transport='shared_memory')
+            second = parallelize(self.data, distance_kernel, cpu_limit=1, transport='shared_memory')
+            after = pool.get(1)
+
+        # verify: both stages ran on the pool of the app run
+        self.assertIs(before, after)
+        self.assertTrue(first.equals(second))
+
+    def test_track_tasks_are_instrumented(self):
+        # execute
+        with Instrumentation(profile='') as instrumentation:
+            parallelize(self.data, distance_kernel, transport='shared_memory', backend='serial')
+            parallelize(self.data, add_distance, backend='threads')
+
+        # verify
+        self.assertEqual(
+            ['parallelize:_distance_arrays'] * 3 + ['parallelize:add_distance'] * 3,
+            [task['stage'] for task in instrumentation.tasks]
+        )
+        self.assertEqual(['ID_1', 'ID_2', 'ID_3'], sorted(task['track_id'] for task in instrumentation.tasks[:3]))
+        frame_tasks = sorted(instrumentation.tasks[3:], key=lambda task: task['track_id'])
+        self.assertEqual([3, 2, 2], [task['rows'] for task in frame_tasks])
+
+    def test_row_cost_is_measured_in_the_workers(self):
+        # execute
+        with Instrumentation(profile='') as instrumentation, \
+                mock.patch('app.parallel.record_row_cost') as record_row_cost:
+            parallelize(self.data, add_distance, backend='processes')
+
+        # verify: the time of the tasks, not the time of the pool including its start-up
+        func, rows, worker_seconds = record_row_cost.call_args.args
+        self.assertIs(add_distance, func)
+        self.assertEqual(7, rows)
+        self.assertAlmostEqual(sum(task['wall_seconds'] for task in instrumentation.tasks), worker_seconds)
+
+    def test_cached_results_are_reused(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # prepare: the first run knows all locations but the last one of ID_1
+            cache = TrackResultCache(directory, namespace='distance')
+            gdf = self.data.to_point_gdf()
+            earlier = mpd.TrajectoryCollection(
+                gdf.drop(gdf.index[2]).reset_index(), traj_id_col='track_id', t='timestamp_utc'
+            )
+            add_distance_counted.rows = 0
+            parallelize_cached(earlier, add_distance_counted, cache, columns=distance_kernel.columns,
+                               backend='serial')
+
+            # execute
+            add_distance_counted.rows = 0
+            actual = parallelize_cached(self.data, add_distance_counted, cache, columns=distance_kernel.columns,
+                                        backend='serial')
+
+            # verify: only the new location and its predecessor are computed
+            expected = parallelize(self.data, add_distance, backend='serial')
+            self.assertEqual(2, add_distance_counted.rows)
+            self.assertTrue(actual[expected.columns].equals(expected))
+
+            # a run without new locations computes nothing
+            add_distance_counted.rows = 0
+            again = parallelize_cached(self.data, add_distance_counted, cache, columns=distance_kernel.columns,
+                                       backend='serial')
+            self.assertEqual(0, add_distance_counted.rows)
+            self.assertTrue(again[expected.columns].equals(expected))
+
+    def test_cached_results_replace_existing_columns(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # prepare: the input has the output column already, e.g. the output of an earlier run
+            cache = TrackResultCache(directory, namespace='distance')
+            gdf = self.data.to_point_gdf()
+            gdf['distance_from_previous_geopy'] = -1.0
+            rerun = mpd.TrajectoryCollection(gdf.reset_index(), traj_id_col='track_id', t='timestamp_utc')
+
+            # execute
+            first = parallelize_cached(rerun, distance_kernel, cache, transport='shared_memory', backend='serial')
+            second = parallelize_cached(rerun, distance_kernel, cache, transport='shared_memory', backend='serial')
+
+            # verify
+            expected = parallelize(self.data, add_distance, backend='serial')['distance_from_previous_geopy']
+            self.assertTrue(np.allclose(expected, first['distance_from_previous_geopy'], equal_nan=True))
+            self.assertTrue(np.allclose(expected, second['distance_from_previous_geopy'], equal_nan=True))
+
+    def test_cached_tracks_count_as_successful(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # prepare: all tracks are known but the last location of ID_1
+            cache = TrackResultCache(directory, namespace='distance')
+            gdf = self.data.to_point_gdf()
+            earlier = mpd.TrajectoryCollection(
+                gdf.drop(gdf.index[2]).reset_index(), traj_id_col='track_id', t='timestamp_utc'
+            )
+            parallelize_cached(earlier, add_distance, cache, columns=distance_kernel.columns, backend='serial')
+
+            # execute: only ID_1 is computed, and fails
+            with FailureManifest() as manifest:
+                actual = parallelize_cached(self.data, broken, cache, columns=distance_kernel.columns,
+                                            backend='serial')
+
+            # verify
+            self.assertEqual(['ID_2'] * 2 + ['ID_3'] * 2, actual['track_id'].tolist())
+            self.assertEqual(['ID_1'], [failure['track_id'] for failure in manifest.failures])
+
+    def test_failing_track_is_left_out(self):
+        # execute
+        with FailureManifest() as manifest:
+            actual = parallelize(self.data, add_distance_failing, backend='threads')
+
+        # verify
+        self.assertEqual(['ID_1'] * 3 + ['ID_3'] * 2, actual['track_id'].tolist())
+        self.assertEqual(['ID_2'], [failure['track_id'] for failure in manifest.failures])
+        self.assertEqual('parallelize:add_distance_failing', manifest.failures[0]['stage'])
+        self.assertEqual('ValueError: broken track', manifest.failures[0]['error'])
+
+    def test_failing_track_is_logged_without_manifest(self):
+        # execute
+        with self.assertLogs(level='WARNING') as logs:
+            actual = parallelize(self.data, add_distance_failing, backend='serial')
+
+        # verify
+        self.assertEqual(['ID_1'] * 3 + ['ID_3'] * 2, actual['track_id'].tolist())
+        self.assertTrue(any('track ID_2' in line and 'ValueError: broken track' in line for line in logs.output))
+
+    def test_failing_track_is_left_out_of_shared_memory_result(self):
+        # prepare
+        kernel = ArrayKernel(func=_distance_arrays_failing, columns=distance_kernel.columns)
+
+        # execute
+        with FailureManifest() as manifest:
+            actual = parallelize(self.data, kernel, transport='shared_memory', backend='processes', cpu_limit=2)
+
+        # verify
+        expected = parallelize(self.data, distance_kernel, transport='shared_memory', backend='serial')
+        self.assertTrue(actual.equals(expected[expected['track_id'] != 'ID_2']))
+        self.assertEqual(['ID_2'], [failure['track_id'] for failure in manifest.failures])
+
+    def test_failing_track_is_left_out_of_distributed_result(self):
+        # prepare: the workers read the arrays from the shared directory or get them with the tasks,
+        # the failures refer to their offsets in the split
+        kernel = ArrayKernel(func=_distance_arrays_failing, columns=distance_kernel.columns)
+        expected = parallelize(self.data, distance_kernel, transport='shared_memory', backend='serial')
+        for data_dir in (None, ''):
+            with mock.patch.dict(os.environ, {} if data_dir is None else {'BROKER_DATA_DIR': data_dir}):
+                # execute
+                with FailureManifest() as manifest:
+                    actual = parallelize(self.data, kernel, transport='shared_memory', backend='distributed',
+                                         cpu_limit=2)
+
+            # verify
+            self.assertTrue(actual.equals(expected[expected['track_id'] != 'ID_2']), data_dir)
+            self.assertEqual(['ID_2'], [failure['track_id'] for failure in manifest.failures], data_dir)
+
+    def test_distributed_workers_read_tracks_from_shared_directory(self):
+        # prepare
+        expected = parallelize(self.data, add_distance, backend='serial')
+        with tempfile.TemporaryDirectory() as directory:
+            # execute: the point data is written once, tasks only carry the rows of their tracks
+            with mock.patch.dict(os.environ, {'BROKER_DATA_DIR': directory}), \
+                    mock.patch('app.parallel._run_work_unit', wraps=_run_work_unit) as run_work_unit:
+                actual = parallelize(self.data, add_distance, backend='distributed', cpu_limit=2)
+
+            # verify: nothing is left behind in the shared directory
+            self.assertEqual([], os.listdir(directory))
+        run_work_unit.assert_not_called()
+        self.assertTrue(actual[expected.columns].equals(expected))
+
+    def test_lost_distributed_worker_fails_its_tracks_only(self):
+        # execute: without retries the track of the crashed worker is given up
+        with mock.patch.dict(os.environ, {'BROKER_RETRIES': '0'}), FailureManifest() as manifest:
+            actual = parallelize(self.data, add_distance_crashing, backend='distributed', cpu_limit=2, timeout=30)
+
+        # verify
+        self.assertEqual(['ID_1'] * 3 + ['ID_3'] * 2, actual['track_id'].tolist())
+        self.assertEqual([('ID_2', 'worker stopped with exit code 1', 1)],
+                         [(failure['track_id'], failure['error'], failure['attempts']) for failure in manifest.failures])
+
+    def test_track_exceeding_timeout_is_left_out_of_distributed_result(self):
+        # execute: the broker stops the hanging track although its worker keeps sending heartbeats
+        with mock.patch.dict(os.environ, {'BROKER_RETRIES': '0'}), FailureManifest() as manifest:
+            actual = parallelize(self.data, add_distance_hanging, backend='distributed', cpu_limit=2, timeout=2)
+
+        # verify
+        self.assertEqual(['ID_1'] * 3 + ['ID_3'] * 2, actual['track_id'].tolist())
+        self.assertEqual([('ID_2', 'timeout after 2 s', 1)],
+                         [(failure['track_id'], failure['error'], failure['attempts']) for failure in manifest.failures])
+
+    def test_all_tracks_failing_raises(self):
+        # execute / verify
+        with self.assertRaises(RuntimeError):
+            parallelize(self.data, broken, backend='serial')
+
+    def test_failed_tracks_are_retried(self):
+        # prepare
+        add_distance_flaky.attempted = set()
+
+        # execute
+        with FailureManifest() as manifest:
+            actual = parallelize(self.data, add_distance_flaky, backend='serial', retries=1)
+
+        # verify
+        self.assertTrue(actual.equals(parallelize(self.data, add_distance, backend='serial')))
+        self.assertEqual([], manifest.failures)
+
+    def test_track_exceeding_timeout_is_left_out(self):
+        # execute
+        with FailureManifest() as manifest:
+            actual = parallelize(self.data, add_distance_hanging, backend='auto', cpu_limit=2, timeout=2)
+
+        # verify
+        self.assertEqual(['ID_1'] * 3 + ['ID_3'] * 2, actual['track_id'].tolist())
+        self.assertEqual([('ID_2', 'timeout after 2 s', 1)],
+                         [(failure['track_id'], failure['error'], failure['attempts']) for failure in manifest.failures])
+
+    def test_failing_track_is_not_cached(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # prepare
+            cache = TrackResultCache(directory, namespace='distance')
+
+            # execute
+            actual = parallelize_cached(self.data, add_distance_failing, cache, columns=distance_kernel.columns,
+                                        backend='serial')
+
+            # verify
+            expected = parallelize(self.data, add_distance, backend='serial')
+            self.assertTrue(actual[expected.columns].equals(expected[expected['track_id'] != 'ID_2']))
+            self.assertEqual(
+                ['ID_1', 'ID_3'],
+                [track_id for track_id in ['ID_1', 'ID_2', 'ID_3'] if cache.lookup(
+                    track_id, *self._arrays(track_id)) is not None]
+            )
+
+    def _arrays(self, track_id):
+        track = self.data.to_point_gdf()
+        track = track[track['track_id'] == track_id]
+        coordinates = track.get_coordinates()
+        times = np.asarray(track.index.values).astype('datetime64[ns]').view(np.int64)
+        return coordinates['x'].to_numpy(dtype=np.float64), coordinates['y'].to_numpy(dtype=np.float64), times
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from app.result_cache import TrackResultCache
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.sut = TrackResultCache(self.directory.name, namespace='test')
+        self.x = np.array([1.0, 2.0, 3.0])
+        self.y = np.array([5.0, 4.0, 3.0])
+        self.t = np.array([10, 20, 30], dtype=np.int64)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_grown_track_reuses_prefix(self):
+        # prepare
+        self.sut.store('ID_1', self.x, self.y, self.t, {'distance': np.array([np.nan, 1.5, 2.5])})
+
+        # execute: the track got one more location
+        actual = self.sut.lookup('ID_1', np.append(self.x, 4.0), np.append(self.y, 2.0), np.append(self.t, 40))
+
+        # verify
+        self.assertEqual(3, actual.rows)
+        self.assertTrue(np.array_equal([np.nan, 1.5, 2.5], actual.columns['distance'], equal_nan=True))
+
+    def test_changed_prefix_is_a_miss(self):
+        # prepare
+        self.sut.store('ID_1', self.x, self.y, self.t, {'distance': np.array([np.nan, 1.5, 2.5])})
+        x = self.x.copy()
+        x[1] = 2.5
+
+        # execute / verify
+        self.assertIsNone(self.sut.lookup('ID_1', x, self.y, self.t))
+        self.assertIsNone(self.sut.lookup('ID_1', self.x[:2], self.y[:2], self.t[:2]))
+        self.assertIsNone(self.sut.lookup('ID_2', self.x, self.y, self.t))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        # prepare
+        for track_id in ('ID_1', 'ID_2', 'ID_3'):
+            self.sut.store(track_id, self.x, self.y, self.t, {'distance': np.zeros(3)})
+        entries = sorted(os.listdir(self.sut.directory))
+        size = os.path.getsize(os.path.join(self.sut.directory, entries[0]))
+        for age, track_id in enumerate(('ID_2', 'ID_1', 'ID_3')):
+            os.utime(self.sut._path(track_id), (1000 + age, 1000 + age))
+        self.sut.max_bytes = 2 * size
+
+        # execute
+        self.sut.evict()
+
+        # verify: the oldest entry is gone
+        self.assertIsNone(self.sut.lookup('ID_2', self.x, self.y, self.t))
+        self.assertIsNotNone(self.sut.lookup('ID_1', self.x, self.y, self.t))
+        self.assertIsNotNone(self.sut.lookup('ID_3', self.x, self.y, self.t))
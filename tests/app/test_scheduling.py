@@ -0,0 +1,31 @@
+import unittest
+from app.scheduling import pack_work_units
+
+
+class TestScheduling(unittest.TestCase):
+
+    def test_every_task_is_packed_once(self):
+        # execute
+        actual = pack_work_units([5, 1, 8, 3, 3, 2, 7], 3)
+
+        # verify
+        self.assertEqual(sorted(task for unit in actual for task in unit), list(range(7)))
+
+    def test_skewed_costs_are_balanced(self):
+        # prepare: one large track and many small ones
+        costs = [100] + [10] * 10
+
+        # execute
+        actual = pack_work_units(costs, 3)
+
+        # verify: the large track runs alone, the small ones are batched into the other units
+        totals = [sum(costs[task] for task in unit) for unit in actual]
+        self.assertEqual(actual[0], [0])
+        self.assertEqual(totals, [100, 50, 50])
+
+    def test_units_are_limited_by_number_of_tasks(self):
+        # execute
+        actual = pack_work_units([4, 2], 8)
+
+        # verify
+        self.assertEqual(actual, [[0], [1]])
@@ -0,0 +1,59 @@
+import subprocess
+import sys
+import unittest
+from tests.config.definitions import ROOT_DIR
+from benchmarks.startup import PARENT_BUDGET_MS, PARENT_STATEMENT, WORKER_BUDGET_MS, WORKER_STATEMENT, measure, \
+    parse_importtime
+
+HEAVY_MODULES = ('pandas', 'geopandas', 'movingpandas', 'matplotlib', 'geographiclib')
+
+
+def imported_heavy_modules(statement: str) -> list:
+    completed = subprocess.run(
+        [sys.executable, '-c', f'{statement}\nimport sys\nprint(",".join(m for m in {HEAVY_MODULES} if m in sys.modules))'],
+        cwd=ROOT_DIR, capture_output=True, text=True, check=True
+    )
+    return [module for module in completed.stdout.strip().split(',') if module]
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_app_modules_import_heavy_dependencies_lazily(self):
+        # execute / verify
+        self.assertEqual([], imported_heavy_modules('import sdk.moveapps_execution, app.app'))
+
+    def test_array_kernel_workers_need_numpy_only(self):
+        # execute / verify
+        self.assertEqual([], imported_heavy_modules('import app.parallel, app.movement_metrics'))
+
+    def test_parent_import_time_within_budget(self):
+        # execute: the fastest of three runs, like the benchmark
+        actual = measure('parent', PARENT_STATEMENT, repeats=3, budget_ms=PARENT_BUDGET_MS, top=5)
+
+        # verify
+        self.assertTrue(actual['within_budget'], f'{actual["import_ms"]:.0f} ms, slowest: {actual["slowest_modules"]}')
+
+    def test_worker_import_time_within_budget(self):
+        # execute
+        actual = measure('worker', WORKER_STATEMENT, repeats=3, budget_ms=WORKER_BUDGET_MS, top=5)
+
+        # verify
+        self.assertTrue(actual['within_budget'], f'{actual["import_ms"]:.0f} ms, slowest: {actual["slowest_modules"]}')
+
+    def test_parse_importtime(self):
+        # prepare
+        stderr = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   numpy._core\n'
+            'import time:        80 |        200 | numpy\n'
+        )
+
+        # execute
+        actual = parse_importtime(stderr)
+
+        # verify
+        self.assertEqual([('numpy._core', 120, 120, 1), ('numpy', 80, 200, 0)], actual)
+
+
+if __name__ == '__main__':
+    unittest.main()
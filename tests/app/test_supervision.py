@@ -0,0 +1,56 @@
+import time
+import unittest
+from app.backends import get_backend
+from app.supervision import call_with_retries, run_supervised
+from sdk.moveapps_pool import MoveAppsPool
+
+
+def sleep_for(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+class Flaky:
+
+    def __init__(self, failures: int):
+        self.failures = failures
+
+    def __call__(self):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ValueError('not yet')
+        return 'done'
+
+
+class TestSupervision(unittest.TestCase):
+
+    def test_call_is_retried(self):
+        # execute
+        actual = call_with_retries(Flaky(failures=2), retries=2)
+
+        # verify
+        self.assertEqual(('done', None, 3), actual)
+
+    def test_error_of_last_attempt_is_returned(self):
+        # execute
+        actual = call_with_retries(Flaky(failures=2), retries=1)
+
+        # verify
+        self.assertEqual((None, 'ValueError: not yet', 2), actual)
+
+    def test_task_exceeding_timeout_is_given_up(self):
+        # prepare
+        backend = get_backend('processes', sleep_for, rows=3, tracks=3, n_budget=2)
+
+        # execute
+        with MoveAppsPool():
+            with backend.pool(2, 2) as pool:
+                actual = sorted(run_supervised(pool, backend, sleep_for, [0, 30, 0.01], timeout=1, retries=1,
+                                               in_flight=2))
+
+        # verify: the hanging task is tried twice, the task running besides it is run again and succeeds
+        self.assertEqual([(0, 0, 1), (1, None, 2), (2, 0.01, 1)], actual)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+import geopandas as gpd
+import numpy as np
+from app.track_index import build_track_index, select_tracks, write_track_index
+from app.tracks import split_tracks
+
+
+class TestTrackIndex(unittest.TestCase):
+
+    @staticmethod
+    def _points(track_ids: list, timestamps: list, x: list, y: list) -> gpd.GeoDataFrame:
+        return gpd.GeoDataFrame(
+            {'track_id': track_ids, 'distance': np.arange(len(track_ids), dtype=float)},
+            geometry=gpd.points_from_xy(x, y),
+            index=pd.DatetimeIndex(pd.to_datetime(timestamps), name='timestamp_utc'),
+            crs='epsg:4326'
+        )
+
+    def setUp(self) -> None:
+        data = self._points(
+            ['b', 'b', 'a', 'a', 'a'],
+            ['2001', '2002', '2000', '2001', '2002'],
+            [10, 12, 0, 1, -1],
+            [50, 49, 0, 2, 1]
+        )
+        data.loc[data['track_id'] == 'a', 'distance'] = [np.nan, 3.0, 5.0]
+        self.split = split_tracks(data, 'track_id')
+
+    def test_index_of_tracks(self):
+        # execute
+        actual = build_track_index(self.split, 'distance')
+
+        # verify: one row per track in the order of the split, the offsets address the rows of the point data
+        self.assertEqual(['b', 'a'], actual['track_id'].tolist())
+        self.assertEqual([0, 2], actual['offset'].tolist())
+        self.assertEqual([2, 3], actual['rows'].tolist())
+        self.assertEqual([2001, 2000], actual['start_time'].dt.year.tolist())
+        self.assertEqual([2002, 2002], actual['end_time'].dt.year.tolist())
+        self.assertEqual([10, -1], actual['min_x'].tolist())
+        self.assertEqual([12, 1], actual['max_x'].tolist())
+        self.assertEqual([49, 0], actual['min_y'].tolist())
+        self.assertEqual([50, 2], actual['max_y'].tolist())
+        # the missing distance of the first location is left out
+        self.assertEqual([1, 8], actual['distance_km_total'].tolist())
+        self.assertEqual([0.5, 4], actual['distance_km_mean'].tolist())
+        self.assertEqual([1, 5], actual['distance_km_max'].tolist())
+        row = actual.iloc[1]
+        track = self.split.data.iloc[row['offset']:row['offset'] + row['rows']]
+        self.assertEqual(['a'] * 3, track['track_id'].tolist())
+
+    def test_index_without_distances(self):
+        # execute
+        actual = build_track_index(self.split)
+
+        # verify
+        self.assertNotIn('distance_km_total', actual.columns)
+        self.assertEqual(2, len(actual))
+
+    def test_select_tracks(self):
+        # prepare
+        index = build_track_index(self.split)
+
+        # execute
+        by_area = select_tracks(index, bbox=(5, 45, 20, 55))
+        by_time = select_tracks(index, start=pd.Timestamp('2000-06-01'), end=pd.Timestamp('2000-12-31'))
+        by_both = select_tracks(index, bbox=(5, 45, 20, 55), end=pd.Timestamp('2000-12-31'))
+
+        # verify
+        self.assertEqual(['b'], by_area['track_id'].tolist())
+        self.assertEqual(['a'], by_time['track_id'].tolist())
+        self.assertEqual([], by_both['track_id'].tolist())
+
+    def test_write_track_index(self):
+        # prepare
+        index = build_track_index(self.split, 'distance')
+
+        # execute
+        with tempfile.TemporaryDirectory() as directory:
+            path = write_track_index(index, os.path.join(directory, 'track_index.csv'))
+            actual = pd.read_csv(path, parse_dates=['start_time', 'end_time'])
+
+        # verify
+        self.assertEqual(index['track_id'].tolist(), actual['track_id'].tolist())
+        self.assertEqual(index['offset'].tolist(), actual['offset'].tolist())
+        self.assertTrue((index['start_time'] == actual['start_time']).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
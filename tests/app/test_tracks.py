@@ -0,0 +1,157 @@
+import os
+import unittest
+from unittest import mock
+import pandas as pd
+import geopandas as gpd
+import numpy as np
+import movingpandas as mpd
+from tests.config.definitions import ROOT_DIR
+from app.tracks import rebuild_collection, split_tracks, track_view
+
+
+class TestTracks(unittest.TestCase):
+
+    @staticmethod
+    def _points(track_ids: list, timestamps: list) -> gpd.GeoDataFrame:
+        return gpd.GeoDataFrame(
+            {'track_id': track_ids},
+            geometry=gpd.points_from_xy(range(len(track_ids)), range(len(track_ids))),
+            index=pd.DatetimeIndex(pd.to_datetime(timestamps), name='timestamp_utc'),
+            crs='epsg:4326'
+        )
+
+    def test_split_sorted_data(self):
+        # prepare
+        data = self._points(['b', 'b', 'a', 'a', 'a'], ['2001', '2002', '2000', '2001', '2002'])
+
+        # execute
+        actual = split_tracks(data, 'track_id')
+
+        # verify: tracks keep the order of appearance and the data is not copied
+        self.assertIs(actual.data, data)
+        self.assertEqual(actual.track_ids.tolist(), ['b', 'a'])
+        self.assertEqual(actual.offsets.tolist(), [0, 2, 5])
+        self.assertEqual(actual.track(1)['track_id'].tolist(), ['a', 'a', 'a'])
+
+    def test_split_unsorted_data(self):
+        # prepare
+        data = self._points(['a', 'b', 'a', 'b', 'a'], ['2002', '2001', '2000', '2000', '2001'])
+
+        # execute
+        actual = split_tracks(data, 'track_id')
+
+        # verify
+        self.assertEqual(actual.track_ids.tolist(), ['a', 'b'])
+        self.assertEqual(actual.lengths().tolist(), [3, 2])
+        self.assertEqual(actual.track(0).index.year.tolist(), [2000, 2001, 2002])
+        self.assertEqual(actual.track(1).index.year.tolist(), [2000, 2001])
+        self.assertTrue(np.array_equal(actual.track(1).get_coordinates()['x'].to_numpy(), [3, 1]))
+
+    def test_track_view_built_once(self):
+        # prepare
+        data = mpd.TrajectoryCollection(
+            self._points(['b', 'b', 'a', 'a', 'a'], ['2001', '2002', '2000', '2001', '2002']).reset_index(),
+            traj_id_col='track_id',
+            t='timestamp_utc'
+        )
+
+        # execute
+        with mock.patch.object(data, 'to_point_gdf', wraps=data.to_point_gdf) as to_point_gdf:
+            actual = track_view(data)
+            again = track_view(data)
+
+        # verify
+        self.assertIs(actual, again)
+        self.assertEqual(1, to_point_gdf.call_count)
+        self.assertEqual('timestamp_utc', actual.t)
+        self.assertEqual(data.get_crs(), actual.crs)
+        self.assertEqual(actual.lengths().tolist(), [3, 2])
+
+        # the view translates back to an equal collection
+        rebuilt = rebuild_collection(actual.data, actual)
+        self.assertEqual([trajectory.id for trajectory in data.trajectories],
+                         [trajectory.id for trajectory in rebuilt.trajectories])
+        self.assertEqual(data.get_crs(), rebuilt.get_crs())
+
+    def test_rebuild_collection_equals_slow_path(self):
+        # prepare
+        data = pd.read_pickle(os.path.join(ROOT_DIR, 'resources/samples/input3_LatLon.pickle'))
+        view = track_view(data)
+        result = view.data.copy()
+        result['speed'] = np.arange(len(result), dtype=float)
+
+        # execute
+        fast = rebuild_collection(result, view, source=data)
+        slow = mpd.TrajectoryCollection(result, traj_id_col=view.track_id_col, t=view.t, crs=view.crs)
+
+        # verify
+        self.assertEqual(len(slow), len(fast))
+        self.assertEqual(slow.get_crs(), fast.get_crs())
+        self.assertEqual(slow.get_traj_id_col(), fast.get_traj_id_col())
+        # the slow path sets the track ID column anew, its dtype follows the pandas version instead of the input
+        track_id_col = view.track_id_col
+        slow_by_id = {trajectory.id: trajectory for trajectory in slow.trajectories}
+        for trajectory in fast.trajectories:
+            expected = slow_by_id[trajectory.id]
+            self.assertEqual(expected.is_latlon, trajectory.is_latlon)
+            self.assertEqual(expected.df[track_id_col].tolist(), trajectory.df[track_id_col].tolist())
+            pd.testing.assert_frame_equal(
+                expected.df.drop(columns=track_id_col),
+                trajectory.df.drop(columns=track_id_col),
+                check_like=True
+            )
+
+    def test_rebuilt_collection_shares_view(self):
+        # prepare
+        data = pd.read_pickle(os.path.join(ROOT_DIR, 'resources/samples/input3_LatLon.pickle'))
+        view = track_view(data)
+        result = view.data.copy()
+        result['speed'] = np.arange(len(result), dtype=float)
+
+        # execute
+        rebuilt = rebuild_collection(result, view, source=data)
+        with mock.patch.object(rebuilt, 'to_point_gdf', wraps=rebuilt.to_point_gdf) as to_point_gdf:
+            actual = track_view(rebuilt)
+
+        # verify: the view of the rebuilt collection is the result, and equals a view built from scratch
+        self.assertEqual(0, to_point_gdf.call_count)
+        self.assertIs(result, actual.data)
+        expected = split_tracks(rebuilt.to_point_gdf(), rebuilt.get_traj_id_col())
+        self.assertEqual(expected.offsets.tolist(), actual.offsets.tolist())
+        self.assertEqual(expected.track_ids.tolist(), actual.track_ids.tolist())
+        pd.testing.assert_frame_equal(expected.data, actual.data, check_like=True)
+
+    def test_view_follows_changed_trajectories(self):
+        # prepare: a rebuilt collection, whose view is known already, changed by a following hook
+        data = pd.read_pickle(os.path.join(ROOT_DIR, 'resources/samples/input3_LatLon.pickle'))
+        view = track_view(data)
+        rebuilt = rebuild_collection(view.data.copy(), view, source=data)
+        before = track_view(rebuilt)
+        rebuilt.add_speed(overwrite=True)
+
+        # execute
+        actual = track_view(rebuilt)
+
+        # verify
+        self.assertNotIn('speed', before.data.columns)
+        self.assertIn('speed', actual.data.columns)
+        self.assertIs(actual, track_view(rebuilt))
+
+    def test_rebuild_collection_changed_rows(self):
+        # prepare: the result drops rows of every track, so neither the input trajectories nor the offsets of the
+        # view apply
+        data = pd.read_pickle(os.path.join(ROOT_DIR, 'resources/samples/input3_LatLon.pickle'))
+        view = track_view(data)
+        result = view.data[np.arange(len(view.data)) % 7 != 0]
+
+        # execute
+        actual = rebuild_collection(result, view, source=data)
+
+        # verify: every row is in the trajectory of its track, like in a collection built from scratch
+        expected = mpd.TrajectoryCollection(result, traj_id_col=view.track_id_col, t=view.t)
+        self.assertEqual(len(result), sum(len(trajectory.df) for trajectory in actual.trajectories))
+        self.assertEqual([trajectory.id for trajectory in expected.trajectories],
+                         [trajectory.id for trajectory in actual.trajectories])
+        for trajectory, expected_trajectory in zip(actual.trajectories, expected.trajectories):
+            self.assertTrue((trajectory.df[view.track_id_col] == trajectory.id).all())
+            pd.testing.assert_frame_equal(expected_trajectory.df, trajectory.df, check_like=True)
@@ -0,0 +1,126 @@
+import multiprocessing as mp
+import os
+import tempfile
+import time
+from unittest import TestCase, mock
+from sdk.moveapps_broker import BrokerPool, TaskFailure, parse_address, run_worker
+
+
+def crash_once(marker: str) -> int:
+    # the first worker that runs the task dies without a result
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+    return os.getpid()
+
+
+def fail_once(marker: str) -> str:
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        raise ValueError('first attempt')
+    return 'done'
+
+
+def hang(seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+
+class TestBrokerPool(TestCase):
+
+    def test_local_workers_run_all_tasks(self):
+        # execute
+        with BrokerPool(local_workers=3) as sut:
+            actual = list(sut.imap_unordered(abs, range(-20, 0)))
+
+        # verify
+        self.assertEqual(list(range(1, 21)), sorted(actual))
+
+    def test_workers_started_separately(self):
+        # prepare: a broker on localhost without workers of its own, like one serving other hosts
+        with BrokerPool(local_workers=0, address=('127.0.0.1', 0), authkey='secret') as sut:
+            workers = [mp.Process(target=run_worker, args=(sut.address, 'secret')) for _ in range(2)]
+            for worker in workers:
+                worker.start()
+
+            # execute
+            actual = list(sut.imap_unordered(abs, [-1, -2, -3]))
+            second_run = list(sut.imap_unordered(abs, [-4]))
+
+        # verify: the workers stop with the broker
+        for worker in workers:
+            worker.join(10)
+            self.assertEqual(0, worker.exitcode)
+        self.assertEqual([1, 2, 3], sorted(actual))
+        self.assertEqual([4], second_run)
+
+    def test_task_of_lost_worker_is_reassigned(self):
+        # prepare
+        with tempfile.TemporaryDirectory() as directory:
+            marker = os.path.join(directory, 'crashed')
+
+            # execute
+            with BrokerPool(local_workers=2, retries=1, lease_seconds=2) as sut:
+                actual = list(sut.imap_unordered(crash_once, [marker]))
+
+        # verify
+        self.assertEqual(1, len(actual))
+
+    def test_failed_task_is_retried(self):
+        # prepare
+        with tempfile.TemporaryDirectory() as directory:
+            # execute
+            with BrokerPool(local_workers=1, retries=1) as sut:
+                actual = list(sut.imap_unordered(fail_once, [os.path.join(directory, 'retried')]))
+            succeeding = os.path.join(directory, 'failed-before')
+            open(succeeding, 'w').close()
+            with BrokerPool(local_workers=1, retries=0) as sut:
+                not_retried = list(sut.imap_unordered(fail_once, [os.path.join(directory, 'not-retried'), succeeding]))
+
+        # verify: without retries left the failure is the result of the task, the other tasks go on
+        self.assertEqual(['done'], actual)
+        failures = [result for result in not_retried if isinstance(result, TaskFailure)]
+        self.assertEqual(['done'], [result for result in not_retried if not isinstance(result, TaskFailure)])
+        self.assertEqual(1, len(failures))
+        self.assertEqual(os.path.join(directory, 'not-retried'), failures[0].task)
+        self.assertEqual('ValueError: first attempt', failures[0].error)
+        self.assertEqual(1, failures[0].attempts)
+
+    def test_hanging_task_times_out(self):
+        # execute: the worker keeps sending heartbeats while its task hangs
+        started = time.monotonic()
+        with BrokerPool(local_workers=1, retries=1, task_timeout=1) as sut:
+            actual = list(sut.imap_unordered(hang, [60, 0]))
+
+            # verify: the task is given up after its retries, the worker stopped itself and was replaced
+            self.assertLess(time.monotonic() - started, 30)
+            self.assertIn(0, actual)
+            failures = [result for result in actual if isinstance(result, TaskFailure)]
+            self.assertEqual([(60, 'timeout after 1 s', 2)],
+                             [(failure.task, failure.error, failure.attempts) for failure in failures])
+            self.assertEqual([0], list(sut.imap_unordered(hang, [0])))
+
+    def test_data_dir(self):
+        # execute / verify: a broker on localhost shares a temporary directory with its workers
+        with BrokerPool(local_workers=0) as sut:
+            data_dir = sut.data_dir
+            self.assertTrue(os.path.isdir(data_dir))
+        self.assertFalse(os.path.exists(data_dir))
+        with mock.patch.dict(os.environ, {'BROKER_DATA_DIR': ''}), BrokerPool(local_workers=0) as sut:
+            self.assertIsNone(sut.data_dir)
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.dict(os.environ, {'BROKER_DATA_DIR': directory}), BrokerPool(local_workers=0) as sut:
+                self.assertEqual(directory, sut.data_dir)
+            self.assertTrue(os.path.isdir(directory))
+
+    def test_no_worker(self):
+        # execute / verify
+        with BrokerPool(local_workers=0, connect_timeout=0.5) as sut:
+            with self.assertRaises(RuntimeError):
+                list(sut.imap_unordered(abs, [-1]))
+
+    def test_parse_address(self):
+        # execute / verify
+        self.assertEqual(('broker-host', 50000), parse_address('broker-host:50000'))
+        with self.assertRaises(ValueError):
+            parse_address('broker-host')
@@ -0,0 +1,134 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+import pluggy
+import movingpandas as mpd
+from movingpandas import TrajectoryCollection
+from sdk.moveapps_execution import MoveAppsExecutor
+from sdk.moveapps_formats import write_trajectories
+from sdk.moveapps_spec import HOOK_NAMESPACE, MoveAppsSpec, hook_impl
+
+
+class AddStep:
+
+    @hook_impl
+    def execute(self, data: TrajectoryCollection, config: dict) -> TrajectoryCollection:
+        gdf = data.to_point_gdf()
+        gdf['steps'] = gdf['steps'] + 'a' if 'steps' in gdf else 'a'
+        return mpd.TrajectoryCollection(gdf, traj_id_col=data.get_traj_id_col(), t=gdf.index.name)
+
+
+class AddOtherStep:
+
+    @hook_impl
+    def execute(self, data: TrajectoryCollection, config: dict) -> TrajectoryCollection:
+        gdf = data.to_point_gdf()
+        gdf['steps'] = gdf['steps'] + 'b' if 'steps' in gdf else 'b'
+        return mpd.TrajectoryCollection(gdf, traj_id_col=data.get_traj_id_col(), t=gdf.index.name)
+
+
+class AttachTrackIndex:
+
+    @hook_impl
+    def execute(self, data: TrajectoryCollection, config: dict) -> TrajectoryCollection:
+        # like the App: one row per track with its rows in the point data of this batch
+        rows = [len(trajectory.df) for trajectory in data.trajectories]
+        data.track_index = pd.DataFrame({
+            'track_id': [trajectory.id for trajectory in data.trajectories],
+            'offset': [sum(rows[:position]) for position in range(len(rows))],
+            'rows': rows
+        })
+        return data
+
+
+class TestMoveAppsExecutor(unittest.TestCase):
+
+    def _run(self, directory: str, hooks: list, **env) -> tuple:
+        data = mpd.TrajectoryCollection(
+            pd.DataFrame([
+                {'timestamp_utc': "2001-06-11 09:00:00", 'coords_x': 1, 'coords_y': 5, 'track_id': 'ID_1'},
+                {'timestamp_utc': "2001-07-12 09:00:00", 'coords_x': 2, 'coords_y': 4, 'track_id': 'ID_1'},
+                {'timestamp_utc': "2000-06-11 09:00:00", 'coords_x': 1, 'coords_y': 5, 'track_id': 'ID_2'},
+                {'timestamp_utc': "2000-07-12 09:00:00", 'coords_x': 2, 'coords_y': 4, 'track_id': 'ID_2'}
+            ]),
+            traj_id_col='track_id', t='timestamp_utc', crs='epsg:4326', x='coords_x', y='coords_y'
+        )
+        pd.to_pickle(data, os.path.join(directory, 'input.pickle'))
+        with open(os.path.join(directory, 'config.json'), 'w') as file:
+            json.dump({}, file)
+        pm = pluggy.PluginManager(HOOK_NAMESPACE)
+        pm.add_hookspecs(MoveAppsSpec)
+        for hook in hooks:
+            pm.register(hook)
+        with mock.patch.dict(os.environ, {
+            'SOURCE_FILE': os.path.join(directory, 'input.pickle'),
+            'OUTPUT_FILE': os.path.join(directory, 'output.pickle'),
+            'ERROR_FILE': os.path.join(directory, 'error.txt'),
+            'CONFIGURATION_FILE': os.path.join(directory, 'config.json'),
+            'APP_ARTIFACTS_DIR': directory,
+            **env
+        }):
+            MoveAppsExecutor(plugin_manager=pm).execute()
+        with open(os.path.join(directory, 'instrumentation.json')) as file:
+            stages = [stage['stage'] for stage in json.load(file)['stages']]
+        return pd.read_pickle(os.path.join(directory, 'output.pickle')), stages
+
+    def test_chained_hooks_run_in_registration_order(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # execute
+            output, stages = self._run(directory, [AddStep(), AddOtherStep()], CHAIN_HOOKS='yes')
+
+            # verify: the output of the first hook is the input of the second one
+            self.assertEqual(['ab'] * 4, output.to_point_gdf()['steps'].tolist())
+            self.assertIn('call_app:0:AddStep', stages)
+            self.assertIn('call_app:1:AddOtherStep', stages)
+
+    def test_without_chaining_only_first_output_is_kept(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # execute: pluggy calls the hook registered last first
+            output, _ = self._run(directory, [AddStep(), AddOtherStep()])
+
+            # verify
+            self.assertEqual(['b'] * 4, output.to_point_gdf()['steps'].tolist())
+
+    def test_streaming_writes_track_index_of_all_batches(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # prepare: three tracks of different lengths
+            data = mpd.TrajectoryCollection(
+                pd.DataFrame([
+                    {'timestamp_utc': f"2001-06-{day:02d} 09:00:00", 'coords_x': day, 'coords_y': 5, 'track_id': track}
+                    for track, days in (('ID_1', 3), ('ID_2', 2), ('ID_3', 4)) for day in range(1, days + 1)
+                ]),
+                traj_id_col='track_id', t='timestamp_utc', crs='epsg:4326', x='coords_x', y='coords_y'
+            )
+            write_trajectories(data, os.path.join(directory, 'input.parquet'))
+            pm = pluggy.PluginManager(HOOK_NAMESPACE)
+            pm.add_hookspecs(MoveAppsSpec)
+            pm.register(AttachTrackIndex())
+
+            # execute: one track per batch
+            with mock.patch.dict(os.environ, {
+                'SOURCE_FILE': os.path.join(directory, 'input.parquet'),
+                'OUTPUT_FILE': os.path.join(directory, 'output.parquet'),
+                'ERROR_FILE': os.path.join(directory, 'error.txt'),
+                'CONFIGURATION': '{}',
+                'APP_ARTIFACTS_DIR': directory,
+                'STREAM_BATCH_ROWS': '1'
+            }):
+                MoveAppsExecutor(plugin_manager=pm).execute()
+
+            # verify: one index of all batches, with the offsets of the tracks in the output file
+            index = pd.read_csv(os.path.join(directory, 'track_index.csv'))
+            self.assertEqual(['ID_1', 'ID_2', 'ID_3'], index['track_id'].tolist())
+            self.assertEqual([0, 3, 5], index['offset'].tolist())
+            self.assertEqual([3, 2, 4], index['rows'].tolist())
+            output = pd.read_parquet(os.path.join(directory, 'output.parquet'))
+            for row in index.itertuples():
+                self.assertTrue((output['track_id'].iloc[row.offset:row.offset + row.rows] == row.track_id).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
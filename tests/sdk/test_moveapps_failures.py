@@ -0,0 +1,36 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from sdk.moveapps_failures import FailureManifest
+
+
+class TestFailureManifest(unittest.TestCase):
+
+    def test_failures_are_written_as_artifact(self):
+        with tempfile.TemporaryDirectory() as directory, mock.patch.dict(os.environ, {'APP_ARTIFACTS_DIR': directory}):
+            # execute
+            with FailureManifest() as manifest:
+                self.assertIs(manifest, FailureManifest.current())
+                manifest.record('parallelize:add_distance', [{'track_id': 'ID_2', 'error': 'boom', 'attempts': 2}])
+            path = manifest.write()
+
+            # verify
+            self.assertIsNone(FailureManifest.current())
+            self.assertEqual(os.path.join(directory, 'failures.json'), path)
+            with open(path) as file:
+                actual = json.load(file)
+            self.assertEqual(1, actual['failed_tracks'])
+            self.assertEqual(
+                [{'stage': 'parallelize:add_distance', 'track_id': 'ID_2', 'error': 'boom', 'attempts': 2}],
+                actual['failures']
+            )
+
+    def test_nothing_is_written_without_failures(self):
+        # execute / verify
+        self.assertIsNone(FailureManifest().write())
+
+
+if __name__ == '__main__':
+    unittest.main()
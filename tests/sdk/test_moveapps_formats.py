@@ -0,0 +1,232 @@
+import importlib.util
+import os
+import tempfile
+from unittest import TestCase, mock
+import numpy as np
+import pandas as pd
+from tests.config.definitions import ROOT_DIR
+from sdk.moveapps_formats import TrajectoryWriter, describe, detect_format, iter_trajectories, read_pickle, \
+    read_trajectories, resolve_compression, write_pickle, write_trajectories
+
+
+class TestMoveAppsFormats(TestCase):
+
+    def setUp(self) -> None:
+        self.data = pd.read_pickle(os.path.join(ROOT_DIR, 'resources/samples/input3_LatLon.pickle'))
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_detect_format(self):
+        # execute / verify
+        self.assertEqual('parquet', detect_format('out/output.parquet'))
+        self.assertEqual('arrow', detect_format('out/output.Arrow'))
+        self.assertEqual('arrow', detect_format('out/output.feather'))
+        self.assertEqual('pickle', detect_format('out/output.pickle'))
+        self.assertEqual('pickle', detect_format('out/output'))
+
+    def test_roundtrip(self):
+        for file_name in ('output.parquet', 'output.arrow', 'output.pickle'):
+            # prepare
+            path = os.path.join(self.directory.name, file_name)
+
+            # execute
+            write_trajectories(self.data, path)
+            actual = read_trajectories(path)
+
+            # verify
+            expected_gdf = self.data.to_point_gdf()
+            actual_gdf = actual.to_point_gdf()
+            self.assertEqual(len(self.data), len(actual), file_name)
+            self.assertEqual(self.data.get_traj_id_col(), actual.get_traj_id_col(), file_name)
+            self.assertEqual(self.data.get_crs(), actual.get_crs(), file_name)
+            self.assertEqual(expected_gdf.index.name, actual_gdf.index.name, file_name)
+            self.assertTrue(expected_gdf.index.equals(actual_gdf.index), file_name)
+            self.assertTrue(expected_gdf.geometry.geom_equals(actual_gdf.geometry).all(), file_name)
+
+    def test_column_projection(self):
+        # prepare
+        path = os.path.join(self.directory.name, 'output.parquet')
+        write_trajectories(self.data, path)
+        track_id_col = self.data.get_traj_id_col()
+
+        # execute
+        actual = read_trajectories(path, columns=['sensor_type_id']).to_point_gdf()
+
+        # verify
+        self.assertEqual(sorted([track_id_col, 'geometry', 'sensor_type_id']), sorted(actual.columns))
+        self.assertEqual(len(self.data.to_point_gdf()), len(actual))
+
+    def test_column_projection_unknown_column(self):
+        # prepare
+        path = os.path.join(self.directory.name, 'output.arrow')
+        write_trajectories(self.data, path)
+
+        # execute / verify
+        with self.assertRaises(ValueError):
+            read_trajectories(path, columns=['no-such-column'])
+
+    def assert_same_trajectories(self, actual, message=None):
+        self.assertEqual(len(self.data), len(actual), message)
+        expected_gdf = self.data.to_point_gdf()
+        actual_gdf = actual.to_point_gdf()
+        self.assertTrue(expected_gdf.index.equals(actual_gdf.index), message)
+        self.assertTrue(expected_gdf.geometry.geom_equals(actual_gdf.geometry).all(), message)
+
+    def test_pickle_compression_roundtrip(self):
+        compressions = [None, 'gzip', 'auto']
+        compressions += [name for name, module in (('zstd', 'zstandard'), ('lz4', 'lz4'))
+                         if importlib.util.find_spec(module) is not None]
+        for compression in compressions:
+            for out_of_band in (False, True):
+                # prepare
+                path = os.path.join(self.directory.name, 'output.pickle')
+                message = f'{compression}, out-of-band: {out_of_band}'
+
+                # execute
+                write_trajectories(self.data, path, compression=compression, out_of_band=out_of_band)
+                actual = read_trajectories(path)
+
+                # verify
+                self.assert_same_trajectories(actual, message)
+
+    def test_plain_pickle_readable_by_pandas(self):
+        # prepare
+        path = os.path.join(self.directory.name, 'output.pickle')
+
+        # execute
+        write_pickle(self.data, path)
+
+        # verify
+        self.assert_same_trajectories(pd.read_pickle(path))
+
+    def test_read_pickle_none(self):
+        # prepare
+        path = os.path.join(self.directory.name, 'output.pickle')
+        write_pickle(None, path, compression='gzip')
+
+        # execute / verify
+        self.assertIsNone(read_pickle(path))
+
+    def test_unknown_compression(self):
+        # execute / verify
+        with self.assertRaises(ValueError):
+            resolve_compression('brotli')
+
+    def test_atomic_write(self):
+        # prepare
+        path = os.path.join(self.directory.name, 'output.pickle')
+        write_pickle(self.data, path)
+
+        # execute: a failing write keeps the previous file
+        with self.assertRaises(Exception):
+            write_pickle(lambda: None, path)
+
+        # verify
+        self.assertEqual(['output.pickle'], os.listdir(self.directory.name))
+        self.assert_same_trajectories(read_pickle(path))
+
+    def test_written_files_follow_umask(self):
+        # prepare: the umask of the process, read once at import
+        with mock.patch('sdk.moveapps_formats._UMASK', 0o027):
+            # execute
+            write_pickle(self.data, os.path.join(self.directory.name, 'output.pickle'))
+            write_trajectories(self.data, os.path.join(self.directory.name, 'output.parquet'))
+
+        # verify: like a file opened for writing, not the owner-only mode of temporary files
+        for name in ('output.pickle', 'output.parquet'):
+            self.assertEqual(0o640, os.stat(os.path.join(self.directory.name, name)).st_mode & 0o777, name)
+
+    def test_replaced_files_keep_their_mode(self):
+        # prepare
+        path = os.path.join(self.directory.name, 'output.pickle')
+        write_pickle(self.data, path)
+        os.chmod(path, 0o604)
+
+        # execute
+        write_pickle(self.data, path)
+
+        # verify
+        self.assertEqual(0o604, os.stat(path).st_mode & 0o777)
+
+    def test_describe(self):
+        # execute
+        actual = describe(self.data)
+
+        # verify
+        rows = len(self.data.to_point_gdf())
+        self.assertTrue(actual.startswith(f'TrajectoryCollection with {len(self.data)} tracks, {rows} rows'))
+        self.assertEqual('NoneType', describe(None))
+
+    def test_streaming_roundtrip(self):
+        for extension in ('parquet', 'arrow'):
+            # prepare
+            source = os.path.join(self.directory.name, f'input.{extension}')
+            output = os.path.join(self.directory.name, f'output.{extension}')
+            write_trajectories(self.data, source)
+
+            # execute
+            batches = []
+            with TrajectoryWriter(output) as writer:
+                for batch in iter_trajectories(source, batch_rows=500):
+                    batches.append([trajectory.id for trajectory in batch.trajectories])
+                    writer.write(batch)
+
+            # verify: every track is read completely in one batch
+            track_ids = [track_id for batch in batches for track_id in batch]
+            self.assertGreater(len(batches), 1, extension)
+            self.assertEqual(sorted(trajectory.id for trajectory in self.data.trajectories), sorted(track_ids))
+            self.assertEqual(len(set(track_ids)), len(track_ids), extension)
+            self.assertEqual(len(self.data.to_point_gdf()), writer.rows, extension)
+            self.assert_same_trajectories(read_trajectories(output), extension)
+
+    def test_streaming_without_geoarrow_field_metadata(self):
+        # prepare: like files of geopandas versions that describe the geometries only in the GeoParquet metadata
+        import pyarrow.parquet as pq
+        path = os.path.join(self.directory.name, 'input.parquet')
+        write_trajectories(self.data, path)
+        table = pq.read_table(path)
+        index = table.schema.get_field_index('geometry')
+        table = table.cast(table.schema.set(index, table.schema.field(index).with_metadata({})))
+        pq.write_table(table, path)
+
+        # execute
+        actual = list(iter_trajectories(path, batch_rows=500))
+
+        # verify
+        self.assertEqual(len(self.data.to_point_gdf()), sum(len(batch.to_point_gdf()) for batch in actual))
+        self.assertEqual(self.data.trajectories[0].crs, actual[0].trajectories[0].crs)
+        self.assertIn('moveapps', actual[0].to_point_gdf().attrs)
+
+    def test_streaming_needs_grouped_tracks(self):
+        # prepare: rows of all tracks interleaved
+        path = os.path.join(self.directory.name, 'input.parquet')
+        gdf = self.data.to_point_gdf()
+        interleaved = gdf.iloc[np.r_[0:len(gdf):2, 1:len(gdf):2]]
+        write_trajectories(
+            mock.Mock(to_point_gdf=lambda: interleaved, get_traj_id_col=self.data.get_traj_id_col),
+            path
+        )
+
+        # execute / verify
+        with self.assertRaises(ValueError):
+            list(iter_trajectories(path, batch_rows=500, prefetch=0))
+
+    def test_streaming_writer_discards_failed_output(self):
+        # prepare
+        path = os.path.join(self.directory.name, 'output.parquet')
+
+        # execute
+        with self.assertRaises(RuntimeError):
+            with TrajectoryWriter(path) as writer:
+                writer.write(self.data)
+                raise RuntimeError('failed')
+
+        # verify
+        self.assertEqual([], os.listdir(self.directory.name))
+
+    def test_streaming_pickle_not_supported(self):
+        # execute / verify
+        with self.assertRaises(ValueError):
+            TrajectoryWriter(os.path.join(self.directory.name, 'output.pickle'))
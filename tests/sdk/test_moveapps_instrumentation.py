@@ -0,0 +1,63 @@
+import os
+import json
+import time
+from unittest import TestCase
+from tests.config.definitions import ROOT_DIR
+from sdk.moveapps_instrumentation import Instrumentation
+
+
+class TestInstrumentation(TestCase):
+
+    def setUp(self) -> None:
+        os.environ['APP_ARTIFACTS_DIR'] = os.path.join(ROOT_DIR, 'tests/resources/output')
+        self.report_file = os.path.join(ROOT_DIR, 'tests/resources/output', 'instrumentation-test.json')
+
+    def tearDown(self) -> None:
+        for file in (self.report_file, os.path.join(ROOT_DIR, 'tests/resources/output', 'profile.folded')):
+            if os.path.exists(file):
+                os.remove(file)
+
+    def test_stages_are_recorded(self):
+        # prepare
+        sut = Instrumentation(profile='')
+
+        # execute
+        with sut:
+            with sut.stage('sleep'):
+                time.sleep(0.05)
+            with self.assertRaises(ValueError):
+                with sut.stage('fail'):
+                    raise ValueError()
+
+        # verify
+        self.assertEqual(['sleep', 'fail'], [stage['stage'] for stage in sut.stages])
+        self.assertGreaterEqual(sut.stages[0]['wall_seconds'], 0.05)
+        self.assertLess(sut.stages[0]['cpu_seconds'], 0.05)
+        self.assertGreater(sut.stages[0]['process_peak_rss_mb'], 0)
+        self.assertGreaterEqual(sut.stages[0]['peak_rss_growth_mb'], 0)
+        self.assertTrue(sut.stages[1]['failed'])
+
+    def test_current(self):
+        # execute / verify
+        self.assertIsNone(Instrumentation.current())
+        with Instrumentation(profile='') as sut:
+            self.assertIs(sut, Instrumentation.current())
+        self.assertIsNone(Instrumentation.current())
+
+    def test_report_is_written_as_artifact(self):
+        # prepare
+        sut = Instrumentation(profile='sampling')
+        with sut:
+            with sut.stage('busy'):
+                sum(i * i for i in range(200000))
+        sut.record_tasks('parallelize:test', [{'track_id': 'a', 'rows': 2}])
+
+        # execute
+        sut.write('instrumentation-test.json')
+
+        # verify
+        with open(self.report_file) as file:
+            actual = json.load(file)
+        self.assertEqual('busy', actual['stages'][0]['stage'])
+        self.assertEqual([{'stage': 'parallelize:test', 'track_id': 'a', 'rows': 2}], actual['tasks'])
+        self.assertTrue(os.path.exists(os.path.join(ROOT_DIR, 'tests/resources/output', 'profile.folded')))
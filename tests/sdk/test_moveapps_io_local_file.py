@@ -1,4 +1,5 @@
 import os
+import warnings
 from unittest import TestCase
 from tests.config.definitions import ROOT_DIR
 from sdk.moveapps_io import MoveAppsIo
@@ -55,3 +56,21 @@ class TestMoveAppsIo(TestCase):
 
         # verify
         self.assertIsNone(actual)
+
+    def test_get_app_file_path_warns_at_caller(self):
+        # prepare
+        os.environ['LOCAL_APP_FILES_DIR'] = \
+            os.path.join(ROOT_DIR, 'tests/resources/auxiliary/local-app-files/provided_only')
+
+        # execute
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.sut.get_app_file_path('config-id')
+            MoveAppsIo.get_app_file_path('config-id')
+
+        # verify: the warning points at the line of the call, for instance and class calls
+        self.assertEqual(2, len(caught))
+        for warning in caught:
+            self.assertIs(DeprecationWarning, warning.category)
+            self.assertIn('get_app_file_path', str(warning.message))
+            self.assertEqual(os.path.abspath(__file__), os.path.abspath(warning.filename))
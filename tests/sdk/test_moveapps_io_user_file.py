@@ -1,5 +1,6 @@
 import os
-from unittest import TestCase
+import tempfile
+from unittest import TestCase, mock
 from tests.config.definitions import ROOT_DIR
 from sdk.moveapps_io import MoveAppsIo
 
@@ -8,6 +9,7 @@ class TestMoveAppsIo(TestCase):
 
     def setUp(self) -> None:
         self.sut = MoveAppsIo()
+        self.sut.clear_caches()
 
     def test_get_user_app_file_path_provided_only(self):
         # prepare
@@ -90,3 +92,59 @@ class TestMoveAppsIo(TestCase):
 
         # verify
         self.assertIsNone(actual)
+
+    def test_resolved_file_is_cached_until_directory_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # prepare
+            os.environ['USER_APP_FILE_HOME_DIR'] = directory
+            setting_dir = os.path.join(directory, 'provided-app-files', 'config-id')
+            os.makedirs(setting_dir)
+            open(os.path.join(setting_dir, 'first'), 'w').close()
+
+            # execute
+            first = self.sut.get_auxiliary_file_path('config-id')
+            with mock.patch('sdk.moveapps_io.os.listdir', side_effect=AssertionError('not cached')):
+                again = self.sut.get_auxiliary_file_path('config-id')
+            os.remove(os.path.join(setting_dir, 'first'))
+            open(os.path.join(setting_dir, 'second'), 'w').close()
+            changed = self.sut.get_auxiliary_file_path('config-id')
+
+            # verify
+            self.assertEqual(os.path.join(setting_dir, 'first'), first)
+            self.assertEqual(first, again)
+            self.assertEqual(os.path.join(setting_dir, 'second'), changed)
+
+    def test_loaded_file_is_memoized(self):
+        # prepare
+        os.environ['USER_APP_FILE_HOME_DIR'] = \
+            os.path.join(ROOT_DIR, 'tests/resources/auxiliary/local-app-files/provided_only')
+        parser = mock.Mock(side_effect=lambda path: {'path': path})
+
+        # execute
+        first = self.sut.load_auxiliary_file('config-id', parser)
+        second = self.sut.load_auxiliary_file('config-id', parser)
+
+        # verify
+        self.assertIs(first, second)
+        parser.assert_called_once()
+
+    def test_loaded_file_is_memory_mapped_read_only(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # prepare
+            path = os.path.join(directory, 'table.bin')
+            with open(path, 'wb') as file:
+                file.write(b'abc')
+
+            # execute
+            actual = self.sut.load_file(path)
+            with open(path, 'wb') as file:
+                file.write(b'abcdef')
+            changed = self.sut.load_file(path)
+
+            # verify
+            self.assertTrue(actual.readonly)
+            self.assertEqual(b'abc', actual.tobytes())
+            self.assertEqual(b'abcdef', changed.tobytes())
+            actual.release()
+            changed.release()
+            self.sut.clear_caches()
@@ -0,0 +1,53 @@
+import logging
+import os
+from unittest import TestCase, mock
+from sdk.moveapps_logging import RateLimitFilter
+from sdk.moveapps_pool import MoveAppsPool
+
+
+def log_in_worker(level: int) -> int:
+    logging.getLogger('tests.worker').log(level, f'hello from {os.getpid()}')
+    return len(logging.getLogger().handlers)
+
+
+class TestMoveAppsLogging(TestCase):
+
+    def test_worker_records_reach_parent(self):
+        # execute: the workers are started first, so they do not inherit the capturing handler of the test
+        with MoveAppsPool() as sut:
+            pool = sut.get(2)
+            with self.assertLogs('tests.worker', level=logging.INFO) as logs:
+                handlers = pool.map(log_in_worker, [logging.INFO] * 4)
+                sut.shutdown()
+
+        # verify: every record arrives once, and each worker has a single handler however many tasks it ran
+        self.assertEqual(4, len(logs.records))
+        self.assertTrue(all(record.getMessage().startswith('[') for record in logs.records))
+        self.assertTrue(all(record.process != os.getpid() for record in logs.records))
+        self.assertEqual([1] * 4, handlers)
+
+    def test_worker_level_gating(self):
+        # execute
+        with mock.patch.dict(os.environ, {'WORKER_LOG_LEVEL': 'WARNING'}), MoveAppsPool() as sut:
+            pool = sut.get(1)
+            with self.assertLogs('tests.worker', level=logging.INFO) as logs:
+                pool.map(log_in_worker, [logging.INFO, logging.WARNING, logging.INFO])
+                sut.shutdown()
+
+        # verify
+        self.assertEqual([logging.WARNING], [record.levelno for record in logs.records])
+
+    def test_rate_limit(self):
+        # prepare
+        sut = RateLimitFilter(rate=2)
+        records = [logging.LogRecord('test', logging.INFO, __file__, 1, f'message {i}', None, None) for i in range(10)]
+        warning = logging.LogRecord('test', logging.WARNING, __file__, 1, 'warning', None, None)
+
+        # execute
+        passed = [record for record in records if sut.filter(record)]
+        warning_passed = sut.filter(warning)
+
+        # verify
+        self.assertEqual(['message 0', 'message 1'], [record.getMessage() for record in passed])
+        self.assertTrue(warning_passed)
+        self.assertEqual('warning (8 messages suppressed)', warning.getMessage())
@@ -0,0 +1,44 @@
+from unittest import TestCase
+from sdk.moveapps_pool import MoveAppsPool
+
+
+class TestMoveAppsPool(TestCase):
+
+    def test_pool_is_reused(self):
+        # execute
+        with MoveAppsPool() as sut:
+            first = sut.get(2)
+            second = sut.get(2)
+            actual = first.map(abs, [-1, -2])
+
+        # verify
+        self.assertIs(first, second)
+        self.assertEqual([1, 2], actual)
+
+    def test_pool_is_restarted_for_other_size(self):
+        # execute
+        with MoveAppsPool() as sut:
+            first = sut.get(1)
+            second = sut.get(2)
+
+        # verify
+        self.assertIsNot(first, second)
+
+    def test_current_pool(self):
+        # execute / verify
+        self.assertIsNone(MoveAppsPool.current())
+        with MoveAppsPool() as sut:
+            self.assertIs(sut, MoveAppsPool.current())
+        self.assertIsNone(MoveAppsPool.current())
+
+    def test_pool_is_shut_down_on_error(self):
+        # execute
+        with self.assertRaises(RuntimeError):
+            with MoveAppsPool() as sut:
+                pool = sut.get(1)
+                raise RuntimeError('app failed')
+
+        # verify
+        self.assertIsNone(MoveAppsPool.current())
+        with self.assertRaises(ValueError):
+            pool.map(abs, [-1])
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+from sdk.moveapps_formats import TrajectoryWriter, read_trajectories
+from tests.config.definitions import ROOT_DIR
+from utils.input_converter import InputConverter, convert_all
+
+
+class TestInputConverter(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.input = os.path.join(ROOT_DIR, 'utils/resources/input/input3')
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_engines_give_same_trajectories(self):
+        # prepare
+        expected = pd.read_pickle(os.path.join(ROOT_DIR, 'resources/samples/input3_LatLon.pickle')).to_point_gdf()
+        converters = {
+            'pyarrow': InputConverter(engine='pyarrow'),
+            'c': InputConverter(engine='c'),
+        }
+        for name, converter in converters.items():
+            path = os.path.join(self.directory.name, f'{name}.pickle')
+
+            # execute
+            stats = converter.csv_to_pickle(self.input, path)
+
+            # verify
+            actual = pd.read_pickle(path).to_point_gdf()
+            self.assertEqual(len(expected), stats['rows'], name)
+            self.assertGreater(stats['rows_per_second'], 0, name)
+            self.assertTrue((actual.index == expected.index).all(), name)
+            self.assertTrue(actual.geometry.geom_equals(expected.geometry).all(), name)
+
+    def write_input(self, track_rows: list) -> str:
+        # tracks of the given lengths, one after the other; the later tracks fill the sparse columns
+        rows = []
+        for track, length in enumerate(track_rows):
+            for index in range(length):
+                rows.append({
+                    'location.long': 8 + track + index / 100,
+                    'location.lat': 47 + index / 100,
+                    'timestamps': f'2020-01-{index // 24 + 1:02d} {index % 24:02d}:00:00.000',
+                    'trackId': f'track_{track}',
+                    'comments': 'ringed' if track >= 2 else None,
+                    'tag.id': track * 10 if track != 1 else None,
+                })
+        directory = os.path.join(self.directory.name, 'input')
+        os.makedirs(directory, exist_ok=True)
+        pd.DataFrame(rows).to_csv(os.path.join(directory, 'link.csv'), index=False)
+        pd.DataFrame([{'crs': 'EPSG:4326', 'tzone': 'UTC'}]).to_csv(os.path.join(directory, 'meta.csv'), index=False)
+        return directory
+
+    def test_chunks_give_same_trajectories(self):
+        # prepare: a track shorter than a chunk, tracks across chunk boundaries and one longer than two chunks
+        track_rows = [3, 7, 12, 5, 5]
+        directory = self.write_input(track_rows)
+        expected_path = os.path.join(self.directory.name, 'expected.parquet')
+        InputConverter(engine='c', chunk_bytes=10 ** 12).csv_to_pickle(directory, expected_path)
+        path = os.path.join(self.directory.name, 'chunked.parquet')
+        written = []
+        write = TrajectoryWriter.write
+
+        def record(writer, data):
+            written.append(len(data.to_point_gdf()))
+            write(writer, data)
+
+        # execute
+        with mock.patch.object(TrajectoryWriter, 'write', autospec=True, side_effect=record):
+            stats = InputConverter(engine='c', chunk_bytes=0, chunk_rows=5).csv_to_pickle(directory, path)
+
+        # verify: the same data, never more than a chunk and the longest track at once
+        self.assertEqual(sum(track_rows), stats['rows'])
+        self.assertEqual(sum(track_rows), sum(written))
+        self.assertLessEqual(max(written), 5 + max(track_rows))
+        expected = read_trajectories(expected_path).to_point_gdf()
+        actual = read_trajectories(path).to_point_gdf()
+        self.assertTrue((actual.index == expected.index).all())
+        self.assertEqual(expected['trackId'].tolist(), actual['trackId'].tolist())
+        self.assertTrue(actual.geometry.geom_equals(expected.geometry).all())
+        self.assertEqual(expected['comments'].fillna('').tolist(), actual['comments'].fillna('').tolist())
+        pd.testing.assert_series_equal(expected['tag.id'], actual['tag.id'], check_dtype=False)
+
+    def test_chunks_need_contiguous_tracks(self):
+        # prepare: the rows of the first track come back after the second one
+        directory = self.write_input([4, 4])
+        link = os.path.join(directory, 'link.csv')
+        data = pd.read_csv(link)
+        pd.concat([data.iloc[:2], data.iloc[4:], data.iloc[2:4]]).to_csv(link, index=False)
+        converter = InputConverter(engine='c', chunk_bytes=0, chunk_rows=3)
+
+        # execute / verify
+        with self.assertRaisesRegex(ValueError, 'track_0'):
+            converter.csv_to_pickle(directory, os.path.join(self.directory.name, 'chunked.parquet'))
+        self.assertFalse(os.path.exists(os.path.join(self.directory.name, 'chunked.parquet')))
+
+    def test_convert_all(self):
+        # prepare
+        jobs = [
+            (self.input, os.path.join(self.directory.name, 'first.pickle')),
+            (self.input, os.path.join(self.directory.name, 'second.parquet')),
+        ]
+
+        # execute
+        stats = convert_all(jobs, processes=2)
+
+        # verify
+        self.assertEqual([3169, 3169], [item['rows'] for item in stats])
+        self.assertEqual(['first.pickle', 'second.parquet'], sorted(os.listdir(self.directory.name)))
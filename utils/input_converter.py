@@ -1,47 +1,181 @@
+import importlib.util
+import logging
+import multiprocessing as mp
 import os
+import time
+import numpy as np
 import pandas as pd
 import movingpandas as mpd
+from sdk.moveapps_formats import PICKLE, TrajectoryWriter, detect_format, write_trajectories
 from tests.config.definitions import ROOT_DIR
 
+# files larger than this are converted in chunks of about `CHUNK_ROWS` rows (GeoParquet and Arrow outputs only)
+CHUNK_BYTES = 256 * 1024 ** 2
+CHUNK_ROWS = 500_000
+
+
+def default_engine() -> str:
+    """
+    :return: `pyarrow` (multi-threaded CSV parser) if installed, `c` (the pandas parser) otherwise
+    """
+    return 'pyarrow' if importlib.util.find_spec('pyarrow') is not None else 'c'
+
 
 class InputConverter:
+    """
+    Converts a Movebank export (`link.csv` with the locations and `meta.csv` with CRS and timezone) into a
+    TrajectoryCollection file (pickle, GeoParquet or Arrow, by file extension)
+    """
 
-    def csv_to_pickle(self, csv_path, result_file_name):
-        print(os.getcwd())
+    def __init__(self, engine: str | None = None, chunk_bytes: int = CHUNK_BYTES, chunk_rows: int = CHUNK_ROWS):
+        """
+        :param engine: CSV parser: `pyarrow` or `c`; the fastest one installed if not given.
+            Unlike `c`, `pyarrow` also parses the other ISO date columns (e.g. `timestamp.start`) as timestamps.
+        :param chunk_bytes: files larger than this are converted chunk by chunk into a GeoParquet or Arrow output,
+            with the `c` parser (see `convert_chunks`)
+        :param chunk_rows: number of rows per chunk
+        """
+        self.engine = engine or default_engine()
+        self.chunk_bytes = chunk_bytes
+        self.chunk_rows = chunk_rows
 
-        pandas = self.read_data_csv(file_path=f'{csv_path}/link.csv')
-        timezone = self.read_timezone(file_path=f'{csv_path}/meta.csv')
-        projection = self.read_projection(file_path=f'{csv_path}/meta.csv')
+    def csv_to_pickle(self, csv_path, result_file_name) -> dict:
+        """
+        :param csv_path: directory with `link.csv` and `meta.csv`
+        :param result_file_name: path of the result file
+        :return: statistics of the conversion: number of rows, seconds and rows per second
+        """
+        start = time.perf_counter()
+        meta = self.read_meta(file_path=f'{csv_path}/meta.csv')
+        link = f'{csv_path}/link.csv'
 
-        self.adjust_timestamps(data=pandas, timezone=timezone)
-        movingpandas = self.create_moving_pandas(data=pandas, projection=projection)
-        self.write_result(file_name=result_file_name, data=movingpandas)
+        chunked = os.path.getsize(link) > self.chunk_bytes
+        if chunked and detect_format(result_file_name) == PICKLE:
+            # a pickle can only be written from the whole collection
+            logging.info(f'{result_file_name} is a pickle, {link} is read at once')
+            chunked = False
+        if chunked:
+            rows = self.convert_chunks(file_path=link, meta=meta, result_file_name=result_file_name)
+            engine = 'c, chunked'
+        else:
+            data = self.read_data_csv(file_path=link)
+            self.adjust_timestamps(data=data, timezone=meta['tzone'])
+            movingpandas = self.create_moving_pandas(data=data, projection=meta['crs'])
+            self.write_result(file_name=result_file_name, data=movingpandas)
+            rows = len(data)
+            engine = self.engine
 
-    def read_data_csv(self, file_path):
-        csv = pd.read_csv(
-            file_path,
-            parse_dates=['timestamps'],
-        )
-        print(csv.info())
-        return csv
-
-    def read_timezone(self, file_path):
-        meta_csv = pd.read_csv(file_path)
-        tzone = meta_csv['tzone'][0]
-        return tzone
-
-    def read_projection(self, file_path):
-        meta_csv = pd.read_csv(file_path)
-        projection = meta_csv['crs'][0]
-        return projection
-
-    def adjust_timestamps(self, data, timezone):
-        data['timestamp_tz'] = data['timestamps'].apply(lambda x: x.tz_localize(timezone))
-        print('applied timezone', timezone)
-        print(data.head())
-
-    def create_moving_pandas(self, data, projection):
-        move = mpd.TrajectoryCollection(
+        seconds = time.perf_counter() - start
+        stats = {'input': csv_path, 'rows': rows, 'seconds': seconds, 'rows_per_second': rows / seconds}
+        logging.info(f'converted {csv_path}: {stats["rows"]} rows in {seconds:.2f} s '
+                     f'({stats["rows_per_second"]:.0f} rows/s, engine {engine})')
+        return stats
+
+    def read_data_csv(self, file_path) -> pd.DataFrame:
+        data = pd.read_csv(file_path, engine=self.engine)
+        self.parse_timestamps(data)
+        logging.info(f'read {file_path}: {len(data)} rows, {len(data.columns)} columns')
+        return data
+
+    def convert_chunks(self, file_path, meta: dict, result_file_name) -> int:
+        """
+        Converts the locations chunk by chunk: each chunk is parsed and localized on its own and its complete tracks
+        are appended to the output right away, so at most a chunk and the longest track are in memory at once.
+        The rows of each track must be contiguous in the file, like in Movebank exports.
+        :param file_path: path of `link.csv`
+        :param meta: see `read_meta`
+        :param result_file_name: path of the GeoParquet or Arrow result file
+        :return: number of rows read
+        :raise ValueError: if the rows of a track are not contiguous
+        """
+        dtypes = self.read_csv_dtypes(file_path)
+        rows = 0
+        written = set()
+        # the rows of the last track read so far, it may continue in the next chunk
+        pending = []
+
+        def write(writer: TrajectoryWriter, pieces: list):
+            data = pd.concat(pieces, ignore_index=True) if len(pieces) > 1 else pieces[0]
+            track_ids = set(data['trackId'].unique())
+            if not written.isdisjoint(track_ids):
+                raise ValueError(f'Converting in chunks needs the rows of {file_path} grouped by track, '
+                                 f'tracks {sorted(written & track_ids)} are split up')
+            written.update(track_ids)
+            writer.write(self.create_moving_pandas(data=data, projection=meta['crs']))
+
+        with TrajectoryWriter(result_file_name) as writer:
+            for chunk in pd.read_csv(file_path, chunksize=self.chunk_rows, dtype=dtypes):
+                rows += len(chunk)
+                self.parse_timestamps(chunk)
+                self.adjust_timestamps(data=chunk, timezone=meta['tzone'])
+                track_ids = chunk['trackId'].to_numpy()
+                changes = np.flatnonzero(track_ids[1:] != track_ids[:-1])
+                if len(changes) == 0 and pending and pending[-1]['trackId'].iloc[-1] == track_ids[0]:
+                    pending.append(chunk)
+                    continue
+                # the chunk completes the pending track, the rows after its last track change start a new one
+                last = changes[-1] + 1 if len(changes) else 0
+                if pending and pending[-1]['trackId'].iloc[-1] != track_ids[0]:
+                    write(writer, pending)
+                    pending = []
+                if last > 0:
+                    write(writer, pending + [chunk.iloc[:last]])
+                pending = [chunk.iloc[last:]]
+            if pending:
+                write(writer, pending)
+        logging.info(f'converted {file_path} in chunks of {self.chunk_rows} rows: {rows} rows, '
+                     f'{len(written)} tracks')
+        return rows
+
+    def read_csv_dtypes(self, file_path) -> dict:
+        """
+        Scans the file chunk by chunk for column types that fit every chunk: otherwise a column that is empty in
+        one chunk, or holds integers in one and decimals in another, changes its type from chunk to chunk
+        :return: the `dtype` argument of `pd.read_csv`
+        """
+        kinds = {}
+        nulls = set()
+        for chunk in pd.read_csv(file_path, chunksize=self.chunk_rows):
+            for column, values in chunk.items():
+                missing = values.isna()
+                if missing.any():
+                    nulls.add(column)
+                kinds.setdefault(column, set())
+                if not missing.all():
+                    kinds[column].add(values.dtype.kind)
+        dtypes = {}
+        for column, column_kinds in kinds.items():
+            if not column_kinds:
+                # empty in every chunk: the same type in every chunk
+                continue
+            if column_kinds <= {'i', 'f'}:
+                dtypes[column] = 'int64' if column_kinds == {'i'} and column not in nulls else 'float64'
+            elif column_kinds == {'b'}:
+                dtypes[column] = 'boolean' if column in nulls else 'bool'
+            else:
+                # a string column also where it is empty, unlike `object`
+                dtypes[column] = 'string'
+        return dtypes
+
+    @staticmethod
+    def parse_timestamps(data):
+        # parsed separately: the engines differ in which date formats they detect
+        data['timestamps'] = pd.to_datetime(data['timestamps'], format='ISO8601')
+
+    @staticmethod
+    def read_meta(file_path) -> dict:
+        """
+        :return: the first row of `meta.csv`, with the keys `crs` and `tzone`
+        """
+        return pd.read_csv(file_path, nrows=1).iloc[0].to_dict()
+
+    @staticmethod
+    def adjust_timestamps(data, timezone):
+        data['timestamp_tz'] = data['timestamps'].dt.tz_localize(timezone)
+
+    @staticmethod
+    def create_moving_pandas(data, projection):
+        return mpd.TrajectoryCollection(
             data,
             traj_id_col='trackId',
             crs=projection,
@@ -49,19 +183,50 @@ class InputConverter:
             x='location.long',
             y='location.lat'
         )
-        print(move)
-        return move
 
-    def write_result(self, file_name, data):
-        print(type(data))
-        pd.to_pickle(data, file_name)
+    @staticmethod
+    def write_result(file_name, data):
+        write_trajectories(data, file_name)
+
+
+def _convert(job: tuple) -> dict:
+    converter, csv_path, result_file_name = job
+    return converter.csv_to_pickle(csv_path=csv_path, result_file_name=result_file_name)
+
+
+def convert_all(jobs: list, converter: InputConverter | None = None, processes: int | None = None) -> list:
+    """
+    Converts several datasets concurrently, one per worker process
+    :param jobs: list of (csv_path, result_file_name) tuples
+    :param converter: the converter to use; the default converter if not given
+    :param processes: number of worker processes (default: one per dataset, at most one per CPU)
+    :return: the statistics of each conversion, in the order of completion
+    """
+    converter = converter or InputConverter()
+    tasks = [(converter, csv_path, result_file_name) for csv_path, result_file_name in jobs]
+    if not tasks:
+        return []
+    processes = processes or min(len(tasks), os.cpu_count() or 1)
+    start = time.perf_counter()
+    if processes == 1:
+        stats = [_convert(task) for task in tasks]
+    else:
+        with mp.Pool(processes) as pool:
+            stats = list(pool.imap_unordered(_convert, tasks))
+    seconds = time.perf_counter() - start
+    rows = sum(item['rows'] for item in stats)
+    logging.info(f'converted {len(stats)} datasets: {rows} rows in {seconds:.2f} s ({rows / seconds:.0f} rows/s)')
+    return stats
 
 
 if __name__ == '__main__':
-    converter = InputConverter()
-    for i in range(1,5):
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    pending = []
+    for i in range(1, 5):
         file = f'input{i}'
-        converter.csv_to_pickle(
-            csv_path=f'./resources/input/{file}',
-            result_file_name=f'{ROOT_DIR}/resources/samples/{file}.pickle'
-        )
+        csv_path = f'./resources/input/{file}'
+        if not os.path.exists(f'{csv_path}/link.csv'):
+            logging.warning(f'skipping {csv_path}: no link.csv')
+            continue
+        pending.append((csv_path, f'{ROOT_DIR}/resources/samples/{file}.pickle'))
+    convert_all(pending)